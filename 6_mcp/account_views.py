@@ -0,0 +1,56 @@
+import os
+from dotenv import load_dotenv
+from accounts import Account
+from database import read_recent_transactions
+from value_series import read_value_series
+
+load_dotenv(override=True)
+
+# Read-only projections of an account, for prompts and the MCP resources that serve them.
+# Each projection reads only what it needs with bounded queries, and nothing is recorded or saved,
+# so the size and cost of a view stay flat however long the account has been trading.
+
+PROJECTIONS = ("summary", "holdings", "transactions", "values")
+DEFAULT_PROJECTIONS = ("summary", "holdings", "transactions")
+REPORT_LAST_TRANSACTIONS = int(os.getenv("REPORT_LAST_TRANSACTIONS", "10"))
+REPORT_VALUE_POINTS = int(os.getenv("REPORT_VALUE_POINTS", "20"))
+
+
+def parse_projections(text: str) -> tuple[str, ...]:
+    """Projections from a comma separated list such as 'summary,holdings'"""
+    projections = tuple(part.strip().lower() for part in text.split(",") if part.strip())
+    unknown = [projection for projection in projections if projection not in PROJECTIONS]
+    if unknown or not projections:
+        raise ValueError(f"Unknown projection {', '.join(unknown) or text!r}; choose from {', '.join(PROJECTIONS)}")
+    return projections
+
+
+def account_view(
+    account: Account,
+    projections: tuple[str, ...] = DEFAULT_PROJECTIONS,
+    last_transactions: int = REPORT_LAST_TRANSACTIONS,
+    value_points: int = REPORT_VALUE_POINTS,
+    prices: dict[str, float] | None = None,
+) -> dict:
+    """
+    The selected projections of an account:
+    summary - balance, total portfolio value, total and realized profit/loss and number of transactions
+    holdings - shares held per symbol
+    transactions - the last few transactions
+    values - the portfolio value history, downsampled to a few points
+    """
+    view = {"name": account.name}
+    if "summary" in projections:
+        portfolio_value = account.calculate_portfolio_value(prices)
+        view["balance"] = account.balance
+        view["total_portfolio_value"] = portfolio_value
+        view["total_profit_loss"] = account.calculate_profit_loss(portfolio_value)
+        view["realized_profit_loss"] = account.realized_profit_loss
+        view["transaction_count"] = account.transaction_count
+    if "holdings" in projections:
+        view["holdings"] = account.holdings
+    if "transactions" in projections:
+        view["recent_transactions"] = read_recent_transactions(account.name, last_transactions)
+    if "values" in projections:
+        view["portfolio_value_time_series"] = read_value_series(account.name, value_points).as_pairs()
+    return view
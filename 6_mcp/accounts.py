@@ -1,9 +1,21 @@
-from pydantic import BaseModel
+from typing import Literal
+from pydantic import BaseModel, PrivateAttr
 import json
+import numpy as np
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+import clock
+import ledger
+from market import get_share_price, get_share_prices
+from database import (
+    write_account,
+    read_account,
+    write_account_fields,
+    execute_trades,
+    read_transactions,
+    write_portfolio_value,
+    read_portfolio_values,
+    write_log,
+)
 
 load_dotenv(override=True)
 
@@ -25,118 +37,269 @@ class Transaction(BaseModel):
         return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
 
 
+class Order(BaseModel):
+    action: Literal["buy", "sell"]
+    symbol: str
+    quantity: int
+    rationale: str
+
+
 class Account(BaseModel):
     name: str
     balance: float
     strategy: str
     holdings: dict[str, int]
-    transactions: list[Transaction]
-    portfolio_value_time_series: list[tuple[str, float]]
+    _transactions: list[Transaction] | None = PrivateAttr(default=None)
+    _portfolio_value_time_series: list[tuple[str, float]] | None = PrivateAttr(default=None)
+    _version: int | None = PrivateAttr(default=None)
+    _costs: dict[str, float] = PrivateAttr(default_factory=dict)
+    _realized_pnl: float = PrivateAttr(default=0.0)
+    _transaction_count: int = PrivateAttr(default=0)
+    _as_of: str | None = PrivateAttr(default=None)
 
     @classmethod
     def get(cls, name: str):
         fields = read_account(name.lower())
         if not fields:
-            fields = {
-                "name": name.lower(),
-                "balance": INITIAL_BALANCE,
-                "strategy": "",
-                "holdings": {},
-                "transactions": [],
-                "portfolio_value_time_series": []
-            }
-            write_account(name, fields)
-        return cls(**fields)
-    
-    
-    def save(self):
-        write_account(self.name.lower(), self.model_dump())
+            write_account(name, {"name": name.lower(), "balance": INITIAL_BALANCE, "strategy": "", "holdings": {}})
+            fields = read_account(name.lower())
+        account = cls(name=fields["name"], balance=fields["balance"], strategy=fields["strategy"], holdings=fields["holdings"])
+        account._load(fields)
+        return account
+
+    @classmethod
+    def as_of(cls, name: str, timestamp: str):
+        """
+        The account as it was at a "%Y-%m-%d %H:%M:%S" timestamp, rebuilt from the ledger; None if it didn't exist.
+        It's a read-only view of the past: its history is not loaded, and it can't be saved.
+        """
+        state = ledger.load_state(name.lower(), timestamp)
+        if state is None:
+            return None
+        holdings = {symbol: quantity for symbol, (quantity, _) in state["holdings"].items()}
+        account = cls(name=name.lower(), balance=state["balance"], strategy=state["strategy"], holdings=holdings)
+        account._load({
+            **state,
+            "holdings": holdings,
+            "costs": {symbol: cost for symbol, (_, cost) in state["holdings"].items()},
+            "version": None,
+        })
+        account._transactions = []
+        account._portfolio_value_time_series = []
+        account._as_of = timestamp
+        return account
+
+    def _check_current(self):
+        if self._as_of is not None:
+            raise ValueError(f"This is {self.name}'s account as of {self._as_of}, which can't be changed.")
+
+    def _load(self, fields: dict):
+        """ Take the stored state as read by read_account, including the running profit and loss totals. """
+        self.balance, self.holdings, self._version = fields["balance"], fields["holdings"], fields["version"]
+        self._costs = fields["costs"]
+        self._realized_pnl = fields["realized_pnl"]
+        self._transaction_count = fields["transaction_count"]
+
+    @property
+    def transaction_count(self) -> int:
+        return self._transaction_count
+
+    @property
+    def realized_profit_loss(self) -> float:
+        """ Profit or loss locked in by sales, against the average cost of the shares sold. """
+        return self._realized_pnl
+
+    @property
+    def cash_spent(self) -> float:
+        """ Net cash spent on trades: the cost of everything bought, less the proceeds of everything sold. """
+        return sum(self._costs.values()) - self._realized_pnl
+
+    @property
+    def transactions(self) -> list[Transaction]:
+        """ The full transaction history, loaded from the database on first access. """
+        if self._transactions is None:
+            self._transactions = [Transaction(**row) for row in read_transactions(self.name)]
+        return self._transactions
+
+    @property
+    def portfolio_value_time_series(self) -> list[tuple[str, float]]:
+        """ The portfolio value history, loaded from the database on first access. """
+        if self._portfolio_value_time_series is None:
+            self._portfolio_value_time_series = read_portfolio_values(self.name)
+        return self._portfolio_value_time_series
+
+    def save(self, event: tuple[str, dict] | None = None):
+        """ Save balance and strategy, failing with StaleAccountError if the account changed since it was read. """
+        self._check_current()
+        self._version = write_account_fields(self.name, self.balance, self.strategy, self._version, event)
 
     def reset(self, strategy: str):
+        self._check_current()
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
-        self.portfolio_value_time_series = []
-        self.save()
+        self._transactions = []
+        self._portfolio_value_time_series = []
+        self._costs, self._realized_pnl, self._transaction_count = {}, 0.0, 0
+        self._version = write_account(self.name, self.model_dump())
 
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
+        self._check_current()
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
         self.balance += amount
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
+        self.save(("deposit", {"amount": amount}))
 
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
+        self._check_current()
         if amount > self.balance:
             raise ValueError("Insufficient funds for withdrawal.")
         self.balance -= amount
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
+        self.save(("withdraw", {"amount": amount}))
 
-    def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+    def buy_shares(self, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
+        self._check_current()
         price = get_share_price(symbol)
-        buy_price = price * (1 + SPREAD)
-        total_cost = buy_price * quantity
-        
-        if total_cost > self.balance:
-            raise ValueError("Insufficient funds to buy shares.")
-        elif price==0:
+        if price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
-        
-        # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
+        buy_price = price * (1 + SPREAD)
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
-        
-        # Update balance
-        self.balance -= total_cost
-        self.save()
-        write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
-
-    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+        if not self._execute([transaction], idempotency_key)["replayed"]:
+            write_log(self.name, "account", f"Bought {quantity} of {symbol}")
+        return "Completed. Latest details:\n" + self._view()
+
+    def sell_shares(self, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> str:
         """ Sell shares of a stock if the user has enough shares. """
-        if self.holdings.get(symbol, 0) < quantity:
-            raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
-        
+        self._check_current()
         price = get_share_price(symbol)
         sell_price = price * (1 - SPREAD)
-        total_proceeds = sell_price * quantity
-        
-        # Update holdings
-        self.holdings[symbol] -= quantity
-        
-        # If shares are completely sold, remove from holdings
-        if self.holdings[symbol] == 0:
-            del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
         transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
+        if not self._execute([transaction], idempotency_key)["replayed"]:
+            write_log(self.name, "account", f"Sold {quantity} of {symbol}")
+        return "Completed. Latest details:\n" + self._view()
 
-        # Update balance
-        self.balance += total_proceeds
-        self.save()
-        write_log(self.name, "account", f"Sold {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+    def execute_orders(self, orders: list[Order], idempotency_key: str | None = None) -> str:
+        """
+        Execute several buy and sell orders together: every symbol is priced in one lookup, the orders are validated
+        against the combined cash and holdings, and either all of them are applied or none.
+        Returns a compact summary rather than the full report; a retry with the same idempotency key returns
+        the trades as they were originally filled, with replayed set. The portfolio value is recorded once
+        per cycle by record_portfolio_values, not here.
+        """
+        self._check_current()
+        if not orders:
+            raise ValueError("No orders to execute.")
+        prices = get_share_prices([order.symbol for order in orders] + list(self.holdings))
+        unrecognized = list(dict.fromkeys(order.symbol for order in orders if prices[order.symbol] == 0))
+        if unrecognized:
+            raise ValueError(f"Unrecognized symbol {', '.join(unrecognized)}")
+        timestamp = clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        transactions = []
+        for order in orders:
+            if order.quantity <= 0:
+                raise ValueError(f"Order quantity for {order.symbol} must be positive.")
+            if order.action == "buy":
+                price, quantity = prices[order.symbol] * (1 + SPREAD), order.quantity
+            else:
+                price, quantity = prices[order.symbol] * (1 - SPREAD), -order.quantity
+            transactions.append(
+                Transaction(symbol=order.symbol, quantity=quantity, price=price, timestamp=timestamp, rationale=order.rationale)
+            )
+        outcome = self._execute(transactions, idempotency_key)
+        if not outcome["replayed"]:
+            done = ", ".join(f"{'Bought' if t.quantity > 0 else 'Sold'} {abs(t.quantity)} of {t.symbol}" for t in transactions)
+            write_log(self.name, "account", f"Executed orders: {done}")
+        unpriced = [symbol for symbol in self.holdings if symbol not in prices]
+        if unpriced:
+            prices |= get_share_prices(unpriced)
+        portfolio_value = self.calculate_portfolio_value(prices)
+        return json.dumps({
+            "executed": [{**t, "price": round(t["price"], 4)} for t in outcome["executed"]],
+            "balance": self.balance,
+            "holdings": self.holdings,
+            "total_portfolio_value": portfolio_value,
+            "replayed": outcome["replayed"],
+        })
 
-    def calculate_portfolio_value(self):
-        """ Calculate the total value of the user's portfolio. """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
-        return total_value
+    def _view(self) -> str:
+        """ The compact view of the account returned after a trade, which records nothing and stays small as the account ages. """
+        from account_views import account_view  # account_views imports this module
+
+        return json.dumps(account_view(self))
+
+    def _execute(self, transactions: list[Transaction], idempotency_key: str | None) -> dict:
+        """
+        Apply trades atomically in the database, checked against the stored balance and holdings rather than this
+        possibly stale copy, then bring this copy up to date. Returns the outcome from execute_trades, whose
+        replayed flag is set if they were a retry of trades already applied.
+        """
+        self._check_current()
+        outcome = execute_trades(self.name, [transaction.model_dump() for transaction in transactions], idempotency_key)
+        unseen_writes = outcome["replayed"] or self._version is None or outcome["version"] != self._version + 1
+        if unseen_writes:
+            self._load(read_account(self.name))
+            self._transactions = None
+            self._portfolio_value_time_series = None
+        else:
+            self.balance = outcome["balance"]
+            for symbol, quantity in outcome["holdings"].items():
+                if quantity:
+                    self.holdings[symbol] = quantity
+                    self._costs[symbol] = outcome["costs"][symbol]
+                else:
+                    self.holdings.pop(symbol, None)
+                    self._costs.pop(symbol, None)
+            self._realized_pnl = outcome["realized_pnl"]
+            self._transaction_count = outcome["transaction_count"]
+            self._version = outcome["version"]
+            for transaction in transactions:
+                self._append_transaction(transaction)
+        return outcome
+
+    def _append_transaction(self, transaction: Transaction):
+        """ Keep the in-memory history in step with the database, without loading it if it hasn't been asked for. """
+        if self._transactions is not None:
+            self._transactions.append(transaction)
 
-    def calculate_profit_loss(self, portfolio_value: float):
-        """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+    def calculate_portfolio_value(self, prices: dict[str, float] | None = None):
+        """ Calculate the total value of the user's portfolio, optionally using prices already looked up. """
+        if not self.holdings:
+            return self.balance
+        symbols = list(self.holdings)
+        if prices is None:
+            prices = get_share_prices(symbols)
+        quantities = np.fromiter(self.holdings.values(), dtype=np.float64, count=len(symbols))
+        share_prices = np.fromiter((prices.get(symbol, 0.0) for symbol in symbols), dtype=np.float64, count=len(symbols))
+        return self.balance + float(quantities @ share_prices)
+
+    def calculate_profit_loss(self, portfolio_value: float | None = None):
+        """ Calculate profit or loss from the initial spend, from running totals rather than the transaction history. """
+        if portfolio_value is None:
+            portfolio_value = self.calculate_portfolio_value()
+        return portfolio_value - self.cash_spent - self.balance
+
+    def get_positions(self, prices: dict[str, float] | None = None) -> dict[str, dict]:
+        """ Each holding with its average cost, current price and unrealized profit or loss. """
+        if prices is None:
+            prices = get_share_prices(list(self.holdings))
+        positions = {}
+        for symbol, quantity in self.holdings.items():
+            cost = self._costs.get(symbol, 0.0)
+            price = prices.get(symbol, 0.0)
+            positions[symbol] = {
+                "quantity": quantity,
+                "average_cost": cost / quantity,
+                "price": price,
+                "unrealized_profit_loss": quantity * price - cost,
+            }
+        return positions
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -150,13 +313,24 @@ class Account(BaseModel):
         """ List all transactions made by the user. """
         return [transaction.model_dump() for transaction in self.transactions]
     
-    def report(self) -> str:
+    def _record_portfolio_value(self, portfolio_value: float):
+        if self._as_of is not None:
+            return  # a past view reports its value but doesn't add to the live history
+        now = clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        version = write_portfolio_value(self.name, now, portfolio_value)
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+        if self._portfolio_value_time_series is not None:
+            self._portfolio_value_time_series.append((now, portfolio_value))
+
+    def report(self, prices: dict[str, float] | None = None) -> str:
         """ Return a json string representing the account.  """
-        portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
+        portfolio_value = self.calculate_portfolio_value(prices)
+        self._record_portfolio_value(portfolio_value)
         pnl = self.calculate_profit_loss(portfolio_value)
         data = self.model_dump()
+        data["transactions"] = self.list_transactions()
+        data["portfolio_value_time_series"] = self.portfolio_value_time_series
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
         write_log(self.name, "account", f"Retrieved account details")
@@ -169,11 +343,26 @@ class Account(BaseModel):
     
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
+        self._check_current()
         self.strategy = strategy
-        self.save()
+        self.save(("strategy", {"strategy": strategy}))
         write_log(self.name, "account", f"Changed strategy")
         return "Changed strategy"
 
+def value_portfolios(accounts: list[Account]) -> list[float]:
+    """ Value many accounts with a single price lookup covering all of their holdings. """
+    prices = get_share_prices([symbol for account in accounts for symbol in account.holdings])
+    return [account.calculate_portfolio_value(prices) for account in accounts]
+
+def record_portfolio_values(names: list[str]) -> list[float]:
+    """ Add a point to the value history of each account, with a single price lookup; called once per trading cycle. """
+    accounts = [Account.get(name) for name in names]
+    values = value_portfolios(accounts)
+    for account, value in zip(accounts, values):
+        account._record_portfolio_value(value)
+    return values
+
+
 # Example of usage:
 if __name__ == "__main__":
     account = Account("John Doe")
@@ -1,39 +1,131 @@
+import asyncio
 import mcp
 from mcp.client.stdio import stdio_client
 from mcp import StdioServerParameters
 from agents import FunctionTool
+from mcp_transport import MCP_TRANSPORT, is_network_transport, server_url
 import json
 
 params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
 
 
+def open_transport(server_params: StdioServerParameters):
+    """Connect to the shared accounts server when running over the network, otherwise launch one over stdio"""
+    if not is_network_transport:
+        return stdio_client(server_params)
+    if MCP_TRANSPORT == "streamable-http":
+        from mcp.client.streamable_http import streamablehttp_client
+
+        return streamablehttp_client(server_url("accounts_server"))
+    from mcp.client.sse import sse_client
+
+    return sse_client(server_url("accounts_server"))
+
+
+class AccountsClient:
+    """
+    One long-lived session with the accounts server, instead of a server process per request.
+    Requests can be issued concurrently and are pipelined over the same session.
+    If the server goes away, the session is re-established. Reads are then retried once, and so are tool calls
+    that carry an idempotency_key; any other tool call fails instead, since the server may have applied it
+    before going away, and sending it again could trade twice.
+    The session lives in its own task, because the stdio transport is tied to the task that opened it.
+    """
+
+    def __init__(self, server_params: StdioServerParameters = params):
+        self.server_params = server_params
+        self.session = None
+        self.connects = 0
+        self._task = None
+        self._stop = None
+        self._lock = asyncio.Lock()
+
+    async def _serve(self, ready: asyncio.Future, stop: asyncio.Event) -> None:
+        try:
+            async with open_transport(self.server_params) as streams:
+                async with mcp.ClientSession(*streams[:2]) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self.session = None
+
+    async def connect(self) -> mcp.ClientSession:
+        async with self._lock:
+            if self.session is None or self._task is None or self._task.done():
+                ready = asyncio.get_running_loop().create_future()
+                self._stop = asyncio.Event()
+                self._task = asyncio.create_task(self._serve(ready, self._stop))
+                self.session = await ready
+                self.connects += 1
+            return self.session
+
+    async def _request(self, send, retry: bool = True):
+        session = await self.connect()
+        try:
+            return await send(session)
+        except Exception:
+            if not retry or (self._task is not None and not self._task.done() and self.session is session):
+                raise
+            session = await self.connect()
+            return await send(session)
+
+    async def list_tools(self):
+        result = await self._request(lambda session: session.list_tools())
+        return result.tools
+
+    async def call_tool(self, tool_name, tool_args):
+        retry = bool((tool_args or {}).get("idempotency_key"))
+        return await self._request(lambda session: session.call_tool(tool_name, tool_args), retry)
+
+    async def read_resource(self, uri: str) -> str:
+        result = await self._request(lambda session: session.read_resource(uri))
+        return result.contents[0].text
+
+    async def read_account_and_strategy(self, name: str) -> tuple[str, str]:
+        """Fetch the compact account report and the strategy together, as two pipelined requests"""
+        return await asyncio.gather(
+            self.read_resource(f"accounts://report/{name}"),
+            self.read_resource(f"accounts://strategy/{name}"),
+        )
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+
+_clients: dict[asyncio.AbstractEventLoop, AccountsClient] = {}
+
+
+def get_accounts_client() -> AccountsClient:
+    """The shared client for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    for other in [other for other in _clients if other.is_closed()]:
+        del _clients[other]
+    if loop not in _clients:
+        _clients[loop] = AccountsClient()
+    return _clients[loop]
+
+
 async def list_accounts_tools():
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+    return await get_accounts_client().list_tools()
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
+    return await get_accounts_client().call_tool(tool_name, tool_args)
+
 async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
+    return await get_accounts_client().read_resource(f"accounts://accounts_server/{name}")
+
 async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    return await get_accounts_client().read_resource(f"accounts://strategy/{name}")
+
+async def read_account_and_strategy(name):
+    return await get_accounts_client().read_account_and_strategy(name)
 
 async def get_accounts_tools_openai():
     openai_tools = []
@@ -44,7 +136,7 @@ async def get_accounts_tools_openai():
             description=tool.description,
             params_json_schema=schema,
             on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+
         )
         openai_tools.append(openai_tool)
-    return openai_tools
\ No newline at end of file
+    return openai_tools
@@ -1,7 +1,35 @@
+import asyncio
+import json
+from collections import defaultdict
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+from accounts import Account, Order
+from account_views import account_view, parse_projections
+from database import StaleAccountError, write_log
+from mcp_transport import MCP_TRANSPORT, server_settings
+
+mcp = FastMCP("accounts_server", **server_settings("accounts_server"))
+
+# One server process can serve many traders at once over a network transport, so account work runs
+# in worker threads to keep the event loop free, and is serialized per account.
+# Other processes may write the same account; trades are atomic in the database, and other writes
+# that lose an optimistic version check are retried against a fresh copy of the account.
+account_locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+STALE_RETRIES = 3
+
+
+def run_action(name: str, action):
+    for attempt in range(STALE_RETRIES):
+        try:
+            return action(Account.get(name))
+        except StaleAccountError:
+            if attempt == STALE_RETRIES - 1:
+                raise
+
+
+async def with_account(name: str, action):
+    async with account_locks[name.lower()]:
+        return await asyncio.to_thread(run_action, name, action)
 
-mcp = FastMCP("accounts_server")
 
 @mcp.tool()
 async def get_balance(name: str) -> float:
@@ -10,7 +38,7 @@ async def get_balance(name: str) -> float:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).balance
+    return await with_account(name, lambda account: account.balance)
 
 @mcp.tool()
 async def get_holdings(name: str) -> dict[str, int]:
@@ -19,10 +47,10 @@ async def get_holdings(name: str) -> dict[str, int]:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).holdings
+    return await with_account(name, lambda account: account.holdings)
 
 @mcp.tool()
-async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
+async def buy_shares(name: str, symbol: str, quantity: int, rationale: str, idempotency_key: str = "") -> str:
     """Buy shares of a stock.
 
     Args:
@@ -30,12 +58,13 @@ async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> f
         symbol: The symbol of the stock
         quantity: The quantity of shares to buy
         rationale: The rationale for the purchase and fit with the account's strategy
+        idempotency_key: Optional unique key for this order; retrying with the same key never buys twice
     """
-    return Account.get(name).buy_shares(symbol, quantity, rationale)
+    return await with_account(name, lambda account: account.buy_shares(symbol, quantity, rationale, idempotency_key or None))
 
 
 @mcp.tool()
-async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
+async def sell_shares(name: str, symbol: str, quantity: int, rationale: str, idempotency_key: str = "") -> str:
     """Sell shares of a stock.
 
     Args:
@@ -43,8 +72,22 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
         symbol: The symbol of the stock
         quantity: The quantity of shares to sell
         rationale: The rationale for the sale and fit with the account's strategy
+        idempotency_key: Optional unique key for this order; retrying with the same key never sells twice
     """
-    return Account.get(name).sell_shares(symbol, quantity, rationale)
+    return await with_account(name, lambda account: account.sell_shares(symbol, quantity, rationale, idempotency_key or None))
+
+@mcp.tool()
+async def execute_orders(name: str, orders: list[Order], idempotency_key: str = "") -> str:
+    """Buy and sell several stocks in one go, which is better than separate calls when rebalancing.
+    The orders are priced together and either all of them are executed or, if the cash or shares
+    are not enough for all of them, none is. Returns a short summary of the trades and the account.
+
+    Args:
+        name: The name of the account holder
+        orders: The orders, each with an action ("buy" or "sell"), symbol, quantity and rationale
+        idempotency_key: Optional unique key for this batch; retrying with the same key never trades twice
+    """
+    return await with_account(name, lambda account: account.execute_orders(orders, idempotency_key or None))
 
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
@@ -54,17 +97,31 @@ async def change_strategy(name: str, strategy: str) -> str:
         name: The name of the account holder
         strategy: The new strategy for the account
     """
-    return Account.get(name).change_strategy(strategy)
+    return await with_account(name, lambda account: account.change_strategy(strategy))
 
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.report()
+    return await with_account(name.lower(), lambda account: account.report())
+
+def view_json(account: Account, projections: tuple[str, ...] | None = None) -> str:
+    view = account_view(account, projections) if projections else account_view(account)
+    write_log(account.name, "account", "Retrieved account report")
+    return json.dumps(view)
+
+@mcp.resource("accounts://report/{name}")
+async def read_report_resource(name: str) -> str:
+    """A compact report of the account: summary, holdings and recent transactions"""
+    return await with_account(name.lower(), view_json)
+
+@mcp.resource("accounts://report/{name}/{projections}")
+async def read_report_projections_resource(name: str, projections: str) -> str:
+    """The chosen projections of the account, comma separated: summary, holdings, transactions, values"""
+    selected = parse_projections(projections)
+    return await with_account(name.lower(), lambda account: view_json(account, selected))
 
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.get_strategy()
+    return await with_account(name.lower(), lambda account: account.get_strategy())
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    mcp.run(transport=MCP_TRANSPORT)
\ No newline at end of file
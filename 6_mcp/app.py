@@ -1,10 +1,18 @@
 import gradio as gr
+import asyncio
+import threading
+import time
+from collections import deque
 from util import css, js, Color
 import pandas as pd
 from trading_floor import names, lastnames, short_model_names
 import plotly.express as px
 from accounts import Account
-from database import read_log
+from market import get_share_prices
+from database import read_log_since, read_recent_transactions
+from value_series import read_value_series
+from span_stats import trader_latencies
+from events import bus, account_topic, logs_topic, ChangeWatcher
 
 mapper = {
     "trace": Color.WHITE,
@@ -15,6 +23,13 @@ mapper = {
     "account": Color.RED,
 }
 
+LOG_LINES = 13
+# The transactions table shows only the most recent trades, so redrawing it doesn't read the whole history
+TRANSACTION_ROWS = 50
+# The latency table is recomputed from the span store at most this often, as new logs arrive
+LATENCY_REFRESH_SECONDS = 30
+LATENCY_COLUMNS = ["By", "Name", "Calls", "p50 s", "p95 s", "Total s"]
+
 
 class Trader:
     def __init__(self, name: str, lastname: str, model_name: str):
@@ -22,10 +37,46 @@ class Trader:
         self.lastname = lastname
         self.model_name = model_name
         self.account = Account.get(name)
+        self.log_lines = deque(maxlen=LOG_LINES)
+        self.last_log_id = 0
+        self.log_html = self.render_logs()
+        self.log_lock = threading.Lock()
+        self.account_view = None
+        self.account_lock = threading.Lock()
+        self.account_topic = f"view:{account_topic(name)}"
+        self.logs_topic = f"view:{logs_topic(name)}"
+        self.latency_df = None
+        self.latency_at = 0.0
+        bus.subscribe(account_topic(name), self.on_account_change)
+        bus.subscribe(logs_topic(name), self.on_logs_change)
+        self.fetch_new_logs()
 
     def reload(self):
         self.account = Account.get(self.name)
 
+    def on_account_change(self, _topic):
+        """Reload and re-render once per change, however many browsers are watching"""
+        with self.account_lock:
+            self.reload()
+            self.account_view = None
+            self.get_account_view()
+        bus.publish(self.account_topic)
+
+    def on_logs_change(self, _topic):
+        self.fetch_new_logs()
+        bus.publish(self.logs_topic)
+
+    def get_account_view(self, prices: dict[str, float] | None = None) -> tuple:
+        """The rendered account components, cached until the account next changes"""
+        if self.account_view is None:
+            self.account_view = (
+                self.get_portfolio_value(prices),
+                self.get_portfolio_value_chart(),
+                self.get_holdings_df(),
+                self.get_transactions_df(),
+            )
+        return self.account_view
+
     def get_title(self) -> str:
         return f"<div style='text-align: center;font-size:34px;'>{self.name}<span style='color:#ccc;font-size:24px;'> ({self.model_name}) - {self.lastname}</span></div>"
 
@@ -33,9 +84,9 @@ class Trader:
         return self.account.get_strategy()
 
     def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
-        df["datetime"] = pd.to_datetime(df["datetime"])
-        return df
+        """A bounded number of points however long the history, from the columnar value series"""
+        series = read_value_series(self.name)
+        return pd.DataFrame({"datetime": pd.to_datetime(series.times, unit="s"), "value": series.values})
 
     def get_portfolio_value_chart(self):
         df = self.get_portfolio_value_df()
@@ -65,32 +116,51 @@ class Trader:
         return df
 
     def get_transactions_df(self) -> pd.DataFrame:
-        """Convert transactions to DataFrame for display"""
-        transactions = self.account.list_transactions()
+        """Convert the most recent transactions to DataFrame for display"""
+        transactions = read_recent_transactions(self.name, TRANSACTION_ROWS)
         if not transactions:
             return pd.DataFrame(columns=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"])
 
         return pd.DataFrame(transactions)
 
-    def get_portfolio_value(self) -> str:
+    def get_portfolio_value(self, prices: dict[str, float] | None = None) -> str:
         """Calculate total portfolio value based on current prices"""
-        portfolio_value = self.account.calculate_portfolio_value() or 0.0
+        portfolio_value = self.account.calculate_portfolio_value(prices) or 0.0
         pnl = self.account.calculate_profit_loss(portfolio_value) or 0.0
         color = "green" if pnl >= 0 else "red"
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
-    def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
-        for log in logs:
-            timestamp, type, message = log
-            color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
+    def get_latency_df(self) -> pd.DataFrame:
+        """p50/p95 latency per tool, MCP server and model from the span store, refreshed every so often"""
+        if self.latency_df is None or time.monotonic() - self.latency_at > LATENCY_REFRESH_SECONDS:
+            rows = trader_latencies(self.name)
+            self.latency_df = pd.DataFrame(
+                [
+                    [row["by"], row["key"], row["calls"], row["p50_seconds"], row["p95_seconds"], row["total_seconds"]]
+                    for row in rows
+                ],
+                columns=LATENCY_COLUMNS,
+            )
+            self.latency_at = time.monotonic()
+        return self.latency_df
+
+    def render_logs(self) -> str:
+        return f"<div style='height:250px; overflow-y:auto;'>{''.join(self.log_lines)}</div>"
+
+    def fetch_new_logs(self) -> None:
+        """Tail the log: only rows written since the last one seen are read and rendered"""
+        with self.log_lock:
+            logs = read_log_since(self.name, self.last_log_id, limit=LOG_LINES)
+            if not logs:
+                return
+            for log in logs:
+                _, timestamp, type, message = log
+                color = mapper.get(type, Color.WHITE).value
+                self.log_lines.append(f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>")
+            self.last_log_id = logs[-1][0]
+            self.log_html = self.render_logs()
+
 
 
 class TraderView:
@@ -100,21 +170,22 @@ class TraderView:
         self.chart = None
         self.holdings_table = None
         self.transactions_table = None
+        self.latency_table = None
 
     def make_ui(self):
         with gr.Column():
             gr.HTML(self.trader.get_title())
             with gr.Row():
-                self.portfolio_value = gr.HTML(self.trader.get_portfolio_value)
+                self.portfolio_value = gr.HTML(lambda: self.trader.get_account_view()[0])
             with gr.Row():
                 self.chart = gr.Plot(
-                    self.trader.get_portfolio_value_chart, container=True, show_label=False
+                    lambda: self.trader.get_account_view()[1], container=True, show_label=False
                 )
             with gr.Row(variant="panel"):
-                self.log = gr.HTML(self.trader.get_logs)
+                self.log = gr.HTML(lambda: self.trader.log_html)
             with gr.Row():
                 self.holdings_table = gr.Dataframe(
-                    value=self.trader.get_holdings_df,
+                    value=lambda: self.trader.get_account_view()[2],
                     label="Holdings",
                     headers=["Symbol", "Quantity"],
                     row_count=(5, "dynamic"),
@@ -124,7 +195,7 @@ class TraderView:
                 )
             with gr.Row():
                 self.transactions_table = gr.Dataframe(
-                    value=self.trader.get_transactions_df,
+                    value=lambda: self.trader.get_account_view()[3],
                     label="Recent Transactions",
                     headers=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"],
                     row_count=(5, "dynamic"),
@@ -132,37 +203,55 @@ class TraderView:
                     max_height=300,
                     elem_classes=["dataframe-fix"],
                 )
+            with gr.Row():
+                self.latency_table = gr.Dataframe(
+                    value=lambda: self.trader.get_latency_df(),
+                    label="Latency by Tool, MCP Server and Model",
+                    headers=LATENCY_COLUMNS,
+                    row_count=(5, "dynamic"),
+                    col_count=len(LATENCY_COLUMNS),
+                    max_height=300,
+                    elem_classes=["dataframe-fix-small"],
+                )
 
-        timer = gr.Timer(value=120)
-        timer.tick(
-            fn=self.refresh,
-            inputs=[],
-            outputs=[
-                self.portfolio_value,
-                self.chart,
-                self.holdings_table,
-                self.transactions_table,
-            ],
-            show_progress="hidden",
-            queue=False,
-        )
-        log_timer = gr.Timer(value=0.5)
-        log_timer.tick(
-            fn=self.trader.get_logs,
-            inputs=[self.log],
-            outputs=[self.log],
-            show_progress="hidden",
-            queue=False,
-        )
+    def outputs(self) -> list:
+        return [
+            self.portfolio_value,
+            self.chart,
+            self.holdings_table,
+            self.transactions_table,
+            self.log,
+            self.latency_table,
+        ]
 
-    def refresh(self):
-        self.trader.reload()
-        return (
-            self.trader.get_portfolio_value(),
-            self.trader.get_portfolio_value_chart(),
-            self.trader.get_holdings_df(),
-            self.trader.get_transactions_df(),
-        )
+    async def stream(self):
+        """
+        Push updates to one browser session as changes are published, rather than polling.
+        Each component is only sent when its part of the trader has changed since the last push.
+        """
+        account_version = bus.version(self.trader.account_topic)
+        logs_version = bus.version(self.trader.logs_topic)
+        while True:
+            waits = [
+                asyncio.create_task(bus.wait(self.trader.account_topic, account_version)),
+                asyncio.create_task(bus.wait(self.trader.logs_topic, logs_version)),
+            ]
+            try:
+                await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for wait in waits:
+                    wait.cancel()
+            account_update = [gr.update()] * 4
+            log_update = gr.update()
+            latency_update = gr.update()
+            if bus.version(self.trader.account_topic) != account_version:
+                account_version = bus.version(self.trader.account_topic)
+                account_update = list(self.trader.get_account_view())
+            if bus.version(self.trader.logs_topic) != logs_version:
+                logs_version = bus.version(self.trader.logs_topic)
+                log_update = self.trader.log_html
+                latency_update = self.trader.get_latency_df()
+            yield *account_update, log_update, latency_update
 
 
 # Main UI construction
@@ -174,6 +263,9 @@ def create_ui():
         for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)
     ]
     trader_views = [TraderView(trader) for trader in traders]
+    prices = get_share_prices([symbol for trader in traders for symbol in trader.account.holdings])
+    for trader in traders:
+        trader.get_account_view(prices)
 
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
@@ -181,7 +273,16 @@ def create_ui():
         with gr.Row():
             for trader_view in trader_views:
                 trader_view.make_ui()
+        for trader_view in trader_views:
+            ui.load(
+                fn=trader_view.stream,
+                inputs=[],
+                outputs=trader_view.outputs(),
+                show_progress="hidden",
+                concurrency_limit=None,
+            )
 
+    ChangeWatcher(names).start()
     return ui
 
 
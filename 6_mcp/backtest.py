@@ -0,0 +1,393 @@
+"""
+Offline backtests of the trading floor, driven by recorded market data.
+
+Prices come from stored daily or minute bars, and the clock steps through the bar times. At each tick every
+Trader runs its agent as it would live: the prompts are built from the account report and strategy, and the
+agent loop calls the accounts server's tools, but the LLM is a stub model (see backtest_agents.py) whose
+decisions come from a deterministic policy or from recorded decisions. The accounts tools run in-process
+against a separate accounts database, so nothing touches the network or accounts.db.
+With --direct, the policies place their orders through Account.execute_orders without the agent loop,
+to measure the accounts engine on its own.
+
+Run with:
+  uv run backtest.py generate bars.db --symbols 20 --days 250
+  uv run backtest.py run bars.db --traders Warren:momentum George:rebalance Ray:random Cathie:hold
+  uv run backtest.py export accounts.db decisions.jsonl
+  uv run backtest.py run bars.db --recorded decisions.jsonl
+  uv run backtest.py run bars.db --direct
+
+Bars are read from a SQLite table bars(symbol, time, close), with time in seconds since the epoch,
+or from a Parquet or CSV file with the same columns (time may also be a datetime).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+BACKTEST_DB = "backtest.db"
+MOMENTUM_LOOKBACK = 20
+
+
+class Bars:
+    """Recorded closes per symbol in sorted numpy arrays, so the price at any simulated time is a binary search"""
+
+    def __init__(self, series: dict[str, tuple[np.ndarray, np.ndarray]]):
+        self.series = series
+        self.symbols = sorted(series)
+
+    @classmethod
+    def load(cls, path: str) -> "Bars":
+        if path.endswith((".parquet", ".csv")):
+            import pandas as pd
+
+            frame = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+            if not np.issubdtype(frame["time"].dtype, np.number):
+                frame["time"] = pd.to_datetime(frame["time"], utc=True).astype("int64") // 1_000_000_000
+            frame = frame.sort_values(["symbol", "time"])
+            rows = frame[["symbol", "time", "close"]].itertuples(index=False)
+        else:
+            with sqlite3.connect(path) as conn:
+                rows = conn.execute("SELECT symbol, time, close FROM bars ORDER BY symbol, time").fetchall()
+        grouped = defaultdict(lambda: ([], []))
+        for symbol, when, close in rows:
+            grouped[symbol][0].append(when)
+            grouped[symbol][1].append(close)
+        return cls({
+            symbol: (np.asarray(times, dtype=np.int64), np.asarray(closes, dtype=np.float64))
+            for symbol, (times, closes) in grouped.items()
+        })
+
+    def times(self) -> np.ndarray:
+        return np.unique(np.concatenate([times for times, _ in self.series.values()]))
+
+    def history(self, symbol: str, when: int, n: int) -> np.ndarray:
+        """The last n closes of a symbol at or before the given time"""
+        if symbol not in self.series:
+            return np.empty(0)
+        times, closes = self.series[symbol]
+        end = int(np.searchsorted(times, when, side="right"))
+        return closes[max(0, end - n) : end]
+
+    def prices(self, symbols: list[str], when: int) -> dict[str, float]:
+        """The latest close at or before the given time, or 0.0 for a symbol without one, like the live market"""
+        prices = {}
+        for symbol in symbols:
+            closes = self.history(symbol, when, 1)
+            prices[symbol] = float(closes[0]) if len(closes) else 0.0
+        return prices
+
+
+# Stub policies stand in for the LLM: each turns the account and the market at a moment into orders
+
+def momentum(account, bars: Bars, when: int, rng: random.Random) -> list[dict]:
+    """Sell holdings that have fallen over the lookback, and put a tenth of the cash into the strongest riser"""
+    orders = []
+    returns = {}
+    for symbol in bars.symbols:
+        closes = bars.history(symbol, when, MOMENTUM_LOOKBACK)
+        if len(closes) == MOMENTUM_LOOKBACK:
+            returns[symbol] = closes[-1] / closes[0] - 1
+    for symbol, quantity in account.holdings.items():
+        if returns.get(symbol, 0.0) < 0:
+            orders.append({"action": "sell", "symbol": symbol, "quantity": quantity, "rationale": "momentum faded"})
+    if returns:
+        best = max(returns, key=returns.get)
+        price = bars.history(best, when, 1)[0]
+        quantity = int(account.balance * 0.1 / (price * 1.01))
+        if returns[best] > 0 and quantity > 0 and best not in account.holdings:
+            orders.append({"action": "buy", "symbol": best, "quantity": quantity, "rationale": "strongest momentum"})
+    return orders
+
+
+def rebalance(account, bars: Bars, when: int, rng: random.Random) -> list[dict]:
+    """Hold every symbol in equal value, trading only when a position is more than 5% off its target"""
+    prices = bars.prices(bars.symbols, when)
+    symbols = [symbol for symbol in bars.symbols if prices[symbol] > 0]
+    if not symbols:
+        return []
+    total = account.calculate_portfolio_value(prices)
+    target = total * 0.98 / len(symbols)
+    sells, buys = [], []
+    for symbol in symbols:
+        difference = int((target - account.holdings.get(symbol, 0) * prices[symbol]) / prices[symbol])
+        if abs(difference * prices[symbol]) < target * 0.05:
+            continue
+        if difference < 0:
+            sells.append({"action": "sell", "symbol": symbol, "quantity": -difference, "rationale": "rebalance"})
+        else:
+            buys.append({"action": "buy", "symbol": symbol, "quantity": difference, "rationale": "rebalance"})
+    return sells + buys
+
+
+def random_orders(account, bars: Bars, when: int, rng: random.Random) -> list[dict]:
+    """A seeded coin toss per tick: sell part of a random holding or buy a little of a random symbol"""
+    if account.holdings and rng.random() < 0.4:
+        symbol = rng.choice(sorted(account.holdings))
+        quantity = rng.randint(1, account.holdings[symbol])
+        return [{"action": "sell", "symbol": symbol, "quantity": quantity, "rationale": "random"}]
+    symbol = rng.choice(bars.symbols)
+    price = bars.prices([symbol], when)[symbol]
+    if price <= 0:
+        return []
+    quantity = int(account.balance * rng.uniform(0.01, 0.1) / (price * 1.01))
+    return [{"action": "buy", "symbol": symbol, "quantity": quantity, "rationale": "random"}] if quantity else []
+
+
+def hold(account, bars: Bars, when: int, rng: random.Random) -> list[dict]:
+    """Buy an equal amount of every symbol on the first tick, then never trade again"""
+    if account.holdings or account.transaction_count:
+        return []
+    prices = bars.prices(bars.symbols, when)
+    symbols = [symbol for symbol in bars.symbols if prices[symbol] > 0]
+    budget = account.balance * 0.98 / max(len(symbols), 1)
+    orders = []
+    for symbol in symbols:
+        quantity = int(budget / (prices[symbol] * 1.01))
+        if quantity:
+            orders.append({"action": "buy", "symbol": symbol, "quantity": quantity, "rationale": "buy and hold"})
+    return orders
+
+
+POLICIES = {"momentum": momentum, "rebalance": rebalance, "random": random_orders, "hold": hold}
+
+
+class StubTrader:
+    """The decisions of a trader from a stub policy, in place of the LLM"""
+
+    def __init__(self, name: str, policy: str, seed: int = 0):
+        self.name = name
+        self.strategy = policy
+        self.policy = POLICIES[policy]
+        self.rng = random.Random(f"{seed}:{name}")
+
+    def decide(self, account, bars: Bars, when: int) -> list[dict]:
+        return self.policy(account, bars, when, self.rng)
+
+
+class RecordedTrader:
+    """A trader that replays recorded decisions, each made at or before the tick it is replayed on"""
+
+    def __init__(self, name: str, decisions: list[dict]):
+        self.name = name
+        self.strategy = "recorded"
+        self.decisions = sorted(decisions, key=lambda decision: decision["time"])
+        self.next = 0
+
+    def decide(self, account, bars: Bars, when: int) -> list[dict]:
+        orders = []
+        while self.next < len(self.decisions) and self.decisions[self.next]["time"] <= when:
+            orders += self.decisions[self.next]["orders"]
+            self.next += 1
+        return orders
+
+
+def load_recorded_traders(path: str) -> list[RecordedTrader]:
+    """Recorded decisions from a JSON lines file of {"time", "name", "orders"}, one trader per name"""
+    decisions = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                decision = json.loads(line)
+                decisions[decision["name"]].append(decision)
+    return [RecordedTrader(name, entries) for name, entries in decisions.items()]
+
+
+def _timestamp(when: str) -> int:
+    return int(datetime.strptime(when, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+
+
+def export_decisions(accounts_db: str, out: str) -> int:
+    """Turn the trades in an accounts database's ledger into recorded decisions; returns how many were written"""
+    with sqlite3.connect(f"file:{accounts_db}?mode=ro", uri=True) as conn:
+        rows = conn.execute(
+            "SELECT name, timestamp, data FROM ledger WHERE type IN ('buy', 'sell') ORDER BY id"
+        ).fetchall()
+    decisions = {}
+    for name, timestamp, data in rows:
+        data = json.loads(data)
+        action = "buy" if data["quantity"] > 0 else "sell"
+        order = {"action": action, "symbol": data["symbol"], "quantity": abs(data["quantity"]), "rationale": data["rationale"]}
+        decisions.setdefault((name, timestamp), []).append(order)
+    with open(out, "w") as f:
+        for (name, timestamp), orders in decisions.items():
+            f.write(json.dumps({"time": _timestamp(timestamp), "name": name, "orders": orders}) + "\n")
+    return len(decisions)
+
+
+def generate_bars(path: str, symbols: int, days: int, minutes: bool, seed: int) -> int:
+    """Write random-walk bars for weekdays from the start of 2024: one close a day, or one a minute in market hours"""
+    rng = np.random.default_rng(seed)
+    names = [f"SYM{i:02d}" for i in range(symbols)]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    days_list = [start + timedelta(days=i) for i in range(days * 7 // 5 + 7)]
+    days_list = [day for day in days_list if day.weekday() < 5][:days]
+    if minutes:
+        times = [int((day + timedelta(hours=14, minutes=30 + m)).timestamp()) for day in days_list for m in range(390)]
+        volatility = 0.02 / math.sqrt(390)
+    else:
+        times = [int((day + timedelta(hours=21)).timestamp()) for day in days_list]
+        volatility = 0.02
+    drift = rng.normal(0.0003, 0.0005, symbols) * (volatility / 0.02) ** 2
+    steps = rng.normal(drift, volatility, (len(times), symbols))
+    closes = rng.uniform(20, 300, symbols) * np.exp(np.cumsum(steps, axis=0))
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE IF EXISTS bars")
+        conn.execute(
+            "CREATE TABLE bars (symbol TEXT NOT NULL, time INTEGER NOT NULL, close REAL NOT NULL, "
+            "PRIMARY KEY (symbol, time)) WITHOUT ROWID"
+        )
+        conn.executemany(
+            "INSERT INTO bars (symbol, time, close) VALUES (?, ?, ?)",
+            ((name, when, round(float(closes[i, j]), 4)) for j, name in enumerate(names) for i, when in enumerate(times)),
+        )
+    return len(times) * symbols
+
+
+def run_backtest(
+    bars: Bars, traders: list, every: int = 1, start: int | None = None, end: int | None = None, direct: bool = False
+) -> dict:
+    """Step the simulated clock through the bar times, running every trader's agent at each tick (or its policy, if direct)"""
+    import clock
+    from accounts import Account, Order, INITIAL_BALANCE, record_portfolio_values
+    from market import set_price_source
+
+    ticks = bars.times()
+    if start is not None:
+        ticks = ticks[ticks >= start]
+    if end is not None:
+        ticks = ticks[ticks <= end]
+    ticks = ticks[::every]
+    if not len(ticks):
+        raise ValueError("No bars in the chosen period")
+    now = [int(ticks[0])]
+    set_price_source(lambda symbols: bars.prices(symbols, now[0]))
+    names = [trader.name for trader in traders]
+    orders_executed = defaultdict(int)
+    rejected = defaultdict(int)
+    loop = None
+    if not direct:
+        from backtest_agents import agent_traders, run_ticks
+
+        runners = agent_traders(traders, bars, now)
+        loop = asyncio.new_event_loop()
+    started = time.perf_counter()
+    try:
+        clock.set_simulated_time(datetime.fromtimestamp(now[0], timezone.utc).replace(tzinfo=None))
+        for trader in traders:
+            Account.get(trader.name).reset(trader.strategy)
+        for tick in ticks:
+            now[0] = int(tick)
+            clock.set_simulated_time(datetime.fromtimestamp(now[0], timezone.utc).replace(tzinfo=None))
+            if loop:
+                loop.run_until_complete(run_ticks(runners))
+            for trader in traders if direct else []:
+                account = Account.get(trader.name)
+                orders = [Order(**order) for order in trader.decide(account, bars, now[0])]
+                if not orders:
+                    continue
+                try:
+                    account.execute_orders(orders)
+                    orders_executed[trader.name] += len(orders)
+                except ValueError:
+                    rejected[trader.name] += len(orders)
+            values = record_portfolio_values(names)
+    finally:
+        set_price_source(None)
+        clock.set_simulated_time(None)
+        if loop:
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+    elapsed = time.perf_counter() - started
+    if not direct:
+        for runner in runners:
+            orders_executed[runner.name], rejected[runner.name] = runner.orders, runner.rejected
+    return {
+        "ticks": len(ticks),
+        "simulated_days": (int(ticks[-1]) - int(ticks[0])) / 86400,
+        "seconds": elapsed,
+        "traders": {
+            name: {
+                "value": value,
+                "return": value / INITIAL_BALANCE - 1,
+                "orders": orders_executed[name],
+                "rejected": rejected[name],
+                "prompt_chars": 0 if direct else runners[names.index(name)].prompt_chars,
+            }
+            for name, value in zip(names, values)
+        },
+    }
+
+
+def print_results(results: dict) -> None:
+    orders = sum(trader["orders"] for trader in results["traders"].values())
+    print(f"{results['ticks']:,} ticks over {results['simulated_days']:.0f} simulated days in {results['seconds']:.1f}s")
+    print(f"  {results['ticks'] / results['seconds']:,.0f} ticks/sec, {orders / results['seconds']:,.0f} orders/sec")
+    for name, trader in results["traders"].items():
+        print(
+            f"  {name:10} ${trader['value']:>12,.2f} {trader['return']:>+8.2%}"
+            f"  {trader['orders']:>6} orders, {trader['rejected']} rejected"
+            + (f", largest prompt {trader['prompt_chars']:,} chars" if trader["prompt_chars"] else "")
+        )
+
+
+def date_arg(text: str) -> int:
+    return int(datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline trading floor backtests")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help=generate_bars.__doc__)
+    generate.add_argument("bars", help="SQLite file to write the bars to")
+    generate.add_argument("--symbols", type=int, default=20)
+    generate.add_argument("--days", type=int, default=250)
+    generate.add_argument("--minutes", action="store_true", help="Minute bars instead of daily bars")
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = subparsers.add_parser("run", help=run_backtest.__doc__)
+    run.add_argument("bars", help="SQLite, Parquet or CSV file of bars")
+    run.add_argument("--traders", nargs="+", default=["Warren:momentum", "George:rebalance", "Ray:random", "Cathie:hold"],
+                     help=f"name:policy pairs, with policies from {', '.join(POLICIES)}")
+    run.add_argument("--recorded", help="JSON lines file of recorded decisions to replay instead of stub policies")
+    run.add_argument("--every", type=int, default=1, help="Trade on every n-th bar time")
+    run.add_argument("--start", type=date_arg, help="First date, like 2024-03-01")
+    run.add_argument("--end", type=date_arg, help="Last date")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--direct", action="store_true", help="Place the policies' orders without running the agents")
+    run.add_argument("--out", default=BACKTEST_DB, help="Accounts database for the simulation; replaced on each run")
+
+    export = subparsers.add_parser("export", help=export_decisions.__doc__)
+    export.add_argument("accounts_db", help="Accounts database to read trades from")
+    export.add_argument("out", help="JSON lines file to write")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        print(f"Wrote {generate_bars(args.bars, args.symbols, args.days, args.minutes, args.seed):,} bars to {args.bars}")
+    elif args.command == "export":
+        print(f"Wrote {export_decisions(args.accounts_db, args.out):,} decisions to {args.out}")
+    else:
+        if os.path.abspath(args.out) == os.path.abspath("accounts.db"):
+            raise SystemExit("Backtests replace their database, so they can't use accounts.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.out + suffix):
+                os.remove(args.out + suffix)
+        os.environ["ACCOUNTS_DB"] = args.out
+        import database
+
+        if os.path.abspath(database.DB) != os.path.abspath(args.out):
+            raise SystemExit(f"ACCOUNTS_DB is set to {database.DB} in .env; refusing to backtest against it")
+        bars = Bars.load(args.bars)
+        if args.recorded:
+            traders = load_recorded_traders(args.recorded)
+        else:
+            traders = [StubTrader(*pair.split(":", 1), seed=args.seed) for pair in args.traders]
+        print_results(run_backtest(bars, traders, args.every, args.start, args.end, args.direct))
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from agents import Agent, Model, ModelResponse, Usage, function_tool, set_tracing_disabled
+from openai.types.responses import ResponseFunctionToolCall, ResponseOutputMessage, ResponseOutputText
+import accounts_server
+from accounts import Account
+from templates import trader_instructions
+from traders import Trader
+
+# The agent side of a backtest: the real Trader builds its prompts and runs its agent loop, but the LLM is a stub
+# model that turns each decision (from a policy or a recording) into an execute_orders tool call, and the
+# accounts server's tools and resources run in-process, through the same functions the server exposes.
+# The researcher and the market and push servers are left out, since they need the network.
+
+ACCOUNT_TOOLS = ("get_balance", "get_holdings", "buy_shares", "sell_shares", "execute_orders", "change_strategy")
+
+
+def account_tools() -> list:
+    """The accounts server's tools as function tools calling the server's own code, without a server process"""
+    return [function_tool(getattr(accounts_server, name)) for name in ACCOUNT_TOOLS]
+
+
+def message(text: str) -> ResponseOutputMessage:
+    return ResponseOutputMessage(
+        id="msg_backtest",
+        content=[ResponseOutputText(text=text, type="output_text", annotations=[])],
+        role="assistant",
+        status="completed",
+        type="message",
+    )
+
+
+class StubModel(Model):
+    """
+    Stands in for the LLM: on the first turn it asks the trader's decider for orders and calls execute_orders
+    with them, and once the tool has answered it counts the outcome and ends the run
+    """
+
+    def __init__(self, trader: "BacktestTrader"):
+        self.trader = trader
+        self.calls = 0
+
+    async def get_response(
+        self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, *,
+        previous_response_id=None, prompt=None,
+    ) -> ModelResponse:
+        items = [input] if isinstance(input, str) else input
+        results = [item for item in items if isinstance(item, dict) and item.get("type") == "function_call_output"]
+        if results:
+            return self._finish(results[-1]["output"])
+        self.trader.prompt_chars = max(self.trader.prompt_chars, len(system_instructions or "") + len(json.dumps(items)))
+        if "execute_orders" not in [tool.name for tool in tools]:
+            raise ValueError("The trader's agent has no execute_orders tool")
+        orders = self.trader.decide()
+        if not orders:
+            return ModelResponse(output=[message("No trades this time.")], usage=Usage(requests=1), response_id=None)
+        self.calls += 1
+        self.trader.pending = len(orders)
+        call = ResponseFunctionToolCall(
+            id=f"fc_{self.calls}",
+            call_id=f"call_{self.calls}",
+            name="execute_orders",
+            arguments=json.dumps({"name": self.trader.name, "orders": orders, "idempotency_key": ""}),
+            type="function_call",
+        )
+        return ModelResponse(output=[call], usage=Usage(requests=1), response_id=None)
+
+    def _finish(self, output: str) -> ModelResponse:
+        try:
+            executed = len(json.loads(output)["executed"])
+        except (ValueError, KeyError, TypeError):
+            executed = 0  # the tool reported an error, such as insufficient funds
+        self.trader.orders += executed
+        self.trader.rejected += self.trader.pending - executed
+        self.trader.pending = 0
+        return ModelResponse(output=[message("Trades done.")], usage=Usage(requests=1), response_id=None)
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError("Backtests don't stream")
+
+
+class BacktestTrader(Trader):
+    """A Trader whose agent runs against the stub model and the in-process accounts tools"""
+
+    def __init__(self, decider, bars, clock: list[int]):
+        super().__init__(decider.name, model_name="backtest")
+        self.decider = decider
+        self.strategy = decider.strategy
+        self.bars = bars
+        self.clock = clock
+        self.model = StubModel(self)
+        self.orders = 0
+        self.rejected = 0
+        self.pending = 0
+        self.prompt_chars = 0
+
+    def decide(self) -> list[dict]:
+        return self.decider.decide(Account.get(self.name), self.bars, self.clock[0])
+
+    async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
+        self.agent = Agent(
+            name=self.name,
+            instructions=trader_instructions(self.name),
+            model=self.model,
+            tools=account_tools(),
+        )
+        return self.agent
+
+    async def get_account_report_and_strategy(self) -> tuple[str, str]:
+        return await asyncio.gather(
+            accounts_server.read_report_resource(self.name),
+            accounts_server.read_strategy_resource(self.name),
+        )
+
+    async def run_tick(self) -> None:
+        """One run of the trader's agent, alternating trading and rebalancing like Trader.run"""
+        await self.run_agent([], [])
+        self.do_trade = not self.do_trade
+
+
+async def run_ticks(traders: list[BacktestTrader]) -> None:
+    """Run every trader's agent for the current tick, concurrently as on the trading floor"""
+    await asyncio.gather(*[trader.run_tick() for trader in traders])
+
+
+def agent_traders(deciders: list, bars, clock: list[int]) -> list[BacktestTrader]:
+    # Traces would be exported to OpenAI; a backtest stays offline
+    set_tracing_disabled(True)
+    return [BacktestTrader(decider, bars, clock) for decider in deciders]
@@ -0,0 +1,434 @@
+"""
+Micro-benchmarks for the trading floor's storage and runtime layers.
+
+Each benchmark runs against a scratch database in a temporary directory, so it never touches accounts.db.
+Run with: uv run benchmark.py <name> [options]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="trading_bench_")
+os.environ["ACCOUNTS_DB"] = os.path.join(SCRATCH_DIR, "accounts.db")
+
+
+def run_threads(target, writers: int, *args) -> float:
+    """Run target(*args) in `writers` threads at once and return the elapsed seconds"""
+    threads = [threading.Thread(target=target, args=args) for _ in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def bench_database(writers: int, writes: int):
+    """Writes/sec for log writes with N concurrent writers: connection per call vs the pooled WAL connections"""
+    legacy_db = os.path.join(SCRATCH_DIR, "legacy.db")
+    with sqlite3.connect(legacy_db) as conn:
+        conn.execute(
+            "CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, datetime DATETIME, type TEXT, message TEXT)"
+        )
+
+    def legacy_writer():
+        for i in range(writes):
+            with sqlite3.connect(legacy_db, timeout=30) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+                    ("bench", "bench", f"message {i}"),
+                )
+                conn.commit()
+
+    from database import write_log, close_connection
+
+    def pooled_writer():
+        for i in range(writes):
+            write_log("bench", "bench", f"message {i}")
+        close_connection()
+
+    total = writers * writes
+    before = run_threads(legacy_writer, writers)
+    after = run_threads(pooled_writer, writers)
+    print(f"{writers} writers x {writes} writes")
+    print(f"  connection per call: {total / before:10,.0f} writes/sec")
+    print(f"  pooled WAL:          {total / after:10,.0f} writes/sec  ({before / after:.1f}x)")
+
+
+async def bench_mcp_pool(traders: int, cycles: int):
+    """MCP server startup per cycle: spawning every server per trader per run vs a shared pool"""
+    from contextlib import AsyncExitStack
+    from mcp_transport import mcp_server
+    from mcp_pool import MCPServerPool
+
+    pool = MCPServerPool()
+    names = [f"bench{i}" for i in range(traders)]
+
+    async def spawn_for(name: str):
+        trader_params, researcher_params = pool.server_params(name)
+        async with AsyncExitStack() as stack:
+            for params in [*trader_params, *researcher_params]:
+                await stack.enter_async_context(mcp_server(params, client_session_timeout_seconds=120))
+
+    start = time.perf_counter()
+    for _ in range(cycles):
+        await asyncio.gather(*[spawn_for(name) for name in names])
+    spawned = (time.perf_counter() - start) / cycles
+
+    start = time.perf_counter()
+    await pool.start(names)
+    warmup = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(cycles):
+        await pool.health_check()
+        for name in names:
+            async with pool.lease(name):
+                pass
+    pooled = (time.perf_counter() - start) / cycles
+    await pool.close()
+    print(f"{traders} traders x {cycles} cycles")
+    print(f"  spawn per run: {spawned:8.2f}s per cycle")
+    print(f"  shared pool:   {pooled:8.2f}s per cycle, after {warmup:.2f}s to start {pool.starts} servers once")
+    print(f"  saved:         {spawned - pooled:8.2f}s per cycle")
+
+
+def bench_trades(workers: int, trades: int, with_report: bool = False):
+    """Trades/sec with N concurrent workers trading one account, checking that no update is lost"""
+    import math
+    import accounts
+    from accounts import Account
+    from database import read_transactions, close_connection
+
+    price = 10.0
+    accounts.get_share_price = lambda symbol: price
+    if not with_report:
+        # Time the trade itself; the full report each trade returns grows with the account's history
+        Account.report = lambda self, prices=None: ""
+    name = "bench_trader"
+    account = Account.get(name)
+    account.reset("benchmark")
+    account.balance = 1_000_000_000.0
+    account.save()
+    errors = []
+
+    def trader(worker: int):
+        try:
+            for i in range(trades):
+                key = f"{worker}-{i}"
+                # every 10th request is sent twice, as a client retrying after a lost response would
+                for _ in range(2 if i % 10 == 0 else 1):
+                    account = Account.get(name)
+                    if i % 3 == 2:
+                        account.sell_shares("BENCH", 1, "benchmark", idempotency_key=key)
+                    else:
+                        account.buy_shares("BENCH", 2, "benchmark", idempotency_key=key)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            close_connection()
+
+    threads = [threading.Thread(target=trader, args=(worker,)) for worker in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    account = Account.get(name)
+    transactions = read_transactions(name)
+    sells = sum(1 for i in range(trades) if i % 3 == 2)
+    expected_shares = workers * (2 * (trades - sells) - sells)
+    expected_balance = 1_000_000_000.0 - sum(t["quantity"] * t["price"] for t in transactions)
+    print(f"{workers} workers x {trades} trades on one account, with a retried request every 10 trades"
+          f"{' and a report after each trade' if with_report else ''}")
+    print(f"  throughput:   {workers * trades / elapsed:10,.0f} trades/sec")
+    print(f"  errors:       {len(errors)} {errors[:1]}")
+    print(f"  transactions: {len(transactions)} (expected {workers * trades})")
+    print(f"  shares held:  {account.holdings.get('BENCH', 0)} (expected {expected_shares})")
+    print(f"  balance:      {account.balance:,.2f} (expected {expected_balance:,.2f})")
+    lost = (
+        len(transactions) != workers * trades
+        or account.holdings.get("BENCH", 0) != expected_shares
+        or not math.isclose(account.balance, expected_balance, abs_tol=1e-3)
+    )
+    print(f"  lost updates: {'YES' if lost else 'none'}")
+
+
+def bench_profit_loss(trades: int, seed: int):
+    """Randomized trades checking the running P&L totals against a full recomputation, and the query cost of each"""
+    import math
+    import random
+    import accounts
+    import pnl
+    from accounts import Account
+    from database import read_transactions
+
+    rng = random.Random(seed)
+    symbols = ["AAA", "BBB", "CCC", "DDD", "EEE"]
+    prices = {symbol: rng.uniform(10, 200) for symbol in symbols}
+    accounts.get_share_price = lambda symbol: prices[symbol]
+    accounts.get_share_prices = lambda wanted: {symbol: prices[symbol] for symbol in wanted}
+    account = Account.get("bench_pnl")
+    account.reset("benchmark")
+    account.balance = 1_000_000_000.0
+    account.save()
+    Account.report = lambda self, prices=None: ""
+
+    mismatches = 0
+    checks = 0
+    for i in range(trades):
+        for symbol in symbols:
+            prices[symbol] *= math.exp(rng.gauss(0, 0.02))
+        account = Account.get("bench_pnl")
+        symbol = rng.choice(symbols)
+        held = account.holdings.get(symbol, 0)
+        if held and rng.random() < 0.4:
+            account.sell_shares(symbol, rng.randint(1, held), "benchmark")
+        else:
+            account.buy_shares(symbol, rng.randint(1, 50), "benchmark")
+        if i % 50 == 49 or i == trades - 1:
+            account = Account.get("bench_pnl")
+            transactions = read_transactions("bench_pnl")
+            positions, realized = pnl.replay(transactions)
+            value = account.calculate_portfolio_value()
+            full_profit_loss = value - sum(t["quantity"] * t["price"] for t in transactions) - account.balance
+            unrealized = sum(position["unrealized_profit_loss"] for position in account.get_positions().values())
+            checks += 1
+            consistent = (
+                math.isclose(account.calculate_profit_loss(value), full_profit_loss, abs_tol=1e-4)
+                and math.isclose(account.realized_profit_loss, realized, abs_tol=1e-4)
+                and math.isclose(account.realized_profit_loss + unrealized, full_profit_loss, abs_tol=1e-4)
+                and account.transaction_count == len(transactions)
+                and {symbol: quantity for symbol, (quantity, _) in positions.items()} == account.holdings
+                and all(
+                    math.isclose(account._costs[symbol], cost, rel_tol=1e-9, abs_tol=1e-6)
+                    for symbol, (_, cost) in positions.items()
+                )
+            )
+            mismatches += not consistent
+
+    account = Account.get("bench_pnl")
+    value = account.calculate_portfolio_value()
+    start = time.perf_counter()
+    for _ in range(100):
+        transactions = read_transactions("bench_pnl")
+        value - sum(t["quantity"] * t["price"] for t in transactions) - account.balance
+    full = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(100):
+        Account.get("bench_pnl").calculate_profit_loss(value)
+    incremental = (time.perf_counter() - start) / 100
+    print(f"{trades} random trades across {len(symbols)} symbols (seed {seed})")
+    print(f"  consistency checks: {checks}, mismatches: {mismatches}")
+    print(f"  P&L from the transaction log: {full * 1000:8.3f}ms")
+    print(f"  P&L from running totals:      {incremental * 1000:8.3f}ms (including reading the account)")
+    assert mismatches == 0, f"{mismatches} of {checks} checks found the running totals out of step with the transaction log"
+
+
+def bench_ledger(events: list[int], loads: int):
+    """Account load time against the number of ledger events: snapshot + tail replay vs replaying everything"""
+    from datetime import datetime, timedelta
+    import ledger
+    from accounts import Account
+    from database import execute_trades, LEDGER_SNAPSHOT_EVERY
+
+    def timed(load) -> float:
+        start = time.perf_counter()
+        for _ in range(loads):
+            load()
+        return (time.perf_counter() - start) / loads * 1000
+
+    print(f"Snapshot every {LEDGER_SNAPSHOT_EVERY} events; milliseconds per load")
+    print(f"  {'events':>8} {'tables':>8} {'snapshot+tail':>14} {'as of middle':>13} {'full replay':>12}")
+    for count in events:
+        name = f"bench_ledger_{count}"
+        account = Account.get(name)
+        account.reset("benchmark")
+        account.balance = 1_000_000_000.0
+        account.save()
+        start = datetime(2025, 1, 1)
+        batch = []
+        for i in range(count):
+            quantity = -2 if i >= 20 and i % 3 == 0 else 3
+            timestamp = (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+            batch.append({"symbol": f"S{i % 20}", "quantity": quantity, "price": 10.0 + i % 7,
+                          "timestamp": timestamp, "rationale": "benchmark"})
+            if len(batch) == 100 or i == count - 1:
+                execute_trades(name, batch)
+                batch = []
+        assert ledger.load_state(name) == ledger.replay_all(name), "ledger replay diverged"
+        middle = (start + timedelta(seconds=count // 2)).strftime("%Y-%m-%d %H:%M:%S")
+        tables = timed(lambda: Account.get(name))
+        snapshot = timed(lambda: ledger.load_state(name))
+        as_of = timed(lambda: Account.as_of(name, middle))
+        full = timed(lambda: ledger.replay_all(name))
+        print(f"  {count:>8,} {tables:>8.3f} {snapshot:>14.3f} {as_of:>13.3f} {full:>12.3f}")
+
+
+async def bench_scheduler(traders: int, cycles: int, cycle_seconds: float, run_seconds: float, concurrency: int):
+    """Simulated trader runs through the scheduler: provider limits, staggered starts and carry-over of overruns"""
+    import random
+    import scheduler
+    from scheduler import Scheduler
+
+    class FakeTrader:
+        def __init__(self, name: str, model_name: str):
+            self.name = name
+            self.model_name = model_name
+
+    active = {}
+    peaks = {}
+
+    async def run(trader) -> int:
+        provider = trader.model_name
+        active[provider] = active.get(provider, 0) + 1
+        peaks[provider] = max(peaks.get(provider, 0), active[provider])
+        try:
+            # One run in five is slow enough to overrun its cycle
+            slow = random.random() < 0.2
+            await asyncio.sleep(run_seconds * (3 if slow else random.uniform(0.5, 1.5)))
+        finally:
+            active[provider] -= 1
+        return 20_000
+
+    scheduler.DEFAULT_PROVIDER_CONCURRENCY = concurrency
+    fakes = [FakeTrader(f"trader{i}", ("openai", "deepseek", "gemini")[i % 3]) for i in range(traders)]
+    floor = Scheduler(fakes, run, lambda model_name: model_name, stagger_seconds=cycle_seconds / 4, jitter_seconds=cycle_seconds / 20)
+    print(f"{traders} traders over 3 providers, {concurrency} concurrent runs per provider")
+    for _ in range(cycles):
+        deadline = time.monotonic() + cycle_seconds
+        metrics = await floor.run_cycle(deadline)
+        print(
+            f"  cycle {metrics['cycle']}: started {metrics['started']}, completed {metrics['completed']}, "
+            f"overran {metrics['overran']}, carried over {metrics['carried_over']}, "
+            f"median {metrics['median_run_seconds']:.2f}s, max {metrics['max_run_seconds']:.2f}s, "
+            f"max queue {metrics['max_queue_depth']}"
+        )
+        await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+    await floor.close()
+    print(f"  Peak concurrent runs per provider: {peaks}")
+    assert all(peak <= concurrency for peak in peaks.values()), "provider concurrency limit exceeded"
+
+
+def bench_fetch(pages: int, rounds: int):
+    """Page fetches through the on-disk fetch cache against a local fixture server: cold, fresh and revalidated"""
+    import hashlib
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import fetch_cache
+    from fetch_cache import Fetcher
+
+    fetch_cache.FETCH_CACHE_DB = os.path.join(SCRATCH_DIR, "fetch_cache.db")
+    paragraph = "<p>Shares of the company rose after earnings beat expectations and guidance was raised.</p>"
+    article = f"<html><head><title>News</title><script>var x = 1;</script></head><body><nav>Menu</nav><article><h1>Market news</h1>{paragraph * 200}</article></body></html>"
+    body = article.encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    served = {"200": 0, "304": 0}
+
+    class Fixture(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == etag:
+                served["304"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            served["200"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Fixture)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/article/{i}" for i in range(pages)]
+
+    async def timed_round(fetcher: Fetcher) -> float:
+        start = time.perf_counter()
+        texts = await asyncio.gather(*[fetcher.text(url) for url in urls])
+        assert all("Market news" in text and "var x" not in text for text in texts), "extraction failed"
+        return (time.perf_counter() - start) / pages * 1000
+
+    async def run():
+        fetcher = Fetcher()
+        try:
+            cold = await timed_round(fetcher)
+            fresh = min([await timed_round(fetcher) for _ in range(rounds)])
+            fetch_cache.FETCH_FRESH_SECONDS = 0
+            revalidated = min([await timed_round(fetcher) for _ in range(rounds)])
+        finally:
+            await fetcher.close()
+        print(f"{pages} pages of {len(body) / 1024:.0f}KB; milliseconds per page")
+        print(f"  cold (download and extract): {cold:8.3f}")
+        print(f"  fresh (from disk):           {fresh:8.3f}")
+        print(f"  revalidated (304):           {revalidated:8.3f}")
+        print(f"  Fixture served {served['200']} full responses and {served['304']} not-modified")
+        print(f"  Fetcher: {fetcher.counts}")
+        assert served["200"] == pages and fetcher.counts["extracted"] == pages, "pages were downloaded or extracted twice"
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trading floor micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    database = subparsers.add_parser("database", help=bench_database.__doc__)
+    database.add_argument("--writers", type=int, default=8, help="Number of concurrent writers")
+    database.add_argument("--writes", type=int, default=500, help="Writes per writer")
+    database.set_defaults(run=lambda args: bench_database(args.writers, args.writes))
+
+    mcp_pool = subparsers.add_parser("mcp_pool", help=bench_mcp_pool.__doc__)
+    mcp_pool.add_argument("--traders", type=int, default=4, help="Number of traders")
+    mcp_pool.add_argument("--cycles", type=int, default=3, help="Trading cycles to simulate")
+    mcp_pool.set_defaults(run=lambda args: asyncio.run(bench_mcp_pool(args.traders, args.cycles)))
+
+    trades = subparsers.add_parser("trades", help=bench_trades.__doc__)
+    trades.add_argument("--workers", type=int, default=16, help="Number of concurrent workers")
+    trades.add_argument("--trades", type=int, default=200, help="Trades per worker")
+    trades.add_argument("--with-report", action="store_true", help="Include the report returned after each trade")
+    trades.set_defaults(run=lambda args: bench_trades(args.workers, args.trades, args.with_report))
+
+    profit_loss = subparsers.add_parser("profit_loss", help=bench_profit_loss.__doc__)
+    profit_loss.add_argument("--trades", type=int, default=2000, help="Number of random trades")
+    profit_loss.add_argument("--seed", type=int, default=0, help="Random seed")
+    profit_loss.set_defaults(run=lambda args: bench_profit_loss(args.trades, args.seed))
+
+    ledger = subparsers.add_parser("ledger", help=bench_ledger.__doc__)
+    ledger.add_argument("--events", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Event counts")
+    ledger.add_argument("--loads", type=int, default=20, help="Loads to time for each count")
+    ledger.set_defaults(run=lambda args: bench_ledger(args.events, args.loads))
+
+    sched = subparsers.add_parser("scheduler", help=bench_scheduler.__doc__)
+    sched.add_argument("--traders", type=int, default=12, help="Number of simulated traders")
+    sched.add_argument("--cycles", type=int, default=4, help="Cycles to run")
+    sched.add_argument("--cycle-seconds", type=float, default=2.0, help="Length of each cycle")
+    sched.add_argument("--run-seconds", type=float, default=0.5, help="Typical length of a run")
+    sched.add_argument("--concurrency", type=int, default=2, help="Concurrent runs allowed per provider")
+    sched.set_defaults(
+        run=lambda args: asyncio.run(
+            bench_scheduler(args.traders, args.cycles, args.cycle_seconds, args.run_seconds, args.concurrency)
+        )
+    )
+
+    fetch = subparsers.add_parser("fetch", help=bench_fetch.__doc__)
+    fetch.add_argument("--pages", type=int, default=20, help="Number of distinct pages")
+    fetch.add_argument("--rounds", type=int, default=3, help="Cached rounds to time")
+    fetch.set_defaults(run=lambda args: bench_fetch(args.pages, args.rounds))
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+# The time as the trading floor sees it. Normally the wall clock; a backtest sets a simulated time
+# instead, so that trades, ledger events and portfolio values are stamped with the replayed moment.
+
+_simulated: datetime | None = None
+
+
+def now() -> datetime:
+    return _simulated or datetime.now()
+
+
+def set_simulated_time(when: datetime | None) -> None:
+    """Freeze the clock at the given time, or go back to the wall clock with None"""
+    global _simulated
+    _simulated = when
@@ -1,17 +1,390 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import threading
+import calendar
+from datetime import datetime as dt
+from contextlib import contextmanager
 from dotenv import load_dotenv
+import pnl
+import clock
 
 load_dotenv(override=True)
 
-DB = "accounts.db"
+DB = os.getenv("ACCOUNTS_DB", "accounts.db")
 
+BUSY_TIMEOUT_MS = 10_000
+CACHED_STATEMENTS = 256
 
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
+# Every change to an account is also appended to the ledger, and the account's state is snapshotted
+# every this many events, so any past state can be rebuilt from a snapshot and a short tail of events
+LEDGER_SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "100"))
+
+# Portfolio values are also rolled up into buckets of an hour, a day and a week as they are written,
+# so charts over any span can read a bounded number of points
+ROLLUP_RESOLUTIONS = (3600, 86400, 604800)
+
+# Idempotency keys are remembered per account for this long, so a retried order is recognized but the table stays small
+TRADE_REQUEST_RETENTION_DAYS = float(os.getenv("TRADE_REQUEST_RETENTION_DAYS", "7"))
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Open a connection tuned for many concurrent readers and writers across processes:
+    WAL journal so readers never block the writer, synchronous=NORMAL (safe with WAL),
+    and a busy timeout so writers queue on the lock instead of failing.
+    Autocommit mode - single statements commit by themselves, and multi-statement
+    work goes through transaction().
+    """
+    conn = sqlite3.connect(
+        DB,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the pooled connection for the current thread, opening it on first use.
+    Connections are never shared across threads, and are reopened after a fork.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def close_connection() -> None:
+    """Close the current thread's pooled connection, if any."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """
+    Run a group of statements as one transaction on the pooled connection.
+    Use immediate=True to take the write lock up front for read-modify-write work.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _migrate_json_accounts(conn: sqlite3.Connection) -> None:
+    """
+    One-shot migration from the original schema, where each account was a single JSON blob
+    in accounts.account, into the normalized tables. Runs inside the schema transaction.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]
+    if "account" not in columns:
+        return
+    conn.execute("ALTER TABLE accounts RENAME TO accounts_json")
+    _create_account_tables(conn)
+    for name, account_json in conn.execute("SELECT name, account FROM accounts_json").fetchall():
+        _write_account(conn, name, json.loads(account_json))
+    conn.execute("DROP TABLE accounts_json")
+
+
+def _migrate_market_cache(conn: sqlite3.Connection) -> None:
+    """
+    One-shot migration from the old end-of-day market table, one JSON snapshot per date, into the prices table.
+    The latest snapshot is kept as end-of-day prices fetched on its date, unless the cache already has newer ones.
+    Runs inside the schema transaction.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market'").fetchone():
+        return
+    row = conn.execute('SELECT date, data FROM market ORDER BY date DESC LIMIT 1').fetchone()
+    if row:
+        fetched_at = dt.strptime(row[0], "%Y-%m-%d").timestamp()
+        conn.executemany(
+            "INSERT OR IGNORE INTO prices (symbol, plan, price, fetched_at) VALUES (?, 'eod', ?, ?)",
+            [(symbol, price, fetched_at) for symbol, price in json.loads(row[1]).items()],
+        )
+    conn.execute('DROP TABLE market')
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> bool:
+    """Add a column to an existing table if it's missing, and return whether it was added"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
+
+def _create_trade_requests(conn: sqlite3.Connection) -> None:
+    """
+    Idempotency keys, scoped to an account and stored with the orders they were first used for.
+    Keys from before they were scoped (a global key column, no fingerprint) are short-lived retry tokens,
+    so the old table is simply replaced.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(trade_requests)")]
+    if columns and "fingerprint" not in columns:
+        conn.execute('DROP TABLE trade_requests')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS trade_requests (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created TEXT NOT NULL,
+            PRIMARY KEY (name, key)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trade_requests_created ON trade_requests (created)')
+
+
+def _order_fingerprint(transaction_dicts: list[dict]) -> str:
+    """The orders a key was used for, as symbol, side and quantity, independent of their order and prices"""
+    orders = sorted(
+        (t["symbol"], "buy" if t["quantity"] > 0 else "sell", abs(t["quantity"])) for t in transaction_dicts
+    )
+    return json.dumps(orders)
+
+
+def _create_account_tables(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            name TEXT PRIMARY KEY,
+            balance REAL NOT NULL,
+            strategy TEXT NOT NULL DEFAULT '',
+            version INTEGER NOT NULL DEFAULT 0,
+            realized_pnl REAL NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    _add_column(conn, "accounts", "version", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS holdings (
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            cost REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, symbol)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            timestamp TEXT NOT NULL,
+            rationale TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name_timestamp ON transactions (name, timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name_id ON transactions (name, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_values (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            datetime TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_values_name_datetime ON portfolio_values (name, datetime)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_values_name_id ON portfolio_values (name, id)')
+    backfill = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'portfolio_rollups'"
+    ).fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_rollups (
+            name TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            last REAL NOT NULL,
+            last_time REAL NOT NULL,
+            PRIMARY KEY (name, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    if backfill:
+        rows = conn.execute('SELECT name, datetime, value FROM portfolio_values ORDER BY id').fetchall()
+        _add_rollups(conn, [(name, _epoch(datetime), value) for name, datetime, value in rows])
+    added = [
+        _add_column(conn, "accounts", "realized_pnl", "REAL NOT NULL DEFAULT 0"),
+        _add_column(conn, "accounts", "transaction_count", "INTEGER NOT NULL DEFAULT 0"),
+        _add_column(conn, "holdings", "cost", "REAL NOT NULL DEFAULT 0"),
+    ]
+    if any(added):
+        for name, in conn.execute('SELECT name FROM accounts').fetchall():
+            _rebuild_positions(conn, name)
+    genesis = not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ledger'").fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            data TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ledger_name_id ON ledger (name, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_snapshots (
+            name TEXT NOT NULL,
+            event_id INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            state TEXT NOT NULL,
+            PRIMARY KEY (name, event_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ledger_snapshots_name_timestamp ON ledger_snapshots (name, timestamp)')
+    if genesis:
+        # Accounts that predate the ledger start it with their current state
+        for name, in conn.execute('SELECT name FROM accounts').fetchall():
+            _append_event(conn, name, "reset", _read_state(conn, name))
+            _snapshot(conn, name)
+
+
+def _now() -> str:
+    return clock.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _read_state(conn: sqlite3.Connection, name: str) -> dict:
+    """The state of an account as the ledger records it, read from the current tables"""
+    balance, strategy, realized_pnl, transaction_count = conn.execute(
+        'SELECT balance, strategy, realized_pnl, transaction_count FROM accounts WHERE name = ?', (name,)
+    ).fetchone()
+    holdings = conn.execute('SELECT symbol, quantity, cost FROM holdings WHERE name = ?', (name,)).fetchall()
+    return {
+        "balance": balance,
+        "strategy": strategy,
+        "holdings": {symbol: [quantity, cost] for symbol, quantity, cost in holdings},
+        "realized_pnl": realized_pnl,
+        "transaction_count": transaction_count,
+    }
+
+
+def _append_event(conn: sqlite3.Connection, name: str, type: str, data: dict, timestamp: str | None = None) -> int:
+    cursor = conn.execute(
+        'INSERT INTO ledger (name, type, timestamp, data) VALUES (?, ?, ?, ?)',
+        (name, type, timestamp or _now(), json.dumps(data)),
+    )
+    return cursor.lastrowid
+
+
+def _snapshot(conn: sqlite3.Connection, name: str) -> None:
+    """Record the account's current state against its latest ledger event"""
+    event_id, timestamp = conn.execute(
+        'SELECT id, timestamp FROM ledger WHERE name = ? ORDER BY id DESC LIMIT 1', (name,)
+    ).fetchone()
+    conn.execute(
+        'INSERT OR REPLACE INTO ledger_snapshots (name, event_id, timestamp, state) VALUES (?, ?, ?, ?)',
+        (name, event_id, timestamp, json.dumps(_read_state(conn, name))),
+    )
+
+
+def _maybe_snapshot(conn: sqlite3.Connection, name: str) -> None:
+    """Snapshot the account once LEDGER_SNAPSHOT_EVERY events have built up since the last snapshot"""
+    row = conn.execute('SELECT MAX(event_id) FROM ledger_snapshots WHERE name = ?', (name,)).fetchone()
+    since, = conn.execute(
+        'SELECT COUNT(*) FROM (SELECT 1 FROM ledger WHERE name = ? AND id > ? LIMIT ?)',
+        (name, row[0] or 0, LEDGER_SNAPSHOT_EVERY),
+    ).fetchone()
+    if since >= LEDGER_SNAPSHOT_EVERY:
+        _snapshot(conn, name)
+
+
+def _rebuild_positions(conn: sqlite3.Connection, name: str) -> None:
+    """Recompute the cost basis, realized profit or loss and transaction count of an account from its transaction log"""
+    cursor = conn.execute('SELECT symbol, quantity, price FROM transactions WHERE name = ? ORDER BY id', (name,))
+    transactions = [{"symbol": symbol, "quantity": quantity, "price": price} for symbol, quantity, price in cursor]
+    positions, realized = pnl.replay(transactions)
+    conn.execute('UPDATE holdings SET cost = 0 WHERE name = ?', (name,))
+    conn.executemany(
+        'UPDATE holdings SET cost = ? WHERE name = ? AND symbol = ?',
+        [(cost, name, symbol) for symbol, (_, cost) in positions.items()],
+    )
+    conn.execute(
+        'UPDATE accounts SET realized_pnl = ?, transaction_count = ? WHERE name = ?', (realized, len(transactions), name)
+    )
+
+
+def _epoch(datetime: str) -> float:
+    """Seconds since the epoch for a stored "%Y-%m-%d %H:%M:%S" time, taken as-is without a timezone"""
+    return float(calendar.timegm(dt.strptime(datetime, "%Y-%m-%d %H:%M:%S").timetuple()))
+
+
+def _add_rollups(conn: sqlite3.Connection, rows: list[tuple[str, float, float]]) -> None:
+    """Fold (name, time, value) points into the min/max/last of their bucket at every resolution"""
+    conn.executemany('''
+        INSERT INTO portfolio_rollups (name, resolution, bucket, min, max, last, last_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(name, resolution, bucket) DO UPDATE SET
+            min = MIN(min, excluded.min),
+            max = MAX(max, excluded.max),
+            last = CASE WHEN excluded.last_time >= last_time THEN excluded.last ELSE last END,
+            last_time = MAX(last_time, excluded.last_time)
+    ''', [
+        (name, resolution, int(time // resolution), value, value, value, time)
+        for name, time, value in rows
+        for resolution in ROLLUP_RESOLUTIONS
+    ])
+
+
+def _write_account(conn: sqlite3.Connection, name: str, account_dict: dict) -> None:
+    name = name.lower()
+    conn.execute('''
+        INSERT INTO accounts (name, balance, strategy)
+        VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET balance=excluded.balance, strategy=excluded.strategy, version=version + 1
+    ''', (name, account_dict["balance"], account_dict["strategy"]))
+    conn.execute('DELETE FROM holdings WHERE name = ?', (name,))
+    conn.executemany(
+        'INSERT INTO holdings (name, symbol, quantity) VALUES (?, ?, ?)',
+        [(name, symbol, quantity) for symbol, quantity in account_dict["holdings"].items()],
+    )
+    conn.execute('DELETE FROM transactions WHERE name = ?', (name,))
+    conn.executemany(
+        'INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale) VALUES (?, ?, ?, ?, ?, ?)',
+        [
+            (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+            for t in account_dict.get("transactions", [])
+        ],
+    )
+    _rebuild_positions(conn, name)
+    series = account_dict.get("portfolio_value_time_series", [])
+    conn.execute('DELETE FROM portfolio_values WHERE name = ?', (name,))
+    conn.executemany(
+        'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)',
+        [(name, datetime, value) for datetime, value in series],
+    )
+    conn.execute('DELETE FROM portfolio_rollups WHERE name = ?', (name,))
+    _add_rollups(conn, [(name, _epoch(datetime), value) for datetime, value in series])
+    _append_event(conn, name, "reset", _read_state(conn, name))
+    _snapshot(conn, name)
+
+
+with transaction(immediate=True) as conn:
+    _migrate_json_accounts(conn)
+    _create_account_tables(conn)
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
@@ -20,82 +393,495 @@ with sqlite3.connect(DB) as conn:
             message TEXT
         )
     ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
-
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_datetime ON logs (name, datetime)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_id ON logs (name, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_datetime ON logs (datetime)')
+    _add_column(conn, 'logs', 'trace_id', 'TEXT')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS runs (
+            trace_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            model TEXT,
+            cycle INTEGER,
+            do_trade INTEGER,
+            started REAL,
+            ended REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_runs_name_started ON runs (name, started)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS spans (
+            span_id TEXT PRIMARY KEY,
+            trace_id TEXT,
+            parent_id TEXT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            span_name TEXT,
+            server TEXT,
+            model TEXT,
+            started REAL,
+            ended REAL,
+            duration REAL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            error TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_spans_name_started ON spans (name, started)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_spans_started ON spans (started)')
+    _create_trade_requests(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prices (
+            symbol TEXT NOT NULL,
+            plan TEXT NOT NULL,
+            price REAL NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (symbol, plan)
+        ) WITHOUT ROWID
+    ''')
+    _migrate_market_cache(conn)
+
+
+def write_account(name, account_dict) -> int:
+    """
+    Replace the whole stored state of an account and return its new version; only used for creation and resets.
+    Day-to-day changes go through the append-only writers below.
+    """
+    with transaction(immediate=True) as conn:
+        _write_account(conn, name, account_dict)
+        return conn.execute('SELECT version FROM accounts WHERE name = ?', (name.lower(),)).fetchone()[0]
 
 def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+    """
+    Read the core fields of an account (name, balance, strategy, holdings, version), with the running totals kept
+    for profit and loss (costs per holding, realized_pnl, transaction_count), or None if it doesn't exist.
+    Transactions and the portfolio value time series are read separately, only when needed.
+    """
+    conn = get_connection()
+    row = conn.execute(
+        'SELECT name, balance, strategy, version, realized_pnl, transaction_count FROM accounts WHERE name = ?',
+        (name.lower(),),
+    ).fetchone()
+    if not row:
+        return None
+    holdings = conn.execute('SELECT symbol, quantity, cost FROM holdings WHERE name = ?', (name.lower(),)).fetchall()
+    return {
+        "name": row[0],
+        "balance": row[1],
+        "strategy": row[2],
+        "holdings": {symbol: quantity for symbol, quantity, _ in holdings},
+        "version": row[3],
+        "costs": {symbol: cost for symbol, _, cost in holdings},
+        "realized_pnl": row[4],
+        "transaction_count": row[5],
+    }
+
+class StaleAccountError(RuntimeError):
+    """Raised when an account was changed by someone else since it was read"""
+
+
+def write_account_fields(
+    name: str,
+    balance: float,
+    strategy: str,
+    expected_version: int | None = None,
+    event: tuple[str, dict] | None = None,
+) -> int:
+    """
+    Update an account's balance and strategy, and return its new version.
+    With expected_version, the update only applies if nobody else has written the account since
+    that version was read; otherwise StaleAccountError is raised and nothing changes.
+    The change is added to the ledger as the given (type, data) event, such as ("deposit", {"amount": 100}),
+    or otherwise as an "update" event that sets the balance and strategy.
+    """
+    with transaction(immediate=True) as conn:
+        if expected_version is None:
+            cursor = conn.execute(
+                'UPDATE accounts SET balance = ?, strategy = ?, version = version + 1 WHERE name = ?',
+                (balance, strategy, name.lower()),
+            )
+        else:
+            cursor = conn.execute(
+                'UPDATE accounts SET balance = ?, strategy = ?, version = version + 1 WHERE name = ? AND version = ?',
+                (balance, strategy, name.lower(), expected_version),
+            )
+        if cursor.rowcount == 0:
+            raise StaleAccountError(f"Account {name} was modified concurrently")
+        type, data = event or ("update", {"balance": balance, "strategy": strategy})
+        _append_event(conn, name.lower(), type, data)
+        _maybe_snapshot(conn, name.lower())
+        return conn.execute('SELECT version FROM accounts WHERE name = ?', (name.lower(),)).fetchone()[0]
+
+def execute_trades(name: str, transaction_dicts: list[dict], idempotency_key: str | None = None) -> dict:
+    """
+    Apply several trades as one atomic unit against the account as it is in the database right now.
+    The write lock is taken up front (BEGIN IMMEDIATE), funds and shares are checked inside the
+    transaction, and the balance and holdings are updated in place, so concurrent trades from any
+    process can never lose each other's updates.
+    Trades that are retried with the same idempotency key are not applied twice; the original outcome is returned.
+    Keys belong to the account, and reusing one for different orders raises ValueError rather than replaying.
+    The trades are validated together: the net cost must be covered by the cash balance, and no symbol may end up
+    with fewer than zero shares; if either check fails, none of the trades is applied.
+    The cost basis of each position and the realized profit or loss are brought up to date in the same transaction.
+
+    Returns:
+        dict: the executed trades (symbol, quantity and fill price), balance, holdings and costs (of the traded
+        symbols), realized_pnl, transaction_count and version after the trades, and replayed
+    """
+    name = name.lower()
+    cost = sum(t["quantity"] * t["price"] for t in transaction_dicts)
+    fingerprint = _order_fingerprint(transaction_dicts)
+    retention = f"-{TRADE_REQUEST_RETENTION_DAYS} days"
+    with transaction(immediate=True) as conn:
+        if idempotency_key:
+            row = conn.execute(
+                "SELECT fingerprint, result FROM trade_requests WHERE name = ? AND key = ? AND created >= datetime('now', ?)",
+                (name, idempotency_key, retention),
+            ).fetchone()
+            if row:
+                if row[0] != fingerprint:
+                    raise ValueError(
+                        f"Idempotency key {idempotency_key} was already used for different orders; use a new key."
+                    )
+                return {**json.loads(row[1]), "replayed": True}
+        balance, = conn.execute('SELECT balance FROM accounts WHERE name = ?', (name,)).fetchone()
+        holdings, costs = {}, {}
+        for t in transaction_dicts:
+            if t["symbol"] not in holdings:
+                row = conn.execute(
+                    'SELECT quantity, cost FROM holdings WHERE name = ? AND symbol = ?', (name, t["symbol"])
+                ).fetchone()
+                holdings[t["symbol"]], costs[t["symbol"]] = row or (0, 0.0)
+        if cost > balance:
+            raise ValueError("Insufficient funds to buy shares.")
+        realized = 0.0
+        for t in transaction_dicts:
+            if holdings[t["symbol"]] + t["quantity"] < 0:
+                raise ValueError(f"Cannot sell {-t['quantity']} shares of {t['symbol']}. Not enough shares held.")
+            holdings[t["symbol"]], costs[t["symbol"]], gain = pnl.apply_trade(
+                holdings[t["symbol"]], costs[t["symbol"]], t["quantity"], t["price"]
+            )
+            realized += gain
+        conn.execute('''
+            UPDATE accounts
+            SET balance = balance - ?, realized_pnl = realized_pnl + ?, transaction_count = transaction_count + ?,
+                version = version + 1
+            WHERE name = ?
+        ''', (cost, realized, len(transaction_dicts), name))
+        conn.executemany('''
+            INSERT INTO holdings (name, symbol, quantity, cost)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity, cost=excluded.cost
+        ''', [(name, symbol, quantity, costs[symbol]) for symbol, quantity in holdings.items() if quantity])
+        conn.executemany(
+            'DELETE FROM holdings WHERE name = ? AND symbol = ?',
+            [(name, symbol) for symbol, quantity in holdings.items() if not quantity],
+        )
+        conn.executemany('''
+            INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"]) for t in transaction_dicts])
+        for t in transaction_dicts:
+            data = {"symbol": t["symbol"], "quantity": t["quantity"], "price": t["price"], "rationale": t["rationale"]}
+            _append_event(conn, name, "buy" if t["quantity"] > 0 else "sell", data, t["timestamp"])
+        _maybe_snapshot(conn, name)
+        balance, realized_pnl, transaction_count, version = conn.execute(
+            'SELECT balance, realized_pnl, transaction_count, version FROM accounts WHERE name = ?', (name,)
+        ).fetchone()
+        result = {
+            "executed": [{"symbol": t["symbol"], "quantity": t["quantity"], "price": t["price"]} for t in transaction_dicts],
+            "balance": balance,
+            "holdings": holdings,
+            "costs": costs,
+            "realized_pnl": realized_pnl,
+            "transaction_count": transaction_count,
+            "version": version,
+        }
+        if idempotency_key:
+            conn.execute("DELETE FROM trade_requests WHERE created < datetime('now', ?)", (retention,))
+            conn.execute('''
+                INSERT OR REPLACE INTO trade_requests (name, key, fingerprint, result, created)
+                VALUES (?, ?, ?, ?, datetime('now'))
+            ''', (name, idempotency_key, fingerprint, json.dumps(result)))
+    return {**result, "replayed": False}
+
+def read_transactions(name: str) -> list[dict]:
+    cursor = get_connection().execute('''
+        SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ?
+        ORDER BY id
+    ''', (name.lower(),))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def read_recent_transactions(name: str, limit: int) -> list[dict]:
+    """The last `limit` transactions, oldest first, read from the end of the index"""
+    cursor = get_connection().execute('''
+        SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), limit))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in reversed(cursor.fetchall())]
+
+def write_portfolio_value(name: str, datetime: str, value: float) -> int:
+    """Append a portfolio value and return the account's new version"""
+    with transaction(immediate=True) as conn:
+        conn.execute(
+            'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)', (name.lower(), datetime, value)
+        )
+        _add_rollups(conn, [(name.lower(), _epoch(datetime), value)])
+        conn.execute('UPDATE accounts SET version = version + 1 WHERE name = ?', (name.lower(),))
+        return conn.execute('SELECT version FROM accounts WHERE name = ?', (name.lower(),)).fetchone()[0]
+
+def read_portfolio_values(name: str) -> list[tuple[str, float]]:
+    cursor = get_connection().execute(
+        'SELECT datetime, value FROM portfolio_values WHERE name = ? ORDER BY id', (name.lower(),)
+    )
+    return cursor.fetchall()
+
+def read_value_level(name: str, resolution: int, limit: int) -> list[tuple[float, float, float, float]]:
+    """
+    The most recent `limit` points of an account's value history at one resolution, oldest first, as
+    (time, min, max, last); resolution 0 is the raw values, otherwise one of ROLLUP_RESOLUTIONS in seconds
+    """
+    conn = get_connection()
+    if resolution == 0:
+        rows = conn.execute('''
+            SELECT CAST(strftime('%s', datetime) AS REAL), value, value, value FROM portfolio_values
+            WHERE name = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (name.lower(), limit)).fetchall()
+        return rows[::-1]
+    rows = conn.execute('''
+        SELECT last_time, min, max, last FROM portfolio_rollups
+        WHERE name = ? AND resolution = ?
+        ORDER BY bucket DESC
+        LIMIT ?
+    ''', (name.lower(), resolution, limit)).fetchall()
+    return rows[::-1]
+
 def write_log(name: str, type: str, message: str):
     """
     Write a log entry to the logs table.
-    
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
+    get_connection().execute('''
+        INSERT INTO logs (name, datetime, type, message)
+        VALUES (?, datetime('now'), ?, ?)
+    ''', (name.lower(), type, message))
+
+def read_ledger_snapshot(name: str, until: str | None = None) -> tuple[int, dict] | None:
+    """The latest snapshot of an account, or the latest taken at or before `until`, as (event_id, state)"""
+    if until is None:
+        row = get_connection().execute(
+            'SELECT event_id, state FROM ledger_snapshots WHERE name = ? ORDER BY event_id DESC LIMIT 1', (name.lower(),)
+        ).fetchone()
+    else:
+        row = get_connection().execute('''
+            SELECT event_id, state FROM ledger_snapshots
+            WHERE name = ? AND timestamp <= ?
+            ORDER BY timestamp DESC, event_id DESC
+            LIMIT 1
+        ''', (name.lower(), until)).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+def read_ledger(name: str, after_id: int = 0, until: str | None = None) -> list[tuple[int, str, str, dict]]:
+    """
+    An account's ledger events after the given event id, as (id, type, timestamp, data).
+    With `until`, reading stops at the first event after that timestamp, since events are appended in time order.
+    """
+    cursor = get_connection().execute(
+        'SELECT id, type, timestamp, data FROM ledger WHERE name = ? AND id > ? ORDER BY id', (name.lower(), after_id)
+    )
+    events = []
+    for id, type, timestamp, data in cursor:
+        if until is not None and timestamp > until:
+            break
+        events.append((id, type, timestamp, json.loads(data)))
+    return events
+
+def read_account_versions() -> dict[str, int]:
+    """Every account's change counter, bumped on each write to that account"""
+    return dict(get_connection().execute('SELECT name, version FROM accounts').fetchall())
+
+def read_log_head(name: str) -> int:
+    """The id of the most recent log entry for the given name, or 0 if there are none"""
+    row = get_connection().execute('SELECT MAX(id) FROM logs WHERE name = ?', (name.lower(),)).fetchone()
+    return row[0] or 0
+
+def read_data_version() -> int:
+    """SQLite's data_version for this thread's connection, which changes whenever another connection commits"""
+    return get_connection().execute('PRAGMA data_version').fetchone()[0]
+
+def write_logs(rows: list[tuple[str, str, str, str, str | None]]) -> None:
+    """
+    Write a batch of log entries in a single transaction.
+
+    Args:
+        rows (list): Tuples of (name, datetime, type, message, trace_id), with datetime as
+            'YYYY-MM-DD HH:MM:SS' UTC and trace_id the run the entry belongs to, if any
+    """
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO logs (name, datetime, type, message, trace_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(name.lower(), dt, type, message, trace_id) for name, dt, type, message, trace_id in rows])
+
+def write_runs(rows: list[tuple]) -> None:
+    """
+    Record trader runs as they start and end, in a single transaction.
+
+    Args:
+        rows (list): Tuples of (trace_id, name, model, cycle, do_trade, started, ended), with started and
+            ended as epoch seconds; ended is None when the run starts, and fills in the run when it ends
+    """
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO runs (trace_id, name, model, cycle, do_trade, started, ended)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(trace_id) DO UPDATE SET ended = COALESCE(excluded.ended, runs.ended)
+        ''', [(trace_id, name.lower(), *rest) for trace_id, name, *rest in rows])
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
-
-def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
-
-def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    cursor = get_connection().execute('''
+        SELECT datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY datetime DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+    return reversed(cursor.fetchall())
+
+SPAN_COLUMNS = (
+    "span_id", "trace_id", "parent_id", "name", "type", "span_name", "server", "model",
+    "started", "ended", "duration", "input_tokens", "output_tokens", "error",
+)
+
+def write_spans(rows: list[tuple]) -> None:
+    """
+    Write a batch of finished spans in a single transaction.
+
+    Args:
+        rows (list): Tuples of the SPAN_COLUMNS, with started and ended as epoch seconds
+    """
+    marks = ", ".join("?" * len(SPAN_COLUMNS))
+    with transaction() as conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO spans ({', '.join(SPAN_COLUMNS)}) VALUES ({marks})",
+            [(row[0], row[1], row[2], row[3].lower(), *row[4:]) for row in rows],
+        )
+
+def read_spans(name: str, since: float | None = None, limit: int = 10_000) -> list[dict]:
+    """
+    Read the most recent finished spans for a trader.
+
+    Args:
+        name (str): The trader's name
+        since (float): Only spans started at or after this epoch time, if given
+        limit (int): The maximum number of spans to return
+
+    Returns:
+        list: Dicts of the SPAN_COLUMNS and the attributes of the run each span belongs to
+            (run_model, cycle and do_trade, or None if the run wasn't recorded), most recent first
+    """
+    columns = (*SPAN_COLUMNS, "run_model", "cycle", "do_trade")
+    cursor = get_connection().execute(f'''
+        SELECT {', '.join(f"spans.{column}" for column in SPAN_COLUMNS)}, runs.model, runs.cycle, runs.do_trade
+        FROM spans LEFT JOIN runs ON runs.trace_id = spans.trace_id
+        WHERE spans.name = ? AND spans.started >= ?
+        ORDER BY spans.started DESC
+        LIMIT ?
+    ''', (name.lower(), since or 0, limit))
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def read_log_since(name: str, last_id: int = 0, limit: int = 100):
+    """
+    Read log entries for a given name that were written after the entry with id last_id,
+    so that a caller tailing the log only ever reads new rows.
+
+    Args:
+        name (str): The name to retrieve logs for
+        last_id (int): The id of the last entry already seen; 0 to start from the most recent entries
+        limit (int): The maximum number of entries to return; if more are new, the most recent are kept
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first
+    """
+    cursor = get_connection().execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id > ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_id, limit))
+    return list(reversed(cursor.fetchall()))
+
+def prune_logs(max_age_days: float, batch_size: int = 10_000) -> int:
+    """
+    Delete log entries and spans older than max_age_days, in batches so the write lock is only held briefly.
+
+    Args:
+        max_age_days (float): Entries with a datetime older than this many days are deleted
+        batch_size (int): The maximum number of rows deleted per transaction
+
+    Returns:
+        int: The number of entries and spans deleted
+    """
+    conn = get_connection()
+    deleted = 0
+    while True:
+        cursor = conn.execute('''
+            DELETE FROM logs WHERE id IN (
+                SELECT id FROM logs WHERE datetime < datetime('now', ?) LIMIT ?
+            )
+        ''', (f"-{max_age_days} days", batch_size))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+    while True:
+        cursor = conn.execute('''
+            DELETE FROM spans WHERE span_id IN (
+                SELECT span_id FROM spans WHERE started < CAST(strftime('%s', 'now') AS REAL) - ? LIMIT ?
+            )
+        ''', (max_age_days * 86400, batch_size))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+    conn.execute('''
+        DELETE FROM runs WHERE started < CAST(strftime('%s', 'now') AS REAL) - ?
+    ''', (max_age_days * 86400,))
+    return deleted
+
+def write_prices(plan: str, prices: dict[str, float], fetched_at: float) -> None:
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO prices (symbol, plan, price, fetched_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(symbol, plan) DO UPDATE SET price=excluded.price, fetched_at=excluded.fetched_at
+        ''', [(symbol, plan, price, fetched_at) for symbol, price in prices.items()])
+
+def read_prices(plan: str, symbols: list[str]) -> dict[str, tuple[float, float]]:
+    """Cached prices for the given symbols as {symbol: (price, fetched_at)}; symbols never cached are absent"""
+    if not symbols:
+        return {}
+    placeholders = ", ".join("?" * len(symbols))
+    cursor = get_connection().execute(
+        f'SELECT symbol, price, fetched_at FROM prices WHERE plan = ? AND symbol IN ({placeholders})',
+        (plan, *symbols),
+    )
+    return {symbol: (price, fetched_at) for symbol, price, fetched_at in cursor.fetchall()}
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from typing import Callable
+from database import read_account_versions, read_log_head, read_data_version
+
+WATCH_INTERVAL_SECONDS = float(os.getenv("WATCH_INTERVAL_SECONDS", "0.5"))
+
+
+def account_topic(name: str) -> str:
+    return f"account:{name.lower()}"
+
+
+def logs_topic(name: str) -> str:
+    return f"logs:{name.lower()}"
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for change notifications.
+    Each topic carries a version counter that goes up on every publish, so a subscriber that
+    was busy can tell whether it has missed anything.
+    Callbacks run on the publishing thread; async code can await the next change with wait().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = defaultdict(int)
+        self._subscribers: dict[str, list[Callable[[str], None]]] = defaultdict(list)
+
+    def version(self, topic: str) -> int:
+        return self._versions[topic]
+
+    def subscribe(self, topic: str, callback: Callable[[str], None]) -> None:
+        with self._lock:
+            self._subscribers[topic].append(callback)
+
+    def unsubscribe(self, topic: str, callback: Callable[[str], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers[topic]:
+                self._subscribers[topic].remove(callback)
+
+    def publish(self, topic: str) -> None:
+        with self._lock:
+            self._versions[topic] += 1
+            subscribers = list(self._subscribers[topic])
+        for callback in subscribers:
+            try:
+                callback(topic)
+            except Exception as e:
+                print(f"Subscriber to {topic} failed: {e}")
+
+    async def wait(self, topic: str, seen_version: int, timeout: float | None = None) -> int:
+        """Wait until the topic has moved past seen_version (or the timeout passes), and return its version"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake(_topic):
+            loop.call_soon_threadsafe(event.set)
+
+        self.subscribe(topic, wake)
+        try:
+            if self.version(topic) == seen_version:
+                await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.unsubscribe(topic, wake)
+        return self.version(topic)
+
+
+bus = EventBus()
+
+
+class ChangeWatcher:
+    """
+    Turns database writes made by other processes (the MCP servers and the trading floor) into
+    bus notifications. It polls PRAGMA data_version, which costs no table reads, and only when
+    that moves does it look at the account versions and log heads to see which topics changed.
+    """
+
+    def __init__(self, names: list[str], event_bus: EventBus = bus, interval: float = WATCH_INTERVAL_SECONDS):
+        self.names = [name.lower() for name in names]
+        self.bus = event_bus
+        self.interval = interval
+        self.account_versions = {}
+        self.log_heads = {}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def scan(self, publish: bool = True) -> None:
+        account_versions = read_account_versions()
+        for name in self.names:
+            version = account_versions.get(name, 0)
+            if version != self.account_versions.get(name):
+                self.account_versions[name] = version
+                if publish:
+                    self.bus.publish(account_topic(name))
+            head = read_log_head(name)
+            if head != self.log_heads.get(name):
+                self.log_heads[name] = head
+                if publish:
+                    self.bus.publish(logs_topic(name))
+
+    def _run(self) -> None:
+        data_version = read_data_version()
+        self.scan(publish=False)
+        while not self._stopped.wait(self.interval):
+            try:
+                latest = read_data_version()
+                if latest != data_version:
+                    data_version = latest
+                    self.scan()
+            except Exception as e:
+                print(f"Change watcher failed: {e}")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
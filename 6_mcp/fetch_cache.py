@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# An on-disk HTTP cache for the researcher's page fetches, shared by every trader's fetch server.
+# A page fetched within FETCH_FRESH_SECONDS (or its Cache-Control max-age) is served straight from disk;
+# after that it is revalidated with If-None-Match / If-Modified-Since, and a 304 reuses both the stored body
+# and the text already extracted from it, so popular pages are neither downloaded nor converted again.
+# Responses marked Cache-Control: no-store are never written to disk.
+
+FETCH_CACHE_DB = os.getenv("FETCH_CACHE_DB", "memory/fetch_cache.db")
+FETCH_FRESH_SECONDS = float(os.getenv("FETCH_FRESH_SECONDS", "300"))
+FETCH_CACHE_RETENTION_DAYS = float(os.getenv("FETCH_CACHE_RETENTION_DAYS", "7"))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "30"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "20"))
+# The most a single fetch returns, in tokens (estimated at 4 characters each)
+FETCH_TOKEN_BUDGET = int(os.getenv("FETCH_TOKEN_BUDGET", "2000"))
+CHARS_PER_TOKEN = 4
+USER_AGENT = "ModelContextProtocol/1.0 (Autonomous; +https://github.com/modelcontextprotocol/servers)"
+BUSY_TIMEOUT_MS = 10_000
+
+_local = threading.local()
+_initialized = set()
+
+
+def get_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        directory = os.path.dirname(FETCH_CACHE_DB)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(FETCH_CACHE_DB, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if FETCH_CACHE_DB not in _initialized:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    content_type TEXT NOT NULL,
+                    encoding TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    max_age REAL,
+                    fetched_at REAL NOT NULL,
+                    validated_at REAL NOT NULL,
+                    digest TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    text TEXT
+                )
+            """)
+            if "encoding" not in {row[1] for row in conn.execute("PRAGMA table_info(pages)")}:
+                conn.execute("ALTER TABLE pages ADD COLUMN encoding TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_validated_at ON pages (validated_at)")
+            _initialized.add(FETCH_CACHE_DB)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def read_page(url: str) -> dict | None:
+    row = get_connection().execute(
+        "SELECT status, content_type, encoding, etag, last_modified, max_age, validated_at, digest, body, text "
+        "FROM pages WHERE url = ?",
+        (url,),
+    ).fetchone()
+    if row is None:
+        return None
+    status, content_type, encoding, etag, last_modified, max_age, validated_at, digest, body, text = row
+    return {
+        "status": status,
+        "content_type": content_type,
+        "encoding": encoding or "utf-8",
+        "etag": etag,
+        "last_modified": last_modified,
+        "max_age": max_age,
+        "validated_at": validated_at,
+        "digest": digest,
+        "body": zlib.decompress(body),
+        "text": text,
+    }
+
+
+def write_page(url: str, page: dict) -> None:
+    now = time.time()
+    get_connection().execute(
+        """
+        INSERT INTO pages (url, status, content_type, encoding, etag, last_modified, max_age, fetched_at, validated_at,
+                           digest, body, text)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+        ON CONFLICT (url) DO UPDATE SET
+            status = excluded.status, content_type = excluded.content_type, encoding = excluded.encoding,
+            etag = excluded.etag,
+            last_modified = excluded.last_modified, max_age = excluded.max_age, fetched_at = excluded.fetched_at,
+            validated_at = excluded.validated_at, digest = excluded.digest, body = excluded.body,
+            text = CASE WHEN pages.digest = excluded.digest THEN pages.text END
+        """,
+        (
+            url, page["status"], page["content_type"], page["encoding"], page["etag"], page["last_modified"], page["max_age"],
+            now, now, page["digest"], zlib.compress(page["body"]),
+        ),
+    )
+
+
+def touch_page(url: str, max_age: float | None) -> None:
+    """Record a successful revalidation"""
+    get_connection().execute(
+        "UPDATE pages SET validated_at = ?, max_age = COALESCE(?, max_age) WHERE url = ?", (time.time(), max_age, url)
+    )
+
+
+def delete_page(url: str) -> None:
+    get_connection().execute("DELETE FROM pages WHERE url = ?", (url,))
+
+
+def write_text(url: str, digest: str, text: str) -> None:
+    get_connection().execute("UPDATE pages SET text = ? WHERE url = ? AND digest = ?", (text, url, digest))
+
+
+def prune_pages(retention_days: float = FETCH_CACHE_RETENTION_DAYS) -> int:
+    cutoff = time.time() - retention_days * 86400
+    return get_connection().execute("DELETE FROM pages WHERE validated_at < ?", (cutoff,)).rowcount
+
+
+def cache_lifetime(headers: httpx.Headers) -> float | None:
+    """Seconds the response may be reused without revalidating, from Cache-Control; 0 for no-cache or no-store"""
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0.0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return float(match.group(1)) if match else None
+
+
+def is_storable(headers: httpx.Headers) -> bool:
+    """False for a response that Cache-Control: no-store says mustn't be kept"""
+    return "no-store" not in headers.get("cache-control", "").lower()
+
+
+def is_fresh(page: dict) -> bool:
+    lifetime = page["max_age"] if page["max_age"] is not None else FETCH_FRESH_SECONDS
+    return time.time() - page["validated_at"] < lifetime
+
+
+def decode(body: bytes, encoding: str) -> str:
+    try:
+        return body.decode(encoding, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def extract(body: bytes, content_type: str, encoding: str = "utf-8") -> str:
+    """
+    The readable text of a page, decoded with the response's charset: the main content of HTML as markdown when
+    readabilipy and markdownify are installed, otherwise the visible text from BeautifulSoup;
+    other content types are returned as text
+    """
+    text = decode(body, encoding)
+    if "html" not in content_type and not text.lstrip()[:100].lower().startswith(("<!doctype html", "<html")):
+        return text
+    try:
+        from readabilipy.simple_json import simple_json_from_html_string
+        from markdownify import markdownify
+
+        article = simple_json_from_html_string(text, use_readability=False)
+        if article.get("content"):
+            return re.sub(r"\n{3,}", "\n\n", markdownify(article["content"], heading_style="ATX")).strip()
+    except ImportError:
+        pass
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, "html.parser")
+    for tag in soup(["script", "style", "noscript", "nav", "header", "footer", "aside", "form"]):
+        tag.decompose()
+    lines = (line.strip() for line in soup.get_text("\n").splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def truncate(text: str, start_index: int, max_length: int) -> tuple[str, int | None]:
+    """
+    Up to max_length characters of text from start_index, ending at a line or word break where possible,
+    and the index to continue from (None at the end)
+    """
+    end = start_index + max_length
+    if end >= len(text):
+        return text[start_index:], None
+    cut = text.rfind("\n", start_index + max_length // 2, end)
+    if cut < 0:
+        cut = text.rfind(" ", start_index + max_length // 2, end)
+    if cut < 0:
+        cut = end
+    return text[start_index:cut], cut
+
+
+class Fetcher:
+    """Fetches pages through the on-disk cache over one pooled client; keeps counts of how each fetch was served"""
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=FETCH_TIMEOUT_SECONDS,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=FETCH_MAX_CONNECTIONS, max_keepalive_connections=FETCH_MAX_CONNECTIONS),
+        )
+        self.counts = {"fresh": 0, "revalidated": 0, "downloaded": 0, "extracted": 0}
+
+    async def page(self, url: str) -> dict:
+        """The page from the cache if it is fresh or still valid, otherwise downloaded and stored"""
+        cached = read_page(url)
+        if cached and is_fresh(cached):
+            self.counts["fresh"] += 1
+            return cached
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        response = await self.client.get(url, headers=headers)
+        if cached and response.status_code == 304:
+            touch_page(url, cache_lifetime(response.headers))
+            self.counts["revalidated"] += 1
+            return cached
+        if response.status_code >= 400:
+            raise ValueError(f"Failed to fetch {url} - status code {response.status_code}")
+        page = {
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", ""),
+            # the charset from Content-Type, or httpx's default when there isn't one
+            "encoding": response.encoding or "utf-8",
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "max_age": cache_lifetime(response.headers),
+            "digest": hashlib.sha1(response.content).hexdigest(),
+            "body": response.content,
+            "text": None,
+        }
+        self.counts["downloaded"] += 1
+        if not is_storable(response.headers):
+            page["stored"] = False
+            if cached:
+                delete_page(url)
+            return page
+        if cached and cached["digest"] == page["digest"]:
+            page["text"] = cached["text"]
+        write_page(url, page)
+        return page
+
+    async def text(self, url: str, raw: bool = False) -> str:
+        page = await self.page(url)
+        if raw:
+            return decode(page["body"], page["encoding"])
+        if page["text"] is None:
+            page["text"] = await asyncio.to_thread(extract, page["body"], page["content_type"], page["encoding"])
+            if page.get("stored", True):
+                write_text(url, page["digest"], page["text"])
+            self.counts["extracted"] += 1
+        return page["text"]
+
+    async def close(self) -> None:
+        await self.client.aclose()
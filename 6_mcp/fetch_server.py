@@ -0,0 +1,40 @@
+import os
+from dotenv import load_dotenv
+from mcp.server.fastmcp import FastMCP
+from fetch_cache import Fetcher, FETCH_TOKEN_BUDGET, CHARS_PER_TOKEN, prune_pages, truncate
+
+load_dotenv(override=True)
+
+# A drop-in for mcp-server-fetch, with the same tool and arguments, fetching through the shared on-disk cache.
+# Unlike mcp-server-fetch it doesn't check robots.txt: the researcher only reads pages a search turned up.
+
+mcp = FastMCP("fetch_server")
+fetcher = None
+
+
+@mcp.tool()
+async def fetch(url: str, max_length: int = 5000, start_index: int = 0, raw: bool = False) -> str:
+    """Fetches a URL from the internet and extracts its contents as markdown.
+
+    Args:
+        url: the URL to fetch
+        max_length: the most characters to return
+        start_index: the character to start from, to continue reading a page that was cut off
+        raw: get the raw page content, without simplifying it to markdown
+    """
+    global fetcher
+    if fetcher is None:
+        fetcher = Fetcher()
+    text = await fetcher.text(url, raw)
+    if start_index >= len(text):
+        return "<error>No more content available.</error>"
+    content, next_start = truncate(text, start_index, min(max_length, FETCH_TOKEN_BUDGET * CHARS_PER_TOKEN))
+    if next_start is not None:
+        content += f"\n\n<error>Content truncated. Call the fetch tool with a start_index of {next_start} to get more content.</error>"
+    return f"Contents of {url}:\n{content}"
+
+
+if __name__ == "__main__":
+    prune_pages()
+    # Always stdio: each researcher runs its own server over the shared cache file
+    mcp.run(transport="stdio")
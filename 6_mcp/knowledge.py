@@ -0,0 +1,299 @@
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# The researchers' knowledge graph: entities with observations, and typed relations between them.
+# Every trader's graph lives in one SQLite file, kept apart by namespace, with a full-text index over
+# entity names, types and observations so that searches are local queries taking milliseconds.
+
+MEMORY_DB = os.getenv("MEMORY_DB", "memory/knowledge.db")
+BUSY_TIMEOUT_MS = 10_000
+SEARCH_LIMIT = int(os.getenv("MEMORY_SEARCH_LIMIT", "20"))
+
+_local = threading.local()
+_initialized = set()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    entity_type TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    UNIQUE (namespace, name)
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    entity_id INTEGER NOT NULL REFERENCES entities(id) ON DELETE CASCADE,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (entity_id, content)
+);
+CREATE TABLE IF NOT EXISTS relations (
+    id INTEGER PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    relation_type TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (namespace, source, target, relation_type)
+);
+CREATE INDEX IF NOT EXISTS idx_relations_namespace_target ON relations (namespace, target);
+CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, namespace TEXT NOT NULL, imported_at TEXT NOT NULL);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS entities_fts USING fts5(
+    name, entity_type, content='entities', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS observations_fts USING fts5(
+    content, content='observations', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS entities_ai AFTER INSERT ON entities BEGIN
+    INSERT INTO entities_fts (rowid, name, entity_type) VALUES (new.id, new.name, new.entity_type);
+END;
+CREATE TRIGGER IF NOT EXISTS entities_ad AFTER DELETE ON entities BEGIN
+    INSERT INTO entities_fts (entities_fts, rowid, name, entity_type) VALUES ('delete', old.id, old.name, old.entity_type);
+END;
+CREATE TRIGGER IF NOT EXISTS entities_au AFTER UPDATE OF name, entity_type ON entities BEGIN
+    INSERT INTO entities_fts (entities_fts, rowid, name, entity_type) VALUES ('delete', old.id, old.name, old.entity_type);
+    INSERT INTO entities_fts (rowid, name, entity_type) VALUES (new.id, new.name, new.entity_type);
+END;
+CREATE TRIGGER IF NOT EXISTS observations_ai AFTER INSERT ON observations BEGIN
+    INSERT INTO observations_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS observations_ad AFTER DELETE ON observations BEGIN
+    INSERT INTO observations_fts (observations_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_connection() -> sqlite3.Connection:
+    """The pooled connection for the current thread, in WAL mode so every trader's server can share the file"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        directory = os.path.dirname(MEMORY_DB)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(MEMORY_DB, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if MEMORY_DB not in _initialized:
+            conn.executescript(SCHEMA)
+            _initialized.add(MEMORY_DB)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def transaction():
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def upsert_entities(namespace: str, entities: list[dict]) -> dict:
+    """
+    Create entities ({"name", "entityType", "observations"}), or add to them if they exist:
+    a new type replaces the old one, and observations already recorded are skipped
+    """
+    now = _now()
+    created = observations = 0
+    with transaction() as conn:
+        for entity in entities:
+            cursor = conn.execute(
+                "INSERT INTO entities (namespace, name, entity_type, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (namespace, name) DO NOTHING",
+                (namespace, entity["name"], entity["entityType"], now, now),
+            )
+            created += cursor.rowcount
+            entity_id, entity_type = conn.execute(
+                "SELECT id, entity_type FROM entities WHERE namespace = ? AND name = ?", (namespace, entity["name"])
+            ).fetchone()
+            if entity_type != entity["entityType"]:
+                conn.execute(
+                    "UPDATE entities SET entity_type = ?, updated_at = ? WHERE id = ?", (entity["entityType"], now, entity_id)
+                )
+            observations += _add_observations(conn, entity_id, entity.get("observations", []), now)
+    return {"entities": len(entities), "created": created, "observations_added": observations}
+
+
+def _add_observations(conn: sqlite3.Connection, entity_id: int, contents: list[str], now: str) -> int:
+    added = conn.executemany(
+        "INSERT OR IGNORE INTO observations (entity_id, content, created_at) VALUES (?, ?, ?)",
+        [(entity_id, content, now) for content in contents],
+    ).rowcount
+    if added:
+        conn.execute("UPDATE entities SET updated_at = ? WHERE id = ?", (now, entity_id))
+    return added
+
+
+def add_observations(namespace: str, observations: list[dict]) -> dict:
+    """Add observations ({"entityName", "contents"}) to existing entities; unknown entities are reported back"""
+    now = _now()
+    added = 0
+    missing = []
+    with transaction() as conn:
+        for item in observations:
+            row = conn.execute(
+                "SELECT id FROM entities WHERE namespace = ? AND name = ?", (namespace, item["entityName"])
+            ).fetchone()
+            if row is None:
+                missing.append(item["entityName"])
+            else:
+                added += _add_observations(conn, row[0], item["contents"], now)
+    return {"observations_added": added, "missing_entities": missing}
+
+
+def upsert_relations(namespace: str, relations: list[dict]) -> dict:
+    """Create relations ({"source", "target", "type"}), skipping any that already exist"""
+    now = _now()
+    with transaction() as conn:
+        created = conn.executemany(
+            "INSERT OR IGNORE INTO relations (namespace, source, target, relation_type, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(namespace, relation["source"], relation["target"], relation["type"], now) for relation in relations],
+        ).rowcount
+    return {"relations": len(relations), "created": created}
+
+
+def delete_entity(namespace: str, name: str) -> bool:
+    """Delete an entity with its observations and every relation to or from it"""
+    with transaction() as conn:
+        deleted = conn.execute("DELETE FROM entities WHERE namespace = ? AND name = ?", (namespace, name)).rowcount
+        conn.execute(
+            "DELETE FROM relations WHERE namespace = ? AND (source = ? OR target = ?)", (namespace, name, name)
+        )
+    return bool(deleted)
+
+
+def delete_relation(namespace: str, source: str, target: str, type: str) -> bool:
+    with transaction() as conn:
+        deleted = conn.execute(
+            "DELETE FROM relations WHERE namespace = ? AND source = ? AND target = ? AND relation_type = ?",
+            (namespace, source, target, type),
+        ).rowcount
+    return bool(deleted)
+
+
+def _match_expression(query: str) -> str:
+    """An FTS5 query matching any of the words in free text, each quoted so punctuation can't break the syntax"""
+    words = re.findall(r"\w+", query.lower())
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+def _graph(conn: sqlite3.Connection, namespace: str, entity_ids: list[int]) -> dict:
+    """The entities with these ids, in order, with their observations and the relations among them"""
+    if not entity_ids:
+        return {"entities": [], "relations": []}
+    marks = ",".join("?" * len(entity_ids))
+    rows = conn.execute(f"SELECT id, name, entity_type FROM entities WHERE id IN ({marks})", entity_ids).fetchall()
+    by_id = {row[0]: {"name": row[1], "entityType": row[2], "observations": []} for row in rows}
+    for entity_id, content in conn.execute(
+        f"SELECT entity_id, content FROM observations WHERE entity_id IN ({marks}) ORDER BY id", entity_ids
+    ):
+        by_id[entity_id]["observations"].append(content)
+    names = [entity["name"] for entity in by_id.values()]
+    name_marks = ",".join("?" * len(names))
+    relations = conn.execute(
+        f"SELECT source, target, relation_type FROM relations WHERE namespace = ? "
+        f"AND source IN ({name_marks}) AND target IN ({name_marks}) ORDER BY id",
+        [namespace, *names, *names],
+    ).fetchall()
+    return {
+        "entities": [by_id[entity_id] for entity_id in entity_ids if entity_id in by_id],
+        "relations": [{"source": source, "target": target, "type": type} for source, target, type in relations],
+    }
+
+
+def search(namespace: str, query: str, limit: int = SEARCH_LIMIT) -> dict:
+    """Entities whose name, type or observations match any word of the query, best matches first"""
+    expression = _match_expression(query)
+    if not expression:
+        return {"entities": [], "relations": []}
+    conn = get_connection()
+    rows = conn.execute(
+        """
+        SELECT entities.id, MIN(matches.rank) AS best FROM (
+            SELECT rowid AS entity_id, bm25(entities_fts, 10.0, 5.0) AS rank
+            FROM entities_fts WHERE entities_fts MATCH ?
+            UNION ALL
+            SELECT observations.entity_id, bm25(observations_fts) AS rank
+            FROM observations_fts JOIN observations ON observations.id = observations_fts.rowid
+            WHERE observations_fts MATCH ?
+        ) AS matches JOIN entities ON entities.id = matches.entity_id
+        WHERE entities.namespace = ?
+        GROUP BY entities.id ORDER BY best LIMIT ?
+        """,
+        (expression, expression, namespace, limit),
+    ).fetchall()
+    return _graph(conn, namespace, [row[0] for row in rows])
+
+
+def open_nodes(namespace: str, names: list[str]) -> dict:
+    conn = get_connection()
+    marks = ",".join("?" * len(names))
+    rows = conn.execute(
+        f"SELECT id FROM entities WHERE namespace = ? AND name IN ({marks})", [namespace, *names]
+    ).fetchall()
+    return _graph(conn, namespace, [row[0] for row in rows])
+
+
+def read_graph(namespace: str, limit: int = SEARCH_LIMIT) -> dict:
+    """The most recently updated entities, and the relations among them"""
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT id FROM entities WHERE namespace = ? ORDER BY updated_at DESC, id DESC LIMIT ?", (namespace, limit)
+    ).fetchall()
+    return _graph(conn, namespace, [row[0] for row in rows])
+
+
+def import_libsql(path: str, namespace: str) -> bool:
+    """
+    Copy a knowledge graph written by mcp-memory-libsql into a namespace, once;
+    returns True if anything was imported
+    """
+    if not os.path.exists(path):
+        return False
+    conn = get_connection()
+    if conn.execute("SELECT 1 FROM imports WHERE path = ?", (os.path.abspath(path),)).fetchone():
+        return False
+    source = sqlite3.connect(path)
+    try:
+        entities = {
+            name: {"name": name, "entityType": entity_type, "observations": []}
+            for name, entity_type in source.execute("SELECT name, entity_type FROM entities")
+        }
+        for name, content in source.execute("SELECT entity_name, content FROM observations ORDER BY id"):
+            if name in entities:
+                entities[name]["observations"].append(content)
+        relations = [
+            {"source": source_name, "target": target, "type": type}
+            for source_name, target, type in source.execute("SELECT source, target, relation_type FROM relations")
+        ]
+    except sqlite3.Error as e:
+        print(f"Could not import {path}: {e}")
+        return False
+    finally:
+        source.close()
+    upsert_entities(namespace, list(entities.values()))
+    upsert_relations(namespace, relations)
+    conn.execute(
+        "INSERT INTO imports (path, namespace, imported_at) VALUES (?, ?, ?)", (os.path.abspath(path), namespace, _now())
+    )
+    return bool(entities or relations)
@@ -0,0 +1,69 @@
+import copy
+import pnl
+from database import read_ledger, read_ledger_snapshot
+
+# The ledger is the append-only history of every change to every account:
+#   reset     - the whole state is replaced, as when an account is created or reset
+#   deposit   - {"amount"} added to the balance
+#   withdraw  - {"amount"} taken from the balance
+#   buy, sell - {"symbol", "quantity", "price", "rationale"}, with a negative quantity for a sale
+#   strategy  - {"strategy"} replaces the strategy
+#   update    - {"balance", "strategy"} set directly
+# Replaying events over a state gives the state after them; snapshots taken along the way mean that
+# rebuilding the latest state, or the state at any past moment, only replays a short tail of events.
+
+EMPTY_STATE = {"balance": 0.0, "strategy": "", "holdings": {}, "realized_pnl": 0.0, "transaction_count": 0}
+
+
+def apply_event(state: dict, type: str, data: dict) -> dict:
+    """Apply one event to a state in place, and return it"""
+    if type == "reset":
+        state.clear()
+        state.update(copy.deepcopy(data))
+    elif type == "deposit":
+        state["balance"] += data["amount"]
+    elif type == "withdraw":
+        state["balance"] -= data["amount"]
+    elif type in ("buy", "sell"):
+        symbol, quantity, price = data["symbol"], data["quantity"], data["price"]
+        quantity_held, cost = state["holdings"].get(symbol, (0, 0.0))
+        quantity_held, cost, realized = pnl.apply_trade(quantity_held, cost, quantity, price)
+        if quantity_held:
+            state["holdings"][symbol] = [quantity_held, cost]
+        else:
+            state["holdings"].pop(symbol, None)
+        state["balance"] -= quantity * price
+        state["realized_pnl"] += realized
+        state["transaction_count"] += 1
+    elif type == "strategy":
+        state["strategy"] = data["strategy"]
+    elif type == "update":
+        state["balance"], state["strategy"] = data["balance"], data["strategy"]
+    else:
+        raise ValueError(f"Unknown ledger event {type}")
+    return state
+
+
+def replay(state: dict, events: list[tuple[int, str, str, dict]]) -> dict:
+    for _, type, _, data in events:
+        apply_event(state, type, data)
+    return state
+
+
+def load_state(name: str, until: str | None = None) -> dict | None:
+    """
+    Rebuild an account's state from the latest snapshot and the events after it, or as it was
+    at a "%Y-%m-%d %H:%M:%S" timestamp; None if the account didn't exist yet
+    """
+    snapshot = read_ledger_snapshot(name, until)
+    event_id, state = snapshot if snapshot else (0, None)
+    events = read_ledger(name, event_id, until)
+    if state is None and not events:
+        return None
+    return replay(state or copy.deepcopy(EMPTY_STATE), events)
+
+
+def replay_all(name: str) -> dict | None:
+    """Rebuild an account's latest state from its very first event, ignoring snapshots"""
+    events = read_ledger(name)
+    return replay(copy.deepcopy(EMPTY_STATE), events) if events else None
@@ -0,0 +1,130 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from database import write_logs, write_runs, write_spans
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_MS = int(os.getenv("LOG_FLUSH_MS", "250"))
+
+_STOP = object()
+
+
+class LogSink:
+    """
+    A buffered log writer: callers enqueue entries without touching the database, and a
+    background thread drains the bounded queue into batched inserts every LOG_FLUSH_MS
+    or every LOG_BATCH_SIZE records, whichever comes first.
+    When the queue is full, new entries are dropped and counted rather than blocking the caller.
+    Finished spans go through the same queue, and are written alongside the log entries in each batch.
+    """
+
+    def __init__(self, max_queue=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, flush_ms=LOG_FLUSH_MS):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.queued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+                    self._thread.start()
+
+    def _put(self, kind: str, row: tuple) -> None:
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((kind, row))
+            self.queued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def write(self, name: str, type: str, message: str, trace_id: str | None = None) -> None:
+        """Enqueue a log entry, timestamped now in the same format as SQLite's datetime('now')"""
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self._put("log", (name, now, type, message, trace_id))
+
+    def write_span(self, row: tuple) -> None:
+        """Enqueue a finished span, as a tuple of database.SPAN_COLUMNS"""
+        self._put("span", row)
+
+    def write_run(self, row: tuple) -> None:
+        """Enqueue the start or end of a run, as a row for database.write_runs"""
+        self._put("run", row)
+
+    def _write_batch(self, batch: list) -> None:
+        if not batch:
+            return
+        try:
+            runs = [row for kind, row in batch if kind == "run"]
+            logs = [row for kind, row in batch if kind == "log"]
+            spans = [row for kind, row in batch if kind == "span"]
+            if runs:
+                write_runs(runs)
+            if logs:
+                write_logs(logs)
+            if spans:
+                write_spans(spans)
+            self.flushed += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Log sink failed to write {len(batch)} records: {e}")
+        batch.clear()
+
+    def _run(self) -> None:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if isinstance(item, tuple):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            self._write_batch(batch)
+            deadline = time.monotonic() + self.flush_interval
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far has been written; returns False on timeout"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Flush outstanding records and stop the background writer"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict[str, int]:
+        """Counters for monitoring backpressure: records queued, dropped, flushed, failed, and currently pending"""
+        return {
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "pending": self.queue.qsize(),
+        }
@@ -1,11 +1,15 @@
 from polygon import RESTClient
 from dotenv import load_dotenv
+import asyncio
+import httpx
+import json
 import os
+import threading
 from datetime import datetime
 import random
-from database import write_market, read_market
-from functools import lru_cache
 from datetime import timezone
+from price_cache import PriceCache
+from market_calendar import MarketCalendar
 
 load_dotenv(override=True)
 
@@ -15,16 +19,75 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+POLYGON_BASE_URL = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
+POLYGON_MAX_CONNECTIONS = int(os.getenv("POLYGON_MAX_CONNECTIONS", "10"))
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+_async_client_loop = None
+market_calendar = MarketCalendar()
+_price_source = None
+
+
+def get_client() -> RESTClient:
+    """The process-wide Polygon client, created on first use so its connection pool is kept alive between calls"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RESTClient(polygon_api_key, base=POLYGON_BASE_URL, num_pools=POLYGON_MAX_CONNECTIONS)
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """A keep-alive httpx client for Polygon's REST API, for use inside the asyncio trading loop"""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            base_url=POLYGON_BASE_URL,
+            headers={"Authorization": f"Bearer {polygon_api_key}"},
+            limits=httpx.Limits(max_connections=POLYGON_MAX_CONNECTIONS, max_keepalive_connections=POLYGON_MAX_CONNECTIONS),
+            timeout=10.0,
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Close the keep-alive httpx client and its pooled connections, when the trading loop shuts down"""
+    global _async_client, _async_client_loop
+    if _async_client is not None and _async_client_loop is asyncio.get_running_loop():
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
-    market_status = client.get_market_status()
-    return market_status.market == "open"
+    if market_calendar.is_stale():
+        client = get_client()
+        status = json.loads(client.get_market_status(raw=True).data)
+        holidays = json.loads(client.get_market_holidays(raw=True).data)
+        return market_calendar.update(status, holidays)
+    return market_calendar.is_open()
+
+
+async def is_market_open_async() -> bool:
+    if market_calendar.is_stale():
+        client = get_async_client()
+        status, holidays = await asyncio.gather(
+            client.get("/v1/marketstatus/now"), client.get("/v1/marketstatus/upcoming")
+        )
+        status.raise_for_status()
+        holidays.raise_for_status()
+        return market_calendar.update(status.json(), holidays.json())
+    return market_calendar.is_open()
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
@@ -33,38 +96,47 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
     return {result.ticker: result.close for result in results}
 
 
-@lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    """One snapshot request for every symbol, rather than a request per symbol"""
+    client = get_client()
+    results = client.get_snapshot_all("stocks", tickers=symbols)
+    prices = {symbol: 0.0 for symbol in symbols}
+    for result in results:
+        prices[result.ticker] = result.min.close or result.prev_day.close
+    return prices
 
 
-def get_share_price_polygon_eod(symbol) -> float:
-    today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+if is_realtime_polygon:
+    price_cache = PriceCache("realtime", get_share_prices_polygon_min)
+elif is_paid_polygon:
+    price_cache = PriceCache("delayed", get_share_prices_polygon_min)
+else:
+    price_cache = PriceCache("eod", lambda symbols: get_all_share_prices_polygon_eod(), complete=True)
 
 
-def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
-    result = client.get_snapshot_ticker("stocks", symbol)
-    return result.min.close or result.prev_day.close
+def set_price_source(source) -> None:
+    """
+    Answer every price lookup with source(symbols) -> {symbol: price} instead of the live market,
+    as the backtester does with recorded bars; None goes back to the live market
+    """
+    global _price_source
+    _price_source = source
 
 
-def get_share_price_polygon(symbol) -> float:
-    if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
-    else:
-        return get_share_price_polygon_eod(symbol)
+def get_share_price(symbol) -> float:
+    return get_share_prices([symbol])[symbol]
 
 
-def get_share_price(symbol) -> float:
+def get_share_prices(symbols: list[str]) -> dict[str, float]:
+    """Look up the prices of many symbols at once, through the price cache"""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    if _price_source is not None:
+        return _price_source(symbols)
     if polygon_api_key:
         try:
-            return get_share_price_polygon(symbol)
+            return price_cache.get_prices(symbols)
         except Exception as e:
-            print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+            print(f"Was not able to use the polygon API due to {e}; using random numbers")
+    return {symbol: float(random.randint(1, 100)) for symbol in symbols}
@@ -0,0 +1,55 @@
+import os
+import time
+from datetime import datetime, time as clock
+from zoneinfo import ZoneInfo
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = clock(9, 30)
+MARKET_CLOSE = clock(16, 0)
+MARKET_STATUS_REFRESH_SECONDS = float(os.getenv("MARKET_STATUS_REFRESH_SECONDS", "21600"))
+
+
+class MarketCalendar:
+    """
+    A cached view of Polygon's market status: the live status and the upcoming holidays
+    are fetched occasionally, and between refreshes open/closed is worked out locally
+    from regular trading hours, weekends, holidays and early closes.
+    """
+
+    def __init__(self, refresh_seconds: float = MARKET_STATUS_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.refreshed_at = None
+        self.closed_dates: set[str] = set()
+        self.early_closes: dict[str, clock] = {}
+
+    def is_stale(self) -> bool:
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.refresh_seconds
+
+    def update(self, status: dict, holidays: list[dict]) -> bool:
+        """
+        Load the responses from /v1/marketstatus/now and /v1/marketstatus/upcoming,
+        and return whether the market is open according to the live status
+        """
+        self.closed_dates = set()
+        self.early_closes = {}
+        for holiday in holidays:
+            if holiday.get("exchange") not in (None, "NYSE"):
+                continue
+            if holiday.get("status") == "early-close" and holiday.get("close"):
+                close = datetime.fromisoformat(holiday["close"].replace("Z", "+00:00"))
+                self.early_closes[holiday["date"]] = close.astimezone(MARKET_TIMEZONE).time()
+            else:
+                self.closed_dates.add(holiday["date"])
+        self.refreshed_at = time.monotonic()
+        return status.get("market") == "open"
+
+    def is_open_at(self, when: datetime) -> bool:
+        local = when.astimezone(MARKET_TIMEZONE)
+        day = local.date().isoformat()
+        if local.weekday() >= 5 or day in self.closed_dates:
+            return False
+        close = self.early_closes.get(day, MARKET_CLOSE)
+        return MARKET_OPEN <= local.time() < close
+
+    def is_open(self) -> bool:
+        return self.is_open_at(datetime.now(MARKET_TIMEZONE))
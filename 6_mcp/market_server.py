@@ -1,7 +1,9 @@
+import asyncio
 from mcp.server.fastmcp import FastMCP
 from market import get_share_price
+from mcp_transport import MCP_TRANSPORT, server_settings
 
-mcp = FastMCP("market_server")
+mcp = FastMCP("market_server", **server_settings("market_server"))
 
 @mcp.tool()
 async def lookup_share_price(symbol: str) -> float:
@@ -10,7 +12,7 @@ async def lookup_share_price(symbol: str) -> float:
     Args:
         symbol: the symbol of the stock
     """
-    return get_share_price(symbol)
+    return await asyncio.to_thread(get_share_price, symbol)
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    mcp.run(transport=MCP_TRANSPORT)
\ No newline at end of file
@@ -1,11 +1,16 @@
 import os
 from dotenv import load_dotenv
 from market import is_paid_polygon, is_realtime_polygon
+from mcp_transport import is_network_transport, server_url
 
 load_dotenv(override=True)
 
 brave_env = {"BRAVE_API_KEY": os.getenv("BRAVE_API_KEY")}
 polygon_api_key = os.getenv("POLYGON_API_KEY")
+# One knowledge graph database shared by every researcher, with a namespace per trader
+MEMORY_DB = os.path.abspath(os.getenv("MEMORY_DB", "memory/knowledge.db"))
+# And one cache of fetched pages
+FETCH_CACHE_DB = os.path.abspath(os.getenv("FETCH_CACHE_DB", "memory/fetch_cache.db"))
 
 # The MCP server for the Trader to read Market Data
 
@@ -15,32 +20,44 @@ if is_paid_polygon or is_realtime_polygon:
         "args": ["--from", "git+https://github.com/polygon-io/mcp_polygon@v0.1.0", "mcp_polygon"],
         "env": {"POLYGON_API_KEY": polygon_api_key},
     }
+elif is_network_transport:
+    market_mcp = {"url": server_url("market_server")}
 else:
     market_mcp = {"command": "uv", "args": ["run", "market_server.py"]}
 
 
 # The full set of MCP servers for the trader: Accounts, Push Notification and the Market
+# With MCP_TRANSPORT set to sse or streamable-http, these connect to shared server processes instead
 
-trader_mcp_server_params = [
-    {"command": "uv", "args": ["run", "accounts_server.py"]},
-    {"command": "uv", "args": ["run", "push_server.py"]},
-    market_mcp,
-]
+if is_network_transport:
+    trader_mcp_server_params = [
+        {"url": server_url("accounts_server")},
+        {"url": server_url("push_server")},
+        market_mcp,
+    ]
+else:
+    trader_mcp_server_params = [
+        {"command": "uv", "args": ["run", "accounts_server.py"]},
+        {"command": "uv", "args": ["run", "push_server.py"]},
+        market_mcp,
+    ]
 
 # The full set of MCP servers for the researcher: Fetch, Brave Search and Memory
+# They are the same for every trader, so a pool runs one of each; the memory server keeps each trader's
+# knowledge graph in its own namespace, which the trader binds with NamespacedServer
 
 
 def researcher_mcp_server_params(name: str):
     return [
-        {"command": "uvx", "args": ["mcp-server-fetch"]},
+        {"command": "uv", "args": ["run", "fetch_server.py"], "env": {"FETCH_CACHE_DB": FETCH_CACHE_DB}},
         {
             "command": "npx",
             "args": ["-y", "@modelcontextprotocol/server-brave-search"],
             "env": brave_env,
         },
         {
-            "command": "npx",
-            "args": ["-y", "mcp-memory-libsql"],
-            "env": {"LIBSQL_URL": f"file:./memory/{name}.db"},
+            "command": "uv",
+            "args": ["run", "memory_server.py"],
+            "env": {"MEMORY_DB": MEMORY_DB, "LEGACY_MEMORY_DIR": os.path.abspath("memory")},
         },
     ]
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from agents.mcp import MCPServer
+from mcp_transport import mcp_server
+from mcp_params import trader_mcp_server_params, researcher_mcp_server_params
+
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+
+
+def server_key(params: dict) -> str:
+    """Servers launched with identical parameters are interchangeable, so they share one process"""
+    return json.dumps(params, sort_keys=True)
+
+
+class MCPServerPool:
+    """
+    Long-lived MCP servers for the whole trading floor.
+    Each distinct server is started once and shared by every trader that needs it; servers whose
+    parameters are specific to a trader would naturally get their own.
+    The stdio transport ties each subprocess to the task that connected it, so every server connection
+    lives in its own task, and traders only lease them. Over a network transport, the pool holds one
+    client connection per shared server process.
+    """
+
+    def __init__(self, client_session_timeout_seconds: float = 120):
+        self.timeout = client_session_timeout_seconds
+        self.servers: dict[str, MCPServer] = {}
+        self.params: dict[str, dict] = {}
+        self.leases: dict[str, int] = {}
+        self.starts = 0
+        self.startup_seconds = 0.0
+        self.last_startup_seconds: dict[str, float] = {}
+        self.unhealthy: set[str] = set()
+        self._tasks: dict[str, tuple[asyncio.Task, asyncio.Event]] = {}
+        self._lock = asyncio.Lock()
+
+    def server_params(self, name: str) -> tuple[list[dict], list[dict]]:
+        return trader_mcp_server_params, researcher_mcp_server_params(name)
+
+    async def _serve(self, key: str, ready: asyncio.Future, stop: asyncio.Event) -> None:
+        server = mcp_server(
+            self.params[key], cache_tools_list=True, client_session_timeout_seconds=self.timeout
+        )
+        try:
+            await server.connect()
+        except Exception as e:
+            # connect() may have got as far as launching the subprocess or opening the session
+            try:
+                await server.cleanup()
+            except Exception as cleanup_error:
+                print(f"Error cleaning up MCP server {self.params[key].get('command')}: {cleanup_error}")
+            ready.set_exception(e)
+            return
+        ready.set_result(server)
+        try:
+            await stop.wait()
+        finally:
+            await server.cleanup()
+
+    async def _start(self, key: str) -> None:
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        start = time.perf_counter()
+        task = asyncio.create_task(self._serve(key, ready, stop))
+        server = await ready
+        elapsed = time.perf_counter() - start
+        self._tasks[key] = (task, stop)
+        self.servers[key] = server
+        self.starts += 1
+        self.startup_seconds += elapsed
+        self.last_startup_seconds[key] = elapsed
+
+    async def _stop(self, key: str) -> None:
+        self.servers.pop(key, None)
+        task, stop = self._tasks.pop(key, (None, None))
+        if task:
+            stop.set()
+            try:
+                await task
+            except Exception as e:
+                print(f"Error stopping MCP server {self.params[key].get('command')}: {e}")
+
+    async def start(self, names: list[str]) -> None:
+        """Start every server that the given traders will need and that isn't already running, concurrently"""
+        async with self._lock:
+            for name in names:
+                trader_params, researcher_params = self.server_params(name)
+                for params in [*trader_params, *researcher_params]:
+                    self.params.setdefault(server_key(params), params)
+            results = await asyncio.gather(
+                *[self._start(key) for key in self.params if key not in self.servers], return_exceptions=True
+            )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def health_check(self) -> int:
+        """
+        Ping every server and restart the ones that don't answer; returns the number restarted.
+        A server that fails to restart stays marked unhealthy and is tried again at the next check.
+        """
+        restarted = 0
+        for key in [key for key in self.params if self.leases.get(key, 0) == 0]:
+            server = self.servers.get(key)
+            try:
+                if server is None or server.session is None:
+                    raise RuntimeError("not connected")
+                await asyncio.wait_for(server.session.send_ping(), HEALTH_CHECK_TIMEOUT_SECONDS)
+            except Exception as e:
+                print(f"Restarting MCP server {self.params[key].get('command')} after failed health check: {e}")
+                await self._stop(key)
+                try:
+                    await self._start(key)
+                except Exception as e:
+                    print(f"Failed to restart MCP server {self.params[key].get('command')}: {e}")
+                    self.unhealthy.add(key)
+                    continue
+                restarted += 1
+            self.unhealthy.discard(key)
+        return restarted
+
+    @asynccontextmanager
+    async def lease(self, name: str):
+        """
+        Lend a trader its servers for one run, as (trader_mcp_servers, researcher_mcp_servers).
+        Servers that aren't running, such as ones left unhealthy by a failed restart, are started first,
+        with one more try if that fails, so a flaky server doesn't cost the trader its run.
+        """
+        trader_params, researcher_params = self.server_params(name)
+        keys = [server_key(params) for params in [*trader_params, *researcher_params]]
+        if any(key not in self.servers for key in keys):
+            try:
+                await self.start([name])
+            except Exception as e:
+                print(f"Restarting MCP servers for {name} after failed start: {e}")
+                await self.start([name])
+            self.unhealthy.difference_update(keys)
+        for key in keys:
+            self.leases[key] = self.leases.get(key, 0) + 1
+        try:
+            servers = [self.servers[key] for key in keys]
+            yield servers[: len(trader_params)], servers[len(trader_params) :]
+        finally:
+            for key in keys:
+                self.leases[key] -= 1
+
+    def startup_saved_per_cycle(self, names: list[str]) -> float:
+        """Seconds of server startup that spawning servers per trader per run would cost each cycle"""
+        total = 0.0
+        for name in names:
+            trader_params, researcher_params = self.server_params(name)
+            for params in [*trader_params, *researcher_params]:
+                total += self.last_startup_seconds.get(server_key(params), 0.0)
+        return total
+
+    async def close(self) -> None:
+        await asyncio.gather(*[self._stop(key) for key in list(self._tasks)])
@@ -0,0 +1,87 @@
+import os
+from dotenv import load_dotenv
+from agents.mcp import MCPServer, MCPServerStdio, MCPServerSse
+
+load_dotenv(override=True)
+
+# stdio starts a server process per client session; sse and streamable-http run one
+# multi-client server process per service, which must be started separately:
+#   MCP_TRANSPORT=sse uv run accounts_server.py
+
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio").strip().lower()
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+
+SERVER_PORTS = {
+    "accounts_server": int(os.getenv("ACCOUNTS_MCP_PORT", "8001")),
+    "push_server": int(os.getenv("PUSH_MCP_PORT", "8002")),
+    "market_server": int(os.getenv("MARKET_MCP_PORT", "8003")),
+}
+
+is_network_transport = MCP_TRANSPORT in ("sse", "streamable-http")
+
+
+def server_settings(name: str) -> dict:
+    """Settings for a FastMCP server, so it listens on its own port when run over the network"""
+    return {"host": MCP_HOST, "port": SERVER_PORTS[name]}
+
+
+def server_url(name: str) -> str:
+    path = "/sse" if MCP_TRANSPORT == "sse" else "/mcp"
+    return f"http://{MCP_HOST}:{SERVER_PORTS[name]}{path}"
+
+
+def mcp_server(params: dict, **kwargs):
+    """The agents SDK server for a set of params: a url means a network server, otherwise a stdio command"""
+    if "url" not in params:
+        return MCPServerStdio(params, **kwargs)
+    if MCP_TRANSPORT == "streamable-http":
+        from agents.mcp import MCPServerStreamableHttp
+
+        return MCPServerStreamableHttp(params, **kwargs)
+    return MCPServerSse(params, **kwargs)
+
+
+class NamespacedServer(MCPServer):
+    """
+    One trader's view of a server shared by every trader: tools that take a namespace argument have it
+    filled in with the trader's namespace and hidden from the model, so a trader only sees its own data.
+    The shared server's connection belongs to whoever opened it, not to this view.
+    """
+
+    def __init__(self, server: MCPServer, namespace: str):
+        self.server = server
+        self.namespace = namespace
+        self.namespaced: set[str] | None = None
+
+    @property
+    def name(self) -> str:
+        return self.server.name
+
+    async def connect(self):
+        pass
+
+    async def cleanup(self):
+        pass
+
+    async def list_tools(self):
+        tools = []
+        self.namespaced = set()
+        for tool in await self.server.list_tools():
+            properties = tool.inputSchema.get("properties", {})
+            if "namespace" in properties:
+                self.namespaced.add(tool.name)
+                schema = {
+                    **tool.inputSchema,
+                    "properties": {key: value for key, value in properties.items() if key != "namespace"},
+                    "required": [key for key in tool.inputSchema.get("required", []) if key != "namespace"],
+                }
+                tool = tool.model_copy(update={"inputSchema": schema})
+            tools.append(tool)
+        return tools
+
+    async def call_tool(self, tool_name: str, arguments: dict | None):
+        if self.namespaced is None:
+            await self.list_tools()
+        if tool_name in self.namespaced:
+            arguments = {**(arguments or {}), "namespace": self.namespace}
+        return await self.server.call_tool(tool_name, arguments)
@@ -0,0 +1,149 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from mcp.server.fastmcp import FastMCP
+import knowledge
+
+load_dotenv(override=True)
+
+# One server process serves every researcher; each tool call names the trader's namespace, which the trader
+# fills in (see NamespacedServer in mcp_transport.py) so the model never chooses it
+# Knowledge graphs left by the old mcp-memory-libsql server, one {namespace}.db per trader,
+# copied into their namespace the first time it is used
+LEGACY_MEMORY_DIR = os.getenv("LEGACY_MEMORY_DIR", "")
+
+_imports: dict[str, asyncio.Task] = {}
+
+
+async def ready(namespace: str) -> str:
+    """The namespace, after importing its legacy knowledge graph on first use"""
+    if LEGACY_MEMORY_DIR:
+        if namespace not in _imports:
+            path = os.path.join(LEGACY_MEMORY_DIR, f"{os.path.basename(namespace)}.db")
+            _imports[namespace] = asyncio.create_task(asyncio.to_thread(knowledge.import_libsql, path, namespace))
+        await _imports[namespace]
+    return namespace
+
+mcp = FastMCP("memory_server")
+
+
+class Entity(BaseModel):
+    name: str = Field(description="The unique name of the entity, such as a company, stock or website")
+    entityType: str = Field(description="The kind of entity, such as company, stock, person or url")
+    observations: list[str] = Field(default_factory=list, description="Facts about the entity")
+
+
+class Relation(BaseModel):
+    source: str = Field(description="The name of the entity the relation starts from")
+    target: str = Field(description="The name of the entity the relation points to")
+    type: str = Field(description="The kind of relation, in active voice, such as competes_with")
+
+
+class Observations(BaseModel):
+    entityName: str = Field(description="The name of an existing entity")
+    contents: list[str] = Field(description="New facts about the entity")
+
+
+@mcp.tool()
+async def create_entities(namespace: str, entities: list[Entity]) -> dict:
+    """Create entities in the knowledge graph, or add the observations to entities that already exist.
+
+    Args:
+        namespace: whose knowledge graph to use
+        entities: the entities to create or update
+    """
+    return await asyncio.to_thread(
+        knowledge.upsert_entities, await ready(namespace), [entity.model_dump() for entity in entities]
+    )
+
+
+@mcp.tool()
+async def add_observations(namespace: str, observations: list[Observations]) -> dict:
+    """Add new observations to existing entities in the knowledge graph.
+
+    Args:
+        namespace: whose knowledge graph to use
+        observations: the new facts for each entity
+    """
+    return await asyncio.to_thread(
+        knowledge.add_observations, await ready(namespace), [item.model_dump() for item in observations]
+    )
+
+
+@mcp.tool()
+async def create_relations(namespace: str, relations: list[Relation]) -> dict:
+    """Create relations between entities in the knowledge graph; relations that already exist are skipped.
+
+    Args:
+        namespace: whose knowledge graph to use
+        relations: the relations to create
+    """
+    return await asyncio.to_thread(
+        knowledge.upsert_relations, await ready(namespace), [relation.model_dump() for relation in relations]
+    )
+
+
+@mcp.tool()
+async def search_nodes(namespace: str, query: str, limit: int = knowledge.SEARCH_LIMIT) -> dict:
+    """Search the knowledge graph for entities whose name, type or observations match the query.
+
+    Args:
+        namespace: whose knowledge graph to use
+        query: words to search for
+        limit: the most entities to return
+    """
+    return await asyncio.to_thread(knowledge.search, await ready(namespace), query, limit)
+
+
+@mcp.tool()
+async def open_nodes(namespace: str, names: list[str]) -> dict:
+    """Read specific entities from the knowledge graph by name, with the relations among them.
+
+    Args:
+        namespace: whose knowledge graph to use
+        names: the names of the entities
+    """
+    return await asyncio.to_thread(knowledge.open_nodes, await ready(namespace), names)
+
+
+@mcp.tool()
+async def read_graph(namespace: str, limit: int = knowledge.SEARCH_LIMIT) -> dict:
+    """Read the most recently updated entities in the knowledge graph, with the relations among them.
+
+    Args:
+        namespace: whose knowledge graph to use
+        limit: the most entities to return
+    """
+    return await asyncio.to_thread(knowledge.read_graph, await ready(namespace), limit)
+
+
+@mcp.tool()
+async def delete_entity(namespace: str, name: str) -> str:
+    """Delete an entity from the knowledge graph, with its observations and relations.
+
+    Args:
+        namespace: whose knowledge graph to use
+        name: the name of the entity
+    """
+    deleted = await asyncio.to_thread(knowledge.delete_entity, await ready(namespace), name)
+    return f"Deleted {name}" if deleted else f"No entity named {name}"
+
+
+@mcp.tool()
+async def delete_relation(namespace: str, source: str, target: str, type: str) -> str:
+    """Delete a relation from the knowledge graph.
+
+    Args:
+        namespace: whose knowledge graph to use
+        source: the name of the entity the relation starts from
+        target: the name of the entity the relation points to
+        type: the kind of relation
+    """
+    deleted = await asyncio.to_thread(knowledge.delete_relation, await ready(namespace), source, target, type)
+    return "Deleted relation" if deleted else "No such relation"
+
+
+if __name__ == "__main__":
+    # Always stdio: one pooled process serves every researcher
+    mcp.run(transport="stdio")
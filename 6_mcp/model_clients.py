@@ -0,0 +1,250 @@
+import asyncio
+import bisect
+import importlib.util
+import os
+import random
+import time
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from agents import OpenAIChatCompletionsModel, OpenAIResponsesModel
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# One AsyncOpenAI client per provider, shared by every trader and researcher, each over its own pooled
+# httpx connections, so concurrent runs reuse warm keep-alive HTTP/2 connections (from httpx[http2])
+# instead of opening a new TLS connection for each turn. Retries happen here rather than in the SDK,
+# so that each provider has a retry budget: retries are allowed at a fraction of the request rate,
+# and when a provider is failing hard the budget runs out and errors surface instead of piling on.
+
+PROVIDERS = {
+    "openai": (None, "OPENAI_API_KEY"),
+    "openrouter": ("https://openrouter.ai/api/v1", "OPENROUTER_API_KEY"),
+    "deepseek": ("https://api.deepseek.com/v1", "DEEPSEEK_API_KEY"),
+    "grok": ("https://api.x.ai/v1", "GROK_API_KEY"),
+    "gemini": ("https://generativelanguage.googleapis.com/v1beta/openai/", "GOOGLE_API_KEY"),
+}
+
+MODEL_MAX_CONNECTIONS = int(os.getenv("MODEL_MAX_CONNECTIONS", "20"))
+MODEL_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("MODEL_MAX_KEEPALIVE_CONNECTIONS", "10"))
+MODEL_KEEPALIVE_SECONDS = float(os.getenv("MODEL_KEEPALIVE_SECONDS", "120"))
+MODEL_TIMEOUT_SECONDS = float(os.getenv("MODEL_TIMEOUT_SECONDS", "300"))
+# HTTP/1.1 if turned off, or if the environment hasn't been synced since h2 was added to the dependencies
+MODEL_HTTP2 = os.getenv("MODEL_HTTP2", "true").strip().lower() == "true" and importlib.util.find_spec("h2") is not None
+# Retries of one request, with exponential backoff and full jitter, honouring Retry-After
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+MODEL_BACKOFF_SECONDS = float(os.getenv("MODEL_BACKOFF_SECONDS", "1"))
+MODEL_MAX_BACKOFF_SECONDS = float(os.getenv("MODEL_MAX_BACKOFF_SECONDS", "30"))
+# Each request earns this fraction of a retry, on top of a minimum of a few retries per minute
+MODEL_RETRY_RATIO = float(os.getenv("MODEL_RETRY_RATIO", "0.2"))
+MODEL_MIN_RETRIES_PER_MINUTE = float(os.getenv("MODEL_MIN_RETRIES_PER_MINUTE", "6"))
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# Upper bounds, in seconds, of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+
+def provider_for(model_name: str) -> str:
+    if "/" in model_name:
+        return "openrouter"
+    elif "deepseek" in model_name:
+        return "deepseek"
+    elif "grok" in model_name:
+        return "grok"
+    elif "gemini" in model_name:
+        return "gemini"
+    else:
+        return "openai"
+
+
+class RetryBudget:
+    """Retries earned as a fraction of requests plus a small steady allowance, capped at a minute's worth"""
+
+    def __init__(self, ratio: float = MODEL_RETRY_RATIO, min_per_minute: float = MODEL_MIN_RETRIES_PER_MINUTE):
+        self.ratio = ratio
+        self.rate = min_per_minute / 60
+        self.cap = max(min_per_minute, 1.0)
+        self.balance = self.cap
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(self.cap, self.balance + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """The upper bound of the bucket holding the q-th quantile (the largest bound for the overflow bucket)"""
+        count = sum(self.counts)
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def stats(self) -> dict:
+        count = sum(self.counts)
+        labels = [f"<={bound}s" for bound in self.buckets] + [f">{self.buckets[-1]}s"]
+        return {
+            "count": count,
+            "mean_seconds": round(self.total / count, 3) if count else 0.0,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "histogram": {label: n for label, n in zip(labels, self.counts) if n},
+        }
+
+
+class RetryingTransport(httpx.AsyncBaseTransport):
+    """Sends each request over a pooled transport, retrying transient failures within the provider's budget"""
+
+    def __init__(self, provider: str, transport: httpx.AsyncBaseTransport):
+        self.provider = provider
+        self.transport = transport
+        self.budget = RetryBudget()
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.errors = 0
+
+    def _backoff(self, attempt: int, response: httpx.Response | None) -> float:
+        if response is not None:
+            try:
+                return min(float(response.headers.get("retry-after", "")), MODEL_MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass
+        return random.uniform(0, min(MODEL_MAX_BACKOFF_SECONDS, MODEL_BACKOFF_SECONDS * 2**attempt))
+
+    def _may_retry(self, attempt: int) -> bool:
+        if attempt >= MODEL_MAX_RETRIES:
+            return False
+        if not self.budget.withdraw():
+            self.budget_exhausted += 1
+            return False
+        self.retries += 1
+        return True
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError):
+                self.latency.record(time.monotonic() - start)
+                if not self._may_retry(attempt):
+                    self.errors += 1
+                    raise
+                await asyncio.sleep(self._backoff(attempt, None))
+                attempt += 1
+                continue
+            self.latency.record(time.monotonic() - start)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            if not self._may_retry(attempt):
+                self.errors += 1
+                return response
+            delay = self._backoff(attempt, response)
+            await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "budget_exhausted": self.budget_exhausted,
+            "errors": self.errors,
+            **self.latency.stats(),
+        }
+
+
+class ModelClients:
+    """The shared provider clients and the models built on them, created on first use"""
+
+    def __init__(self):
+        self.clients: dict[str, AsyncOpenAI] = {}
+        self.transports: dict[str, RetryingTransport] = {}
+        self.models: dict[str, object] = {}
+
+    def client(self, provider: str) -> AsyncOpenAI:
+        if provider not in self.clients:
+            base_url, key_name = PROVIDERS[provider]
+            pooled = httpx.AsyncHTTPTransport(
+                http2=MODEL_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=MODEL_MAX_CONNECTIONS,
+                    max_keepalive_connections=MODEL_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=MODEL_KEEPALIVE_SECONDS,
+                ),
+            )
+            transport = RetryingTransport(provider, pooled)
+            http_client = DefaultAsyncHttpxClient(transport=transport, timeout=MODEL_TIMEOUT_SECONDS)
+            self.transports[provider] = transport
+            self.clients[provider] = AsyncOpenAI(
+                base_url=base_url, api_key=os.getenv(key_name), http_client=http_client, max_retries=0
+            )
+        return self.clients[provider]
+
+    def model(self, model_name: str):
+        if model_name not in self.models:
+            provider = provider_for(model_name)
+            client = self.client(provider)
+            if provider == "openai":
+                self.models[model_name] = OpenAIResponsesModel(model=model_name, openai_client=client)
+            else:
+                self.models[model_name] = OpenAIChatCompletionsModel(model=model_name, openai_client=client)
+        return self.models[model_name]
+
+    def stats(self) -> dict:
+        return {provider: transport.stats() for provider, transport in self.transports.items()}
+
+    async def close(self) -> None:
+        for client in self.clients.values():
+            await client.close()
+        self.clients.clear()
+        self.transports.clear()
+        self.models.clear()
+
+
+_registries: dict[asyncio.AbstractEventLoop, ModelClients] = {}
+
+
+def get_model_clients() -> ModelClients:
+    """The shared registry for the running event loop, since pooled connections belong to the loop that opened them"""
+    loop = asyncio.get_running_loop()
+    for other in [other for other in _registries if other.is_closed()]:
+        del _registries[other]
+    if loop not in _registries:
+        _registries[loop] = ModelClients()
+    return _registries[loop]
@@ -0,0 +1,33 @@
+# Profit and loss on the average cost basis.
+# Each position keeps the number of shares held and their total cost; buying adds to the cost, and selling
+# realizes the difference between the sale price and the average cost of the shares sold.
+# The same rule is applied to each trade as it happens, and to a whole transaction log when rebuilding.
+
+
+def apply_trade(quantity_held: int, cost: float, quantity: int, price: float) -> tuple[int, float, float]:
+    """
+    Apply one trade (negative quantity for a sale) to a position held at a total cost,
+    and return the new quantity held, the new total cost and the profit or loss realized
+    """
+    if quantity >= 0 or quantity_held <= 0:
+        return quantity_held + quantity, cost + quantity * price, 0.0
+    sold = -quantity
+    average_cost = cost / quantity_held
+    remaining = quantity_held - sold
+    realized = sold * (price - average_cost)
+    return remaining, (cost - sold * average_cost) if remaining else 0.0, realized
+
+
+def replay(transactions: list[dict]) -> tuple[dict[str, tuple[int, float]], float]:
+    """
+    Rebuild every position from a transaction log, oldest first.
+    Returns ({symbol: (quantity held, total cost)} for open positions, total realized profit or loss)
+    """
+    positions: dict[str, tuple[int, float]] = {}
+    realized = 0.0
+    for transaction in transactions:
+        quantity_held, cost = positions.get(transaction["symbol"], (0, 0.0))
+        quantity_held, cost, gain = apply_trade(quantity_held, cost, transaction["quantity"], transaction["price"])
+        positions[transaction["symbol"]] = (quantity_held, cost)
+        realized += gain
+    return {symbol: position for symbol, position in positions.items() if position[0]}, realized
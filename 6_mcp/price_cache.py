@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from datetime import date
+from typing import Callable
+from database import read_prices, write_prices
+
+PLAN_TTL_SECONDS = {
+    "eod": float(os.getenv("PRICE_TTL_EOD", "86400")),
+    "delayed": float(os.getenv("PRICE_TTL_DELAYED", "60")),
+    "realtime": float(os.getenv("PRICE_TTL_REALTIME", "5")),
+}
+
+# Cached alongside the prices to record when a complete snapshot of the market was fetched
+SNAPSHOT = "*"
+
+
+class PriceCache:
+    """
+    Two cache tiers in front of an upstream price source:
+    an in-process dictionary, then the prices table in SQLite that every process shares
+    (the trader MCP servers, the researcher and the dashboard).
+    Entries are keyed by (symbol, plan) and are fresh for the plan's TTL; end-of-day prices
+    also expire when the date changes.
+    If fetch returns the whole market (complete=True), symbols missing from a fresh snapshot
+    are known to be unpriced, and come back as 0.0 without another upstream call.
+    """
+
+    def __init__(self, plan: str, fetch: Callable[[list[str]], dict[str, float]], complete: bool = False):
+        self.plan = plan
+        self.fetch = fetch
+        self.complete = complete
+        self.ttl = PLAN_TTL_SECONDS[plan]
+        self.memory: dict[str, tuple[float, float]] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def is_fresh(self, fetched_at: float, now: float) -> bool:
+        if now - fetched_at >= self.ttl:
+            return False
+        return self.plan != "eod" or date.fromtimestamp(fetched_at) == date.fromtimestamp(now)
+
+    def _from_memory(self, symbols: list[str], now: float, prices: dict[str, float]) -> list[str]:
+        missing = []
+        with self._lock:
+            for symbol in symbols:
+                entry = self.memory.get(symbol)
+                if entry and self.is_fresh(entry[1], now):
+                    prices[symbol] = entry[0]
+                else:
+                    missing.append(symbol)
+            if self.complete and missing:
+                snapshot = self.memory.get(SNAPSHOT)
+                if snapshot and self.is_fresh(snapshot[1], now):
+                    prices.update({symbol: 0.0 for symbol in missing})
+                    missing = []
+        return missing
+
+    def _from_shared(self, symbols: list[str], now: float, prices: dict[str, float]) -> list[str]:
+        lookup = symbols + [SNAPSHOT] if self.complete else symbols
+        fresh = {symbol: entry for symbol, entry in read_prices(self.plan, lookup).items() if self.is_fresh(entry[1], now)}
+        with self._lock:
+            self.memory.update(fresh)
+        fresh.pop(SNAPSHOT, None)
+        prices.update({symbol: entry[0] for symbol, entry in fresh.items()})
+        return self._from_memory([symbol for symbol in symbols if symbol not in fresh], now, prices)
+
+    def get_prices(self, symbols: list[str]) -> dict[str, float]:
+        prices = {}
+        missing = self._from_memory(symbols, time.time(), prices)
+        self.hits += len(symbols) - len(missing)
+        if not missing:
+            return prices
+        with self._fetch_lock:
+            # Another thread may have fetched these while we waited
+            missing = self._from_memory(missing, time.time(), prices)
+            if missing:
+                before = len(missing)
+                missing = self._from_shared(missing, time.time(), prices)
+                self.shared_hits += before - len(missing)
+            if missing:
+                self.misses += len(missing)
+                self.upstream_calls += 1
+                fetched_at = time.time()
+                fetched = self.fetch(missing)
+                fetched.update({symbol: 0.0 for symbol in missing if symbol not in fetched})
+                if self.complete:
+                    fetched[SNAPSHOT] = 0.0
+                write_prices(self.plan, fetched, fetched_at)
+                with self._lock:
+                    self.memory.update({symbol: (price, fetched_at) for symbol, price in fetched.items()})
+                prices.update({symbol: fetched[symbol] for symbol in missing})
+        return prices
+
+    def stats(self) -> dict[str, int]:
+        """Hit and miss counters: memory hits, shared SQLite hits, misses, and upstream requests made"""
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "upstream_calls": self.upstream_calls,
+        }
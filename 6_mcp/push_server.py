@@ -1,8 +1,10 @@
+import asyncio
 import os
 from dotenv import load_dotenv
 import requests
 from pydantic import BaseModel, Field
 from mcp.server.fastmcp import FastMCP
+from mcp_transport import MCP_TRANSPORT, server_settings
 
 load_dotenv(override=True)
 
@@ -11,7 +13,7 @@ pushover_token = os.getenv("PUSHOVER_TOKEN")
 pushover_url = "https://api.pushover.net/1/messages.json"
 
 
-mcp = FastMCP("push_server")
+mcp = FastMCP("push_server", **server_settings("push_server"))
 
 
 class PushModelArgs(BaseModel):
@@ -19,13 +21,13 @@ class PushModelArgs(BaseModel):
 
 
 @mcp.tool()
-def push(args: PushModelArgs):
+async def push(args: PushModelArgs):
     """Send a push notification with this brief message"""
     print(f"Push: {args.message}")
     payload = {"user": pushover_user, "token": pushover_token, "message": args.message}
-    requests.post(pushover_url, data=payload)
+    await asyncio.to_thread(requests.post, pushover_url, data=payload)
     return "Push notification sent"
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    mcp.run(transport=MCP_TRANSPORT)
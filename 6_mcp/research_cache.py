@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from dotenv import load_dotenv
+from agents import custom_span
+
+load_dotenv(override=True)
+
+# Research requests are fingerprinted by their words, ignoring case, punctuation, order and filler words,
+# within a time bucket, so that traders asking about the same news in the same cycle share one research run.
+# Concurrent identical requests wait for the one run in flight instead of starting their own.
+# Optionally, a request whose words mostly overlap with one already answered (or being answered) in the bucket
+# reuses that answer too, but only when both name exactly the same tickers, companies and actions.
+
+RESEARCH_CACHE_BUCKET_SECONDS = float(os.getenv("RESEARCH_CACHE_BUCKET_SECONDS", "1800"))
+RESEARCH_CACHE_TTL_SECONDS = float(os.getenv("RESEARCH_CACHE_TTL_SECONDS", "1800"))
+# Jaccard similarity of the words of two requests at or above which they count as the same request; 1 disables it
+RESEARCH_CACHE_SIMILARITY = float(os.getenv("RESEARCH_CACHE_SIMILARITY", "1"))
+RESEARCH_CACHE_ENABLED = os.getenv("RESEARCH_CACHE_ENABLED", "true").strip().lower() == "true"
+
+STOPWORDS = set(
+    "a an and any are about as at be by can could do for from get give how i in into is it its latest look "
+    "me my of on or please recent research some that the their them there these this to up what which with "
+    "would you your".split()
+)
+# Words that change what a request is asking for, so near matches must agree on them
+ACTIONS = set(
+    "buy sell short long hold bullish bearish upgrade downgrade rise fall up down gain loss beat miss".split()
+)
+
+
+def words(query: str) -> frozenset[str]:
+    return frozenset(word for word in re.findall(r"[a-z0-9]+", query.lower()) if word not in STOPWORDS)
+
+
+def anchors(query: str) -> frozenset[str]:
+    """The tickers, names and actions in a query: capitalized words, words with digits, and action words"""
+    found = re.findall(r"\$?[A-Za-z0-9][A-Za-z0-9.&-]*", query)
+    return frozenset(
+        word.lstrip("$").lower() for word in found
+        if word.lower() not in STOPWORDS
+        and (word[0].isupper() or word[0] == "$" or any(c.isdigit() for c in word) or word.lower() in ACTIONS)
+    )
+
+
+def fingerprint(tokens: frozenset[str], bucket: int) -> str:
+    return hashlib.sha1(f"{bucket}:{' '.join(sorted(tokens))}".encode()).hexdigest()
+
+
+def similarity(first: frozenset[str], second: frozenset[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class ResearchCache:
+    def __init__(
+        self,
+        bucket_seconds: float = RESEARCH_CACHE_BUCKET_SECONDS,
+        ttl_seconds: float = RESEARCH_CACHE_TTL_SECONDS,
+        threshold: float = RESEARCH_CACHE_SIMILARITY,
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        # fingerprint -> (bucket, words, anchors, result, stored at)
+        self.entries: dict[str, tuple[int, frozenset[str], frozenset[str], str, float]] = {}
+        # fingerprint -> (bucket, words, anchors, future result)
+        self.in_flight: dict[str, tuple[int, frozenset[str], frozenset[str], asyncio.Future]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.joined = 0
+        self.misses = 0
+
+    def _evict(self, now: float) -> None:
+        for key in [key for key, entry in self.entries.items() if now - entry[4] > self.ttl_seconds]:
+            del self.entries[key]
+
+    def _nearest(self, candidates: dict, bucket: int, tokens: frozenset[str], terms: frozenset[str]) -> str | None:
+        """The most similar request in the bucket naming the same tickers, companies and actions, if any"""
+        best, best_score = None, self.threshold
+        for key, (candidate_bucket, candidate_tokens, candidate_terms, *_) in candidates.items():
+            if candidate_bucket == bucket and terms and candidate_terms == terms:
+                score = similarity(tokens, candidate_tokens)
+                if score >= best_score:
+                    best, best_score = key, score
+        return best
+
+    async def get(self, query: str, run) -> tuple[str, str]:
+        """
+        The research result for a query, and how it was found: 'hit', 'near' or 'joined' if it was shared,
+        or 'miss' if run() had to be awaited for it
+        """
+        now = time.monotonic()
+        self._evict(now)
+        bucket = int(time.time() // self.bucket_seconds)
+        tokens = words(query)
+        terms = anchors(query)
+        key = fingerprint(tokens, bucket)
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key][3], "hit"
+        if key in self.in_flight:
+            return await self._join(self.in_flight[key][3], query, run)
+        if self.threshold < 1:
+            near = self._nearest(self.entries, bucket, tokens, terms)
+            if near:
+                self.near_hits += 1
+                return self.entries[near][3], "near"
+            near = self._nearest(self.in_flight, bucket, tokens, terms)
+            if near:
+                return await self._join(self.in_flight[near][3], query, run)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = (bucket, tokens, terms, future)
+        try:
+            result = await run()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters see it; nobody else needs to
+            raise
+        else:
+            future.set_result(result)
+            if result:
+                self.entries[key] = (bucket, tokens, terms, result, time.monotonic())
+            return result, "miss"
+        finally:
+            del self.in_flight[key]
+
+    async def _join(self, future: asyncio.Future, query: str, run) -> tuple[str, str]:
+        """Wait for the run in flight; if the trader running it was cancelled, research the query afresh"""
+        try:
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled() or asyncio.current_task().cancelling():
+                raise
+            return await self.get(query, run)
+        self.joined += 1
+        return result, "joined"
+
+    def stats(self) -> dict:
+        requests = self.hits + self.near_hits + self.joined + self.misses
+        shared = requests - self.misses
+        return {
+            "requests": requests,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "joined": self.joined,
+            "misses": self.misses,
+            "hit_rate": round(shared / requests, 3) if requests else 0.0,
+            "entries": len(self.entries),
+        }
+
+
+_caches: dict[asyncio.AbstractEventLoop, ResearchCache] = {}
+
+
+def get_research_cache() -> ResearchCache:
+    """The shared cache for the running event loop, since in-flight research belongs to the loop running it"""
+    loop = asyncio.get_running_loop()
+    for other in [other for other in _caches if other.is_closed()]:
+        del _caches[other]
+    if loop not in _caches:
+        _caches[loop] = ResearchCache()
+    return _caches[loop]
+
+
+async def cached_research(query: str, run) -> str:
+    """Research through the shared cache, recording the outcome and hit rate as a span in the trader's trace"""
+    if not RESEARCH_CACHE_ENABLED:
+        return await run()
+    cache = get_research_cache()
+    with custom_span("research cache") as span:
+        result, outcome = await cache.get(query, run)
+        stats = cache.stats()
+        span.span_data.name = f"research cache {outcome}, hit rate {stats['hit_rate']:.0%} of {stats['requests']}"
+        span.span_data.data.update(outcome=outcome, **stats)
+    return result
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+
+def parse_limits(text: str) -> dict[str, int]:
+    """Per-provider limits from text like 'openai=8,deepseek=2'"""
+    limits = {}
+    for part in text.split(","):
+        if "=" in part:
+            provider, value = part.split("=", 1)
+            limits[provider.strip().lower()] = int(value)
+    return limits
+
+
+# How many runs may talk to each provider at once, and how many tokens a minute each may use (0 for no limit)
+DEFAULT_PROVIDER_CONCURRENCY = int(os.getenv("DEFAULT_PROVIDER_CONCURRENCY", "4"))
+PROVIDER_CONCURRENCY = parse_limits(os.getenv("PROVIDER_CONCURRENCY", ""))
+DEFAULT_PROVIDER_TOKENS_PER_MINUTE = int(os.getenv("DEFAULT_PROVIDER_TOKENS_PER_MINUTE", "0"))
+PROVIDER_TOKENS_PER_MINUTE = parse_limits(os.getenv("PROVIDER_TOKENS_PER_MINUTE", ""))
+# Tokens set aside for a run before it starts, corrected to what it really used when it finishes
+RUN_TOKEN_ESTIMATE = int(os.getenv("RUN_TOKEN_ESTIMATE", "30000"))
+# Starts are spread evenly over the stagger window, each with some random jitter on top
+SCHEDULER_STAGGER_SECONDS = float(os.getenv("SCHEDULER_STAGGER_SECONDS", "60"))
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "5"))
+
+
+class TokenBucket:
+    """Tokens per minute, refilled continuously; a run bigger than the bucket waits for it to fill and then overdraws"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            needed = min(tokens, self.capacity)
+            self._refill()
+            while self.tokens < needed:
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+    def adjust(self, tokens: int) -> None:
+        """Charge (or refund, if negative) the difference between the estimate and what was really used"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - tokens)
+
+
+class ProviderLimiter:
+    """The concurrency and token-rate limits for one provider, with a count of runs waiting on them"""
+
+    def __init__(self, concurrency: int, tokens_per_minute: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self, estimate: int):
+        """Hold one of the provider's slots for a run; the body should set usage["tokens"] to the tokens it used"""
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+            try:
+                if self.bucket:
+                    await self.bucket.acquire(estimate)
+            except BaseException:
+                self.semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        usage = {"tokens": estimate}
+        try:
+            yield usage
+        finally:
+            if self.bucket:
+                self.bucket.adjust(usage["tokens"] - estimate)
+            self.semaphore.release()
+
+
+class Scheduler:
+    """
+    Runs every trader once per cycle, without bursting every provider at once:
+    starts are staggered with jitter, each provider has its own concurrency and token-rate limits,
+    and a run that overruns its cycle carries over rather than being started again on top of itself.
+    """
+
+    def __init__(
+        self,
+        traders: list,
+        run,
+        provider_for,
+        stagger_seconds: float = SCHEDULER_STAGGER_SECONDS,
+        jitter_seconds: float = SCHEDULER_JITTER_SECONDS,
+        token_estimate: int = RUN_TOKEN_ESTIMATE,
+    ):
+        self.traders = traders
+        self.run = run
+        self.provider_for = provider_for
+        self.stagger_seconds = stagger_seconds
+        self.jitter_seconds = jitter_seconds
+        self.token_estimate = token_estimate
+        self.limiters: dict[str, ProviderLimiter] = {}
+        self.running: dict[str, asyncio.Task] = {}
+        self.cycles = 0
+        self.max_queue_depth = 0
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        if provider not in self.limiters:
+            self.limiters[provider] = ProviderLimiter(
+                PROVIDER_CONCURRENCY.get(provider, DEFAULT_PROVIDER_CONCURRENCY),
+                PROVIDER_TOKENS_PER_MINUTE.get(provider, DEFAULT_PROVIDER_TOKENS_PER_MINUTE),
+            )
+        return self.limiters[provider]
+
+    def queue_depth(self) -> int:
+        return sum(limiter.waiting for limiter in self.limiters.values())
+
+    async def _run_one(self, trader, delay: float) -> float | None:
+        """The run's latency in seconds, or None if run() reported that it failed by returning None"""
+        await asyncio.sleep(delay)
+        limiter = self.limiter(self.provider_for(trader.model_name))
+        if limiter.semaphore.locked():
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth() + 1)
+        async with limiter.slot(self.token_estimate) as usage:
+            start = time.monotonic()
+            tokens = await self.run(trader)
+            if tokens is None:
+                return None
+            if tokens:
+                usage["tokens"] = tokens
+            return time.monotonic() - start
+
+    def _finished(self, name: str, task: asyncio.Task) -> None:
+        self.running.pop(name, None)
+        if not task.cancelled():
+            task.exception()  # an unexpected error from run(); this just marks the exception as seen
+
+    async def run_cycle(self, deadline: float) -> dict:
+        """
+        Start this cycle's runs and wait for them until the deadline (a time.monotonic() value),
+        returning the cycle's metrics; runs still going at the deadline carry over into the next cycle
+        """
+        self.cycles += 1
+        self.max_queue_depth = 0
+        cycle_start = time.monotonic()
+        carried_over = [trader.name for trader in self.traders if trader.name in self.running]
+        ready = [trader for trader in self.traders if trader.name not in self.running]
+        started = {}
+        for index, trader in enumerate(ready):
+            delay = self.stagger_seconds * index / max(len(ready), 1) + random.uniform(0, self.jitter_seconds)
+            task = asyncio.create_task(self._run_one(trader, delay))
+            task.add_done_callback(lambda task, name=trader.name: self._finished(name, task))
+            self.running[trader.name] = task
+            started[trader.name] = task
+        tasks = list(started.values())
+        if tasks:
+            await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+        latencies = []
+        failed = 0
+        for task in tasks:
+            if not task.done():
+                continue
+            if task.cancelled() or task.exception() or task.result() is None:
+                failed += 1
+            else:
+                latencies.append(task.result())
+        latencies.sort()
+        return {
+            "cycle": self.cycles,
+            "started": len(started),
+            "completed": len(latencies),
+            "failed": failed,
+            "overran": sum(1 for task in tasks if not task.done()),
+            "carried_over": len(carried_over),
+            "cycle_seconds": time.monotonic() - cycle_start,
+            "median_run_seconds": latencies[len(latencies) // 2] if latencies else 0.0,
+            "max_run_seconds": latencies[-1] if latencies else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+    async def close(self) -> None:
+        """Wait for any runs carried over from the last cycle"""
+        if self.running:
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
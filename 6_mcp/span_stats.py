@@ -0,0 +1,55 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+from database import read_spans
+
+load_dotenv(override=True)
+
+# Latency percentiles from the span store, to see which tools, MCP servers and models dominate a trader's runs.
+# Each query reads a bounded number of recent spans, so its cost stays flat however long the traders have run.
+
+SPAN_STATS_LIMIT = int(os.getenv("SPAN_STATS_LIMIT", "5000"))
+GROUPINGS = ("tool", "server", "model")
+
+
+def span_key(span: dict, by: str) -> str | None:
+    """What a span counts towards when grouped by tool, MCP server or model; None if it doesn't count"""
+    if by == "tool":
+        return span["span_name"] if span["type"] == "function" else None
+    if by == "server":
+        return span["server"] if span["type"] == "function" else None
+    if by == "model":
+        return span["model"] if span["type"] in ("generation", "response") else None
+    raise ValueError(f"Unknown grouping {by}; choose from {', '.join(GROUPINGS)}")
+
+
+def latency_percentiles(spans: list[dict], by: str) -> list[dict]:
+    """Calls, p50 and p95 latency, total time and tokens per group, the groups taking the most time first"""
+    groups: dict[str, list[dict]] = {}
+    for span in spans:
+        key = span_key(span, by)
+        if key and span["duration"] is not None:
+            groups.setdefault(key, []).append(span)
+    rows = []
+    for key, members in groups.items():
+        durations = np.array([span["duration"] for span in members])
+        p50, p95 = np.percentile(durations, [50, 95])
+        rows.append({
+            "by": by,
+            "key": key,
+            "calls": len(members),
+            "p50_seconds": round(float(p50), 3),
+            "p95_seconds": round(float(p95), 3),
+            "total_seconds": round(float(durations.sum()), 3),
+            "input_tokens": sum(span["input_tokens"] or 0 for span in members),
+            "output_tokens": sum(span["output_tokens"] or 0 for span in members),
+            "errors": sum(1 for span in members if span["error"]),
+        })
+    return sorted(rows, key=lambda row: row["total_seconds"], reverse=True)
+
+
+def trader_latencies(name: str, groupings: tuple[str, ...] = GROUPINGS, since: float | None = None,
+                     limit: int = SPAN_STATS_LIMIT) -> list[dict]:
+    """Latency percentiles for a trader's recent spans, grouped each way in turn"""
+    spans = read_spans(name, since, limit)
+    return [row for by in groupings for row in latency_percentiles(spans, by)]
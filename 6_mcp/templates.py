@@ -1,4 +1,4 @@
-from datetime import datetime
+import clock
 from market import is_paid_polygon, is_realtime_polygon
 
 if is_realtime_polygon:
@@ -24,7 +24,7 @@ Also use it to store web addresses that you find interesting so you can check th
 Draw on your knowledge graph to build your expertise over time.
 
 If there isn't a specific request, then just respond with investment opportunities based on searching latest news.
-The current datetime is {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+The current datetime is {clock.now().strftime("%Y-%m-%d %H:%M:%S")}
 """
 
 def research_tool():
@@ -40,6 +40,7 @@ You actively manage your portfolio according to your strategy.
 You have access to tools including a researcher to research online for news and opportunities, based on your request.
 You also have tools to access to financial data for stocks. {note}
 And you have tools to buy and sell stocks using your account name {name}.
+When you are making more than one trade, place them together with the execute_orders tool rather than one at a time.
 You can use your entity tools as a persistent memory to store and recall information; you share
 this memory with other traders and can benefit from the group's knowledge.
 Use these tools to carry out research, make decisions, and execute trades.
@@ -61,7 +62,7 @@ Your investment strategy:
 Here is your current account:
 {account}
 Here is the current datetime:
-{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+{clock.now().strftime("%Y-%m-%d %H:%M:%S")}
 Now, carry out analysis, make your decision and execute trades. Your account name is {name}.
 After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
 respond with a brief 2-3 sentence appraisal of your portfolio and its outlook.
@@ -80,7 +81,7 @@ You also have a tool to change your strategy if you wish; you can decide at any
 Here is your current account:
 {account}
 Here is the current datetime:
-{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+{clock.now().strftime("%Y-%m-%d %H:%M:%S")}
 Now, carry out analysis, make your decision and execute trades. Your account name is {name}.
 After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
 respond with a brief 2-3 sentence appraisal of your portfolio and its outlook."""
\ No newline at end of file
@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+# The modules in 6_mcp import each other by name, and database.py opens ACCOUNTS_DB on import,
+# so both are set up before any test module is collected
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["ACCOUNTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="trading_tests_"), "accounts.db")
+
+import pytest
+import market
+
+PRICES = {"AAPL": 200.0, "MSFT": 400.0, "NVDA": 120.0, "TSLA": 250.0}
+
+
+@pytest.fixture(autouse=True)
+def fixed_prices():
+    """Price every lookup from a fixed table instead of the live market"""
+    market.set_price_source(lambda symbols: {symbol: PRICES.get(symbol, 0.0) for symbol in symbols})
+    yield
+    market.set_price_source(None)
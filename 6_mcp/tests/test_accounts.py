@@ -0,0 +1,80 @@
+import pytest
+from accounts import Account, Order
+
+
+@pytest.fixture
+def account():
+    account = Account.get("tester")
+    account.reset("Buy and hold")
+    account.buy_shares("AAPL", 5, "Starting position")
+    return account
+
+
+MUTATIONS = {
+    "reset": lambda view: view.reset("oops"),
+    "deposit": lambda view: view.deposit(100),
+    "withdraw": lambda view: view.withdraw(100),
+    "buy_shares": lambda view: view.buy_shares("MSFT", 1, "test"),
+    "sell_shares": lambda view: view.sell_shares("AAPL", 1, "test"),
+    "execute_orders": lambda view: view.execute_orders([Order(action="buy", symbol="MSFT", quantity=1, rationale="test")]),
+    "change_strategy": lambda view: view.change_strategy("oops"),
+    "save": lambda view: view.save(),
+}
+
+
+@pytest.mark.parametrize("mutation", MUTATIONS.values(), ids=MUTATIONS.keys())
+def test_as_of_view_cannot_change_the_live_account(account, mutation):
+    before = Account.get("tester")
+    view = Account.as_of("tester", "2099-01-01 00:00:00")
+    with pytest.raises(ValueError, match="can't be changed"):
+        mutation(view)
+    after = Account.get("tester")
+    assert (after.balance, after.strategy, after.holdings) == (before.balance, before.strategy, before.holdings)
+    assert after.transaction_count == before.transaction_count
+
+
+def test_as_of_view_reports_without_recording_a_value(account):
+    points = len(Account.get("tester").portfolio_value_time_series)
+    Account.as_of("tester", "2099-01-01 00:00:00").report()
+    assert len(Account.get("tester").portfolio_value_time_series) == points
+
+
+def test_replayed_orders_report_the_original_fills(account):
+    import json
+    import market
+    from accounts import SPREAD
+
+    orders = [Order(action="buy", symbol="MSFT", quantity=2, rationale="test")]
+    first = json.loads(Account.get("tester").execute_orders(orders, idempotency_key="retry-1"))
+    points = len(Account.get("tester").portfolio_value_time_series)
+    market.set_price_source(lambda symbols: {symbol: 1.0 for symbol in symbols})
+    again = json.loads(Account.get("tester").execute_orders(orders, idempotency_key="retry-1"))
+    assert first["replayed"] is False and again["replayed"] is True
+    assert again["executed"] == first["executed"] == [{"symbol": "MSFT", "quantity": 2, "price": round(400.0 * (1 + SPREAD), 4)}]
+    assert again["holdings"] == first["holdings"]
+    assert len(Account.get("tester").portfolio_value_time_series) == points
+
+
+def test_trades_return_a_compact_view_without_recording_a_value(account):
+    import json
+    from account_views import REPORT_LAST_TRANSACTIONS
+
+    for _ in range(REPORT_LAST_TRANSACTIONS + 5):
+        account = Account.get("tester")
+        points = len(account.portfolio_value_time_series)
+        result = account.buy_shares("NVDA", 1, "test")
+        assert len(Account.get("tester").portfolio_value_time_series) == points
+    details = json.loads(result.split("\n", 1)[1])
+    assert "portfolio_value_time_series" not in details and "transactions" not in details
+    assert len(details["recent_transactions"]) == REPORT_LAST_TRANSACTIONS
+    sold = json.loads(Account.get("tester").sell_shares("NVDA", 2, "test").split("\n", 1)[1])
+    assert sold["holdings"]["NVDA"] == REPORT_LAST_TRANSACTIONS + 3
+
+
+def test_report_values_are_rounded_to_cents():
+    from value_series import ValueSeries
+
+    series = ValueSeries()
+    series.extend([(1_700_000_000, 10123.45, 10123.45, 10123.45)])
+    assert series.values.dtype.name == "float32" and float(series.values[0]) != 10123.45
+    assert series.as_pairs() == [("2023-11-14 22:13:20", 10123.45)]
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from accounts_client import AccountsClient
+
+
+class DroppingSession:
+    """A session whose server goes away mid-request the first time, having possibly applied the request"""
+
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    async def call_tool(self, name, args):
+        self.calls.append(name)
+        if len(self.calls) == 1:
+            raise ConnectionError("server went away")
+        return f"{name} done"
+
+    async def read_resource(self, uri):
+        return await self.call_tool(uri, {})
+
+
+def client_with_dropping_session(calls: list) -> AccountsClient:
+    client = AccountsClient()
+    session = DroppingSession(calls)
+
+    async def connect():
+        return session
+    client.connect = connect  # _task stays None, as it is once the session's task has ended
+    return client
+
+
+def test_tool_calls_without_a_key_are_not_sent_twice():
+    calls = []
+    client = client_with_dropping_session(calls)
+    with pytest.raises(ConnectionError):
+        asyncio.run(client.call_tool("buy_shares", {"name": "ed", "symbol": "AAPL", "quantity": 1, "rationale": "x"}))
+    assert calls == ["buy_shares"]
+
+
+def test_tool_calls_with_a_key_and_reads_are_retried():
+    calls = []
+    client = client_with_dropping_session(calls)
+    args = {"name": "ed", "symbol": "AAPL", "quantity": 1, "rationale": "x", "idempotency_key": "k1"}
+    assert asyncio.run(client.call_tool("buy_shares", args)) == "buy_shares done"
+    assert calls == ["buy_shares", "buy_shares"]
+    calls.clear()
+    assert asyncio.run(client._request(lambda session: session.read_resource("accounts://report/ed"))) == "accounts://report/ed done"
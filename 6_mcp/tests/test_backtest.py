@@ -0,0 +1,23 @@
+import pytest
+from backtest import Bars, StubTrader, generate_bars, run_backtest
+
+
+@pytest.fixture
+def bars(tmp_path):
+    path = str(tmp_path / "bars.db")
+    generate_bars(path, symbols=5, days=30, minutes=False, seed=1)
+    return Bars.load(path)
+
+
+def test_agents_trade_like_their_policies(bars):
+    """The agent loop with the stub model places exactly the orders the policies would place directly"""
+    # each run resets the accounts, and the random policy is seeded by name, so both runs see the same choices
+    pairs = [("Mo", "momentum"), ("Reb", "rebalance"), ("Ran", "random")]
+    through_agents = run_backtest(bars, [StubTrader(name, policy) for name, policy in pairs])
+    direct = run_backtest(bars, [StubTrader(name, policy) for name, policy in pairs], direct=True)
+    for name, _ in pairs:
+        agent, policy = through_agents["traders"][name], direct["traders"][name]
+        assert agent["orders"] > 0
+        assert (agent["orders"], agent["rejected"]) == (policy["orders"], policy["rejected"])
+        assert agent["value"] == pytest.approx(policy["value"])
+        assert 0 < agent["prompt_chars"] < 10_000
@@ -0,0 +1,17 @@
+import json
+import sqlite3
+from database import _migrate_market_cache
+
+
+def test_market_snapshots_move_into_the_price_cache_once():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE market (date TEXT PRIMARY KEY, data TEXT)")
+    conn.execute("CREATE TABLE prices (symbol TEXT, plan TEXT, price REAL, fetched_at REAL, PRIMARY KEY (symbol, plan))")
+    conn.execute("INSERT INTO market VALUES ('2025-06-02', ?)", (json.dumps({"AAPL": 1.0}),))
+    conn.execute("INSERT INTO market VALUES ('2025-06-03', ?)", (json.dumps({"AAPL": 2.0, "MSFT": 3.0}),))
+    conn.execute("INSERT INTO prices VALUES ('MSFT', 'eod', 4.0, 1e10)")
+    _migrate_market_cache(conn)
+    _migrate_market_cache(conn)
+    prices = {symbol: price for symbol, price in conn.execute("SELECT symbol, price FROM prices WHERE plan = 'eod'")}
+    assert prices == {"AAPL": 2.0, "MSFT": 4.0}
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'market'").fetchone()
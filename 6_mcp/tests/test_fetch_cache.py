@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import fetch_cache
+from fetch_cache import Fetcher, read_page
+
+PAGES = {
+    "/latin1": ("text/plain; charset=iso-8859-1", None, "Société Générale shares rose".encode("iso-8859-1")),
+    "/private": ("text/plain; charset=utf-8", "no-store", b"Your portfolio is worth $1,000"),
+    "/public": ("text/plain; charset=utf-8", "max-age=60", b"Markets closed higher"),
+}
+
+
+class Fixture(BaseHTTPRequestHandler):
+    def do_GET(self):
+        content_type, cache_control, body = PAGES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if cache_control:
+            self.send_header("Cache-Control", cache_control)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch_cache, "FETCH_CACHE_DB", str(tmp_path / "fetch_cache.db"))
+    monkeypatch.setattr(fetch_cache._local, "conn", None, raising=False)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Fixture)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def fetch(url: str, raw: bool = False) -> str:
+    async def main():
+        fetcher = Fetcher()
+        try:
+            return await fetcher.text(url, raw)
+        finally:
+            await fetcher.close()
+    return asyncio.run(main())
+
+
+def test_pages_are_decoded_with_their_charset(base_url):
+    assert fetch(f"{base_url}/latin1") == "Société Générale shares rose"
+    assert fetch(f"{base_url}/latin1", raw=True) == "Société Générale shares rose"
+    assert read_page(f"{base_url}/latin1")["encoding"] == "iso-8859-1"
+
+
+def test_no_store_responses_are_not_kept(base_url):
+    assert fetch(f"{base_url}/private") == "Your portfolio is worth $1,000"
+    assert read_page(f"{base_url}/private") is None
+    assert fetch(f"{base_url}/public") == "Markets closed higher"
+    assert read_page(f"{base_url}/public")["text"] == "Markets closed higher"
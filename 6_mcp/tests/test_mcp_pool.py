@@ -0,0 +1,42 @@
+import asyncio
+from mcp_pool import MCPServerPool, server_key
+
+
+def test_health_check_survives_a_server_that_will_not_restart():
+    async def main():
+        pool = MCPServerPool(client_session_timeout_seconds=5)
+        params = {"command": "no-such-mcp-server-command", "args": []}
+        key = server_key(params)
+        pool.params[key] = params
+        first = await pool.health_check()
+        second = await pool.health_check()
+        await pool.close()
+        return first, second, key in pool.unhealthy, key in pool.servers, pool._tasks
+    restarted, again, unhealthy, running, tasks = asyncio.run(main())
+    assert (restarted, again) == (0, 0)
+    assert unhealthy and not running and not tasks
+
+
+def test_lease_restarts_an_unhealthy_server_once():
+    class FlakyPool(MCPServerPool):
+        attempts = 0
+
+        def server_params(self, name):
+            return [{"command": "flaky-mcp-server", "args": []}], []
+
+        async def _start(self, key):
+            self.attempts += 1
+            if self.attempts == 1:
+                raise RuntimeError("failed to start")
+            self.servers[key] = "server"
+
+    async def main():
+        pool = FlakyPool()
+        key = server_key({"command": "flaky-mcp-server", "args": []})
+        pool.unhealthy.add(key)
+        async with pool.lease("Warren") as (trader_servers, researcher_servers):
+            leased = trader_servers, researcher_servers
+        return pool, key, leased
+    pool, key, leased = asyncio.run(main())
+    assert leased == (["server"], [])
+    assert pool.attempts == 2 and key not in pool.unhealthy
@@ -0,0 +1,30 @@
+import asyncio
+import json
+import os
+import sys
+from agents.mcp import MCPServerStdio
+from mcp_transport import NamespacedServer
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "memory_server.py")
+
+
+def result(call) -> dict:
+    return json.loads(call.content[0].text)
+
+
+def test_one_server_keeps_each_traders_memory_apart(tmp_path):
+    async def main():
+        params = {"command": sys.executable, "args": [SERVER], "env": {"MEMORY_DB": str(tmp_path / "knowledge.db")}}
+        async with MCPServerStdio(params, cache_tools_list=True, client_session_timeout_seconds=30) as server:
+            warren, george = NamespacedServer(server, "Warren"), NamespacedServer(server, "George")
+            tools = {tool.name: tool for tool in await warren.list_tools()}
+            entity = {"name": "NVDA", "entityType": "stock", "observations": ["Beat earnings"]}
+            await warren.call_tool("create_entities", {"entities": [entity]})
+            mine = result(await warren.call_tool("search_nodes", {"query": "earnings"}))
+            theirs = result(await george.call_tool("search_nodes", {"query": "earnings"}))
+            return tools, mine, theirs
+    tools, mine, theirs = asyncio.run(main())
+    assert "namespace" not in tools["search_nodes"].inputSchema["properties"]
+    assert "namespace" not in tools["create_entities"].inputSchema.get("required", [])
+    assert [entity["name"] for entity in mine["entities"]] == ["NVDA"]
+    assert theirs["entities"] == []
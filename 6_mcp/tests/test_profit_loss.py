@@ -0,0 +1,64 @@
+import math
+import random
+import pytest
+import market
+from accounts import Account, INITIAL_BALANCE
+from database import read_transactions
+
+SYMBOLS = ["AAA", "BBB", "CCC"]
+
+
+def recompute(transactions: list[dict], prices: dict[str, float]) -> dict:
+    """Profit and loss worked out from scratch over the whole history, with average cost per share"""
+    balance, spent, realized = INITIAL_BALANCE, 0.0, 0.0
+    holdings: dict[str, int] = {}
+    costs: dict[str, float] = {}
+    for t in transactions:
+        symbol, quantity, price = t["symbol"], t["quantity"], t["price"]
+        balance -= quantity * price
+        spent += quantity * price
+        held = holdings.get(symbol, 0)
+        if quantity > 0:
+            costs[symbol] = costs.get(symbol, 0.0) + quantity * price
+        else:
+            average = costs[symbol] / held
+            realized += -quantity * (price - average)
+            costs[symbol] -= -quantity * average
+        holdings[symbol] = held + quantity
+        if holdings[symbol] == 0:
+            del holdings[symbol], costs[symbol]
+    value = balance + sum(quantity * prices[symbol] for symbol, quantity in holdings.items())
+    return {"holdings": holdings, "costs": costs, "realized": realized, "profit_loss": value - spent - balance,
+            "value": value}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_running_totals_match_a_full_recomputation(seed):
+    rng = random.Random(seed)
+    prices = {symbol: rng.uniform(10, 200) for symbol in SYMBOLS}
+    market.set_price_source(lambda symbols: {symbol: prices[symbol] for symbol in symbols})
+    name = f"pnl{seed}"
+    account = Account.get(name)
+    account.reset("random trades")
+    account.deposit(1_000_000)
+    for _ in range(60):
+        for symbol in SYMBOLS:
+            prices[symbol] *= math.exp(rng.gauss(0, 0.05))
+        account = Account.get(name)
+        symbol = rng.choice(SYMBOLS)
+        held = account.holdings.get(symbol, 0)
+        if held and rng.random() < 0.4:
+            account.sell_shares(symbol, rng.randint(1, held), "test")
+        else:
+            account.buy_shares(symbol, rng.randint(1, 50), "test")
+
+        account = Account.get(name)
+        # deposits aren't trades, so take them out of the recomputation's starting balance
+        expected = recompute(read_transactions(name), prices)
+        expected_value = expected["value"] + 1_000_000
+        assert account.holdings == expected["holdings"]
+        assert account.calculate_portfolio_value() == pytest.approx(expected_value, abs=1e-6)
+        assert account.calculate_profit_loss() == pytest.approx(expected["profit_loss"], abs=1e-6)
+        assert account.realized_profit_loss == pytest.approx(expected["realized"], abs=1e-6)
+        for symbol, cost in expected["costs"].items():
+            assert account._costs[symbol] == pytest.approx(cost, rel=1e-9, abs=1e-6)
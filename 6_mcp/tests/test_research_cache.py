@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from research_cache import ResearchCache, anchors
+
+
+def researcher(answers: list[str]):
+    async def run(query: str) -> str:
+        await asyncio.sleep(0.01)
+        answers.append(query)
+        return f"research on {query}"
+    return run
+
+
+def test_anchors_pick_out_tickers_names_and_actions():
+    assert anchors("Should I buy NVDA after the Q3 earnings?") == {"should", "buy", "nvda", "q3"}
+    assert anchors("latest news on $tsla") == {"tsla"}
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Latest news on NVDA earnings", "Latest news on AMD earnings"),
+    ("Reasons to buy Tesla stock today", "Reasons to sell Tesla stock today"),
+])
+def test_near_matches_need_the_same_tickers_and_actions(first, second):
+    async def main():
+        cache = ResearchCache(threshold=0.5)
+        asked = []
+        run = researcher(asked)
+        await cache.get(first, lambda: run(first))
+        result, outcome = await cache.get(second, lambda: run(second))
+        return result, outcome, asked
+    result, outcome, asked = asyncio.run(main())
+    assert outcome == "miss"
+    assert asked == [first, second]
+
+
+def test_near_match_with_same_anchors_is_shared():
+    async def main():
+        cache = ResearchCache(threshold=0.5)
+        asked = []
+        run = researcher(asked)
+        await cache.get("Latest NVDA earnings news", lambda: run("one"))
+        return await cache.get("NVDA earnings news and guidance", lambda: run("two"))
+    assert asyncio.run(main()) == ("research on one", "near")
+
+
+def test_near_matching_is_off_by_default():
+    async def main():
+        cache = ResearchCache()
+        await cache.get("Latest NVDA earnings news", lambda: asyncio.sleep(0, "a"))
+        return await cache.get("NVDA earnings news and guidance", lambda: asyncio.sleep(0, "b"))
+    assert asyncio.run(main()) == ("b", "miss")
+
+
+def test_joiners_research_again_when_the_leader_is_cancelled():
+    async def main():
+        cache = ResearchCache()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+            return "never"
+
+        leader = asyncio.create_task(cache.get("NVDA news", slow))
+        await started.wait()
+        joiner = asyncio.create_task(cache.get("news NVDA", lambda: asyncio.sleep(0, "fresh")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await joiner
+    assert asyncio.run(main()) == ("fresh", "miss")
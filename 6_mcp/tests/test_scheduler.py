@@ -0,0 +1,25 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from scheduler import Scheduler
+
+
+@dataclass
+class FakeTrader:
+    name: str
+    model_name: str = "openai"
+
+
+def test_failed_runs_are_counted_without_raising():
+    async def run(trader):
+        await asyncio.sleep(0.01)
+        return None if trader.name == "broken" else 1_000
+
+    async def main():
+        traders = [FakeTrader("ok"), FakeTrader("broken"), FakeTrader("also ok")]
+        floor = Scheduler(traders, run, lambda model_name: model_name, stagger_seconds=0, jitter_seconds=0)
+        metrics = await floor.run_cycle(time.monotonic() + 5)
+        await floor.close()
+        return metrics
+    metrics = asyncio.run(main())
+    assert (metrics["started"], metrics["completed"], metrics["failed"]) == (3, 2, 1)
@@ -1,7 +1,10 @@
 from agents import TracingProcessor, Trace, Span
-from database import write_log
+from log_sink import LogSink
 import secrets
 import string
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
 
 ALPHANUM = string.ascii_lowercase + string.digits 
 
@@ -9,31 +12,102 @@ def make_trace_id(tag: str) -> str:
     """
     Return a string of the form 'trace_<tag><random>',
     where the total length after 'trace_' is 32 chars.
+    The tag only makes traces easier to spot; LogTracer finds the run from the registry below.
     """
-    tag += "0"
     pad_len = 32 - len(tag)
     random_suffix = ''.join(secrets.choice(ALPHANUM) for _ in range(pad_len))
     return f"trace_{tag}{random_suffix}"
 
+@dataclass
+class RunContext:
+    """A trader's run, as attached to every log entry and span of its trace"""
+
+    name: str
+    model: str | None = None
+    cycle: int | None = None
+    do_trade: bool | None = None
+    started: float = field(default_factory=time.time)
+
+    def record(self, trace_id: str, ended: float | None = None) -> tuple:
+        """A row for database.write_runs"""
+        return (trace_id, self.name, self.model, self.cycle, self.do_trade, self.started, ended)
+
+
+# trace_id -> the run it traces, from just before the trace starts until just after it ends
+_runs: dict[str, RunContext] = {}
+
+
+def register_run(trace_id: str, context: RunContext) -> None:
+    _runs[trace_id] = context
+
+
+def unregister_run(trace_id: str) -> None:
+    _runs.pop(trace_id, None)
+
+
+def run_context(trace_id: str) -> RunContext | None:
+    return _runs.get(trace_id)
+
+
+def epoch(timestamp: str | None) -> float | None:
+    return datetime.fromisoformat(timestamp).timestamp() if timestamp else None
+
+
+def span_record(name: str, span: Span) -> tuple:
+    """A finished span as a row of database.SPAN_COLUMNS, with the tool, MCP server, model and token usage it has"""
+    data = span.span_data
+    server = getattr(data, "server", None)
+    model = getattr(data, "model", None)
+    usage = getattr(data, "usage", None) or {}
+    input_tokens, output_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+    if getattr(data, "mcp_data", None):
+        server = data.mcp_data.get("server")
+    if getattr(data, "response", None):
+        model = data.response.model
+        if data.response.usage:
+            input_tokens, output_tokens = data.response.usage.input_tokens, data.response.usage.output_tokens
+    started, ended = epoch(span.started_at), epoch(span.ended_at)
+    return (
+        span.span_id,
+        span.trace_id,
+        span.parent_id,
+        name,
+        data.type if data else "span",
+        getattr(data, "name", None),
+        server,
+        model,
+        started,
+        ended,
+        ended - started if started and ended else None,
+        input_tokens,
+        output_tokens,
+        span.error["message"] if span.error else None,
+    )
+
+
 class LogTracer(TracingProcessor):
 
+    def __init__(self, sink: LogSink | None = None):
+        self.sink = sink or LogSink()
+
+    def stats(self) -> dict[str, int]:
+        return self.sink.stats()
+
     def get_name(self, trace_or_span: Trace | Span) -> str | None:
-        trace_id = trace_or_span.trace_id
-        name = trace_id.split("_")[1]
-        if '0' in name:
-            return name.split("0")[0]
-        else:
-            return None
+        context = _runs.get(trace_or_span.trace_id)
+        return context.name if context else None
 
     def on_trace_start(self, trace) -> None:
-        name = self.get_name(trace)
-        if name:
-            write_log(name, "trace", f"Started: {trace.name}")
+        context = _runs.get(trace.trace_id)
+        if context:
+            self.sink.write_run(context.record(trace.trace_id))
+            self.sink.write(context.name, "trace", f"Started: {trace.name}", trace.trace_id)
 
     def on_trace_end(self, trace) -> None:
-        name = self.get_name(trace)
-        if name:
-            write_log(name, "trace", f"Ended: {trace.name}")
+        context = _runs.get(trace.trace_id)
+        if context:
+            self.sink.write(context.name, "trace", f"Ended: {trace.name}", trace.trace_id)
+            self.sink.write_run(context.record(trace.trace_id, time.time()))
 
     def on_span_start(self, span) -> None:
         name = self.get_name(span)
@@ -49,7 +123,7 @@ class LogTracer(TracingProcessor):
                     message += f" {span.span_data.server}"
             if span.error:
                 message += f" {span.error}"
-            write_log(name, type, message)
+            self.sink.write(name, type, message, span.trace_id)
 
     def on_span_end(self, span) -> None:
         name = self.get_name(span)
@@ -66,10 +140,11 @@ class LogTracer(TracingProcessor):
                     message += f" {span.span_data.server}"
             if span.error:
                 message += f" {span.error}"
-            write_log(name, type, message)
+            self.sink.write(name, type, message, span.trace_id)
+            self.sink.write_span(span_record(name, span))
 
     def force_flush(self) -> None:
-        pass
+        self.sink.flush()
 
     def shutdown(self) -> None:
-        pass
\ No newline at end of file
+        self.sink.shutdown()
@@ -1,12 +1,9 @@
 from contextlib import AsyncExitStack
-from accounts_client import read_accounts_resource, read_strategy_resource
-from tracers import make_trace_id
-from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
-from openai import AsyncOpenAI
+from accounts_client import read_account_and_strategy
+from tracers import make_trace_id, RunContext, register_run, unregister_run
+from agents import Agent, Tool, Runner, RunContextWrapper, ItemHelpers, function_tool, trace
 from dotenv import load_dotenv
-import os
-import json
-from agents.mcp import MCPServerStdio
+from mcp_transport import mcp_server, NamespacedServer
 from templates import (
     researcher_instructions,
     trader_instructions,
@@ -15,38 +12,17 @@ from templates import (
     research_tool,
 )
 from mcp_params import trader_mcp_server_params, researcher_mcp_server_params
+from mcp_pool import MCPServerPool
+from model_clients import get_model_clients
+from research_cache import cached_research
 
 load_dotenv(override=True)
 
-deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-google_api_key = os.getenv("GOOGLE_API_KEY")
-grok_api_key = os.getenv("GROK_API_KEY")
-openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-
-DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
-GROK_BASE_URL = "https://api.x.ai/v1"
-GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
-
 MAX_TURNS = 30
 
-openrouter_client = AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=openrouter_api_key)
-deepseek_client = AsyncOpenAI(base_url=DEEPSEEK_BASE_URL, api_key=deepseek_api_key)
-grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key)
-gemini_client = AsyncOpenAI(base_url=GEMINI_BASE_URL, api_key=google_api_key)
-
 
 def get_model(model_name: str):
-    if "/" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=openrouter_client)
-    elif "deepseek" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=deepseek_client)
-    elif "grok" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=grok_client)
-    elif "gemini" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=gemini_client)
-    else:
-        return model_name
+    return get_model_clients().model(model_name)
 
 
 async def get_researcher(mcp_servers, model_name) -> Agent:
@@ -60,8 +36,18 @@ async def get_researcher(mcp_servers, model_name) -> Agent:
 
 
 async def get_researcher_tool(mcp_servers, model_name) -> Tool:
+    """The researcher as a tool, answering through the research cache so traders share research in a cycle"""
     researcher = await get_researcher(mcp_servers, model_name)
-    return researcher.as_tool(tool_name="Researcher", tool_description=research_tool())
+
+    @function_tool(name_override="Researcher", description_override=research_tool())
+    async def run_researcher(context: RunContextWrapper, input: str) -> str:
+        async def run() -> str:
+            output = await Runner.run(starting_agent=researcher, input=input, context=context.context)
+            return ItemHelpers.text_message_outputs(output.new_items)
+
+        return await cached_research(input, run)
+
+    return run_researcher
 
 
 class Trader:
@@ -83,49 +69,62 @@ class Trader:
         )
         return self.agent
 
-    async def get_account_report(self) -> str:
-        account = await read_accounts_resource(self.name)
-        account_json = json.loads(account)
-        account_json.pop("portfolio_value_time_series", None)
-        return json.dumps(account_json)
+    async def get_account_report_and_strategy(self) -> tuple[str, str]:
+        return await read_account_and_strategy(self.name)
 
     async def run_agent(self, trader_mcp_servers, researcher_mcp_servers):
+        # The researcher's servers are shared by every trader; its memory is kept in the trader's own namespace
+        researcher_mcp_servers = [NamespacedServer(server, self.name) for server in researcher_mcp_servers]
         self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
-        account = await self.get_account_report()
-        strategy = await read_strategy_resource(self.name)
+        account, strategy = await self.get_account_report_and_strategy()
         message = (
             trade_message(self.name, strategy, account)
             if self.do_trade
             else rebalance_message(self.name, strategy, account)
         )
-        await Runner.run(self.agent, message, max_turns=MAX_TURNS)
+        result = await Runner.run(self.agent, message, max_turns=MAX_TURNS)
+        return result.context_wrapper.usage.total_tokens
 
     async def run_with_mcp_servers(self):
         async with AsyncExitStack() as stack:
             trader_mcp_servers = [
                 await stack.enter_async_context(
-                    MCPServerStdio(params, client_session_timeout_seconds=120)
+                    mcp_server(params, client_session_timeout_seconds=120)
                 )
                 for params in trader_mcp_server_params
             ]
             async with AsyncExitStack() as stack:
                 researcher_mcp_servers = [
                     await stack.enter_async_context(
-                        MCPServerStdio(params, client_session_timeout_seconds=120)
+                        mcp_server(params, client_session_timeout_seconds=120)
                     )
                     for params in researcher_mcp_server_params(self.name)
                 ]
-                await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
+                return await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
+
+    async def run_with_pool(self, pool: MCPServerPool):
+        async with pool.lease(self.name) as (trader_mcp_servers, researcher_mcp_servers):
+            return await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
 
-    async def run_with_trace(self):
+    async def run_with_trace(self, pool: MCPServerPool | None = None, cycle: int | None = None):
         trace_name = f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
         trace_id = make_trace_id(f"{self.name.lower()}")
-        with trace(trace_name, trace_id=trace_id):
-            await self.run_with_mcp_servers()
-
-    async def run(self):
+        register_run(trace_id, RunContext(self.name, self.model_name, cycle, self.do_trade))
+        try:
+            with trace(trace_name, trace_id=trace_id):
+                if pool:
+                    return await self.run_with_pool(pool)
+                else:
+                    return await self.run_with_mcp_servers()
+        finally:
+            unregister_run(trace_id)
+
+    async def run(self, pool: MCPServerPool | None = None, cycle: int | None = None) -> int | None:
+        """Run the trader once, and return the number of tokens the trader's agent used, or None if the run failed"""
+        tokens = None
         try:
-            await self.run_with_trace()
+            tokens = await self.run_with_trace(pool, cycle)
         except Exception as e:
             print(f"Error running trader {self.name}: {e}")
         self.do_trade = not self.do_trade
+        return tokens
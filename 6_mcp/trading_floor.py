@@ -1,9 +1,17 @@
 from traders import Trader
+from model_clients import get_model_clients, provider_for
+from scheduler import Scheduler
+from research_cache import get_research_cache
 from typing import List
 import asyncio
+import time
 from tracers import LogTracer
+from mcp_pool import MCPServerPool
+from accounts_client import get_accounts_client
 from agents import add_trace_processor
-from market import is_market_open
+from market import is_market_open_async, close_async_client, price_cache
+from database import prune_logs
+from accounts import record_portfolio_values
 from dotenv import load_dotenv
 import os
 
@@ -14,6 +22,7 @@ RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
     os.getenv("RUN_EVEN_WHEN_MARKET_IS_CLOSED", "false").strip().lower() == "true"
 )
 USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "0"))
 
 names = ["Warren", "George", "Ray", "Cathie"]
 lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
@@ -39,15 +48,38 @@ def create_traders() -> List[Trader]:
 
 
 async def run_every_n_minutes():
-    add_trace_processor(LogTracer())
+    tracer = LogTracer()
+    add_trace_processor(tracer)
     traders = create_traders()
-    while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+    pool = MCPServerPool()
+    await pool.start(names)
+    print(f"Started {pool.starts} MCP servers in {pool.startup_seconds:.1f}s")
+    scheduler = Scheduler(traders, lambda trader: trader.run(pool, scheduler.cycles), provider_for)
+    try:
+        while True:
+            deadline = time.monotonic() + RUN_EVERY_N_MINUTES * 60
+            if RUN_EVEN_WHEN_MARKET_IS_CLOSED or await is_market_open_async():
+                await pool.health_check()
+                metrics = await scheduler.run_cycle(deadline)
+                await asyncio.to_thread(record_portfolio_values, names)
+                print(f"Scheduler: {metrics}")
+                print(f"Log sink: {tracer.stats()}")
+                print(f"Model clients: {get_model_clients().stats()}")
+                print(f"Research cache: {get_research_cache().stats()}")
+                print(f"Price cache: {price_cache.stats()}")
+                print(f"MCP pool: {pool.startup_saved_per_cycle(names):.1f}s of server startup saved this cycle")
+                if LOG_RETENTION_DAYS > 0:
+                    prune_logs(LOG_RETENTION_DAYS)
+            else:
+                print("Market is closed, skipping run")
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
 
+    finally:
+        await scheduler.close()
+        await pool.close()
+        await get_model_clients().close()
+        await get_accounts_client().close()
+        await close_async_client()
 
 if __name__ == "__main__":
     print(f"Starting scheduler to run every {RUN_EVERY_N_MINUTES} minutes")
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from database import ROLLUP_RESOLUTIONS, read_value_level
+
+load_dotenv(override=True)
+
+MAX_CHART_POINTS = int(os.getenv("MAX_CHART_POINTS", "500"))
+
+
+class ValueSeries:
+    """
+    A portfolio value series in columns: numeric timestamps (seconds since the epoch) in one array,
+    and float32 values with the min and max of each point's interval in others.
+    Points are only ever appended; the arrays grow by doubling.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self.size = 0
+        self._times = np.empty(capacity, dtype=np.float64)
+        self._values = np.empty(capacity, dtype=np.float32)
+        self._lows = np.empty(capacity, dtype=np.float32)
+        self._highs = np.empty(capacity, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _reserve(self, extra: int) -> None:
+        capacity = len(self._times)
+        if self.size + extra <= capacity:
+            return
+        while capacity < self.size + extra:
+            capacity *= 2
+        for column in ("_times", "_values", "_lows", "_highs"):
+            grown = np.empty(capacity, dtype=getattr(self, column).dtype)
+            grown[: self.size] = getattr(self, column)[: self.size]
+            setattr(self, column, grown)
+
+    def extend(self, rows: list[tuple[float, float, float, float]]) -> None:
+        """Append (time, min, max, last) points, which must be in time order"""
+        if not rows:
+            return
+        self._reserve(len(rows))
+        times, lows, highs, values = np.asarray(rows, dtype=np.float64).T
+        end = self.size + len(rows)
+        self._times[self.size : end] = times
+        self._lows[self.size : end] = lows
+        self._highs[self.size : end] = highs
+        self._values[self.size : end] = values
+        self.size = end
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[: self.size]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[: self.size]
+
+    @property
+    def lows(self) -> np.ndarray:
+        return self._lows[: self.size]
+
+    @property
+    def highs(self) -> np.ndarray:
+        return self._highs[: self.size]
+
+    def as_pairs(self) -> list[tuple[str, float]]:
+        """
+        The points as (datetime string, value), the way the account stores them.
+        Values are widened from float32 and rounded to cents, so reports don't carry float32 noise.
+        """
+        return [
+            (datetime.fromtimestamp(time, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"), round(float(value), 2))
+            for time, value in zip(self.times, self.values)
+        ]
+
+
+def read_value_series(name: str, max_points: int = MAX_CHART_POINTS) -> ValueSeries:
+    """
+    An account's value history in at most max_points points: the raw values if there are few enough,
+    otherwise the finest rollup that covers the whole history, or the latest buckets of the coarsest
+    """
+    for resolution in (0, *ROLLUP_RESOLUTIONS):
+        rows = read_value_level(name, resolution, max_points + 1)
+        if len(rows) <= max_points:
+            break
+    rows = rows[-max_points:]
+    series = ValueSeries(max(len(rows), 1))
+    series.extend(rows)
+    return series